@@ -0,0 +1,57 @@
+# coding=utf-8
+# Author: SafetyCulture
+# Copyright: © SafetyCulture 2016
+
+"""
+Measures how long CsvExporter takes to flatten a single audit into rows, for audits of increasing size. "cold" is
+the first audit of a template, "warm" a later audit of the same template, once its template metadata is cached.
+
+Usage: python benchmarks/flatten_benchmark.py [--items 500 1000 2000 4000] [--repeat 5]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import csvExporter
+from synthetic_audit import synthetic_audit
+
+
+def measure(audit, repeat, cold):
+    """
+    :return:  best time in seconds to flatten the audit, and the number of rows produced
+    """
+    timings = []
+    rows = 0
+    for _ in range(repeat):
+        if cold:
+            csvExporter.TEMPLATE_CACHE.clear()
+        start = time.perf_counter()
+        rows = len(csvExporter.CsvExporter(audit).audit_table)
+        timings.append(time.perf_counter() - start)
+    return min(timings), rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--items', type=int, nargs='+', default=[500, 1000, 2000, 4000],
+                        help='number of items in each synthetic audit')
+    parser.add_argument('--repeat', type=int, default=5, help='number of timed runs per audit')
+    args = parser.parse_args()
+
+    print('{0:>8}{1:>8}{2:>14}{3:>12}{4:>14}{5:>12}'.format('items', 'rows', 'cold ms/audit', 'us/row',
+                                                         'warm ms/audit', 'us/row'))
+    for item_count in args.items:
+        audit = synthetic_audit(item_count, seed=item_count)
+        cold, rows = measure(audit, args.repeat, cold=True)
+        warm, rows = measure(audit, args.repeat, cold=False)
+        print('{0:>8}{1:>8}{2:>14.2f}{3:>12.2f}{4:>14.2f}{5:>12.2f}'.format(
+            item_count, rows, cold * 1000, cold * 1e6 / rows, warm * 1000, warm * 1e6 / rows))
+
+
+if __name__ == '__main__':
+    main()
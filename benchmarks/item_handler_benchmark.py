@@ -0,0 +1,53 @@
+# coding=utf-8
+# Author: SafetyCulture
+# Copyright: © SafetyCulture 2016
+
+"""
+Measures the cost of extracting the columns of a single item with CsvExporter.item_properties_as_list, per item type.
+
+Usage: python benchmarks/item_handler_benchmark.py [--items 5000] [--repeat 20]
+"""
+
+import argparse
+import collections
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import csvExporter
+from synthetic_audit import synthetic_audit
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--items', type=int, default=5000, help='number of items in the synthetic audit')
+    parser.add_argument('--repeat', type=int, default=20, help='number of timed passes over the items')
+    args = parser.parse_args()
+
+    audit = synthetic_audit(args.items)
+    csv_exporter = csvExporter.CsvExporter(audit)
+    items_by_type = collections.defaultdict(list)
+    for item in csv_exporter.audit_items():
+        items_by_type[item.get('type')].append(item)
+
+    print('{0:<14}{1:>8}{2:>12}'.format('item type', 'items', 'us/item'))
+    total_seconds = 0
+    total_items = 0
+    for item_type, items in sorted(items_by_type.items()):
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            for item in items:
+                csv_exporter.item_properties_as_list(item)
+            timings.append(time.perf_counter() - start)
+        total_seconds += min(timings)
+        total_items += len(items)
+        print('{0:<14}{1:>8}{2:>12.2f}'.format(item_type, len(items), min(timings) * 1e6 / len(items)))
+    print('{0:<14}{1:>8}{2:>12.2f}'.format('all', total_items, total_seconds * 1e6 / total_items))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+# coding=utf-8
+# Author: SafetyCulture
+# Copyright: © SafetyCulture 2016
+
+"""
+Compares the per-audit decode time and peak memory of the JSON decoders available to SafetyCulture.parse_json.
+
+Usage: python benchmarks/parse_json_benchmark.py [--items 5000] [--repeat 20]
+"""
+
+import argparse
+import collections
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'safetyculture-sdk-python'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from safetypy import safetypy as sp
+from synthetic_audit import synthetic_audit_bytes
+
+
+def ordered_dict_decoder(json_to_parse):
+    """
+    The decoder parse_json used before json_decoder was pluggable
+    """
+    return json.JSONDecoder(object_pairs_hook=collections.OrderedDict).decode(json_to_parse.decode('utf-8'))
+
+
+def decoders():
+    candidates = [('OrderedDict (previous)', ordered_dict_decoder), ('json.loads', json.loads)]
+    if sp.orjson is not None:
+        candidates.append(('orjson.loads', sp.orjson.loads))
+    return candidates
+
+
+def measure(decoder, payload, repeat):
+    """
+    :return:  best decode time in seconds and peak traced memory in bytes for a single decode
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        decoder(payload)
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    decoder(payload)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return min(timings), peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--items', type=int, default=5000, help='number of items in the synthetic audit')
+    parser.add_argument('--repeat', type=int, default=20, help='number of timed decodes per decoder')
+    args = parser.parse_args()
+
+    payload = synthetic_audit_bytes(args.items)
+    print('Audit with {0} items, {1:.1f} MB'.format(args.items, len(payload) / 1e6))
+    print('{0:<24}{1:>12}{2:>16}'.format('decoder', 'ms/audit', 'peak MB'))
+    for name, decoder in decoders():
+        seconds, peak = measure(decoder, payload, args.repeat)
+        print('{0:<24}{1:>12.2f}{2:>16.1f}'.format(name, seconds * 1000, peak / 1e6))
+    print('parse_json uses: ' + sp.DEFAULT_JSON_DECODER.__module__ + '.' + sp.DEFAULT_JSON_DECODER.__name__)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+# coding=utf-8
+# Author: SafetyCulture
+# Copyright: © SafetyCulture 2016
+
+"""
+Measures how many audit rows per second each way of loading them into the audit table achieves: the ORM
+bulk_insert_mappings over dictionaries, the bulk loader of the database over row tuples, and the staging table upsert
+of rows that already exist.
+
+Runs against a temporary SQLite database unless --database_url points at another one, in which case its registered
+bulk loader (fast_executemany for mssql+pyodbc, COPY for postgresql+psycopg2) is measured. The table named by --table
+is dropped and recreated.
+
+Usage: python benchmarks/sql_loader_benchmark.py [--items 5000] [--audits 4] [--repeat 3] [--database_url URL]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'safetyculture-sdk-python'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import csvExporter
+import database
+import exporter
+from model import Base, set_table
+from synthetic_audit import synthetic_audit
+
+
+def audit_rows(items, audits):
+    """
+    :param items:   number of items in each synthetic audit
+    :param audits:  number of synthetic audits
+    :return:        rows of the audits as produced by exporter.iter_sql_rows
+    """
+    rows = []
+    for seed in range(audits):
+        csv_exporter = csvExporter.CsvExporter(synthetic_audit(items, seed=seed), eager=False)
+        for chunk in exporter.iter_sql_rows(csv_exporter):
+            rows.extend(chunk)
+    return rows
+
+
+def load_orm(session, audit_table, rows):
+    session.bulk_insert_mappings(audit_table, [dict(zip(exporter.SQL_COLUMNS, row)) for row in rows])
+
+
+def load_bulk(session, audit_table, rows):
+    database.bulk_load(session.connection(), audit_table.__table__, exporter.SQL_COLUMNS, rows)
+
+
+def upsert(session, audit_table, rows):
+    database.upsert(session.connection(), audit_table.__table__, exporter.SQL_COLUMNS, rows)
+
+
+def time_load(engine, audit_table, rows, load, repeat, preload):
+    """
+    :param engine:      engine of the database
+    :param audit_table: mapped class of the audit table
+    :param rows:        rows to load
+    :param load:        function loading rows through a session
+    :param repeat:      number of timed loads
+    :param preload:     if True, insert the rows before each timed load, so every row is a duplicate
+    :return:            fastest load, in seconds, including the commit
+    """
+    timings = []
+    for _ in range(repeat):
+        audit_table.__table__.drop(engine, checkfirst=True)
+        audit_table.__table__.create(engine)
+        session = sessionmaker(bind=engine)()
+        if preload:
+            load_bulk(session, audit_table, rows)
+            session.commit()
+        start = time.perf_counter()
+        load(session, audit_table, rows)
+        session.commit()
+        timings.append(time.perf_counter() - start)
+        session.close()
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--items', type=int, default=5000, help='number of items in each synthetic audit')
+    parser.add_argument('--audits', type=int, default=4, help='number of synthetic audits loaded at once')
+    parser.add_argument('--repeat', type=int, default=3, help='number of timed loads per loader')
+    parser.add_argument('--database_url', help='SQLAlchemy URL of the database, defaults to a temporary SQLite file')
+    parser.add_argument('--table', default='sql_loader_benchmark', help='name of the table to load into')
+    args = parser.parse_args()
+
+    database_url = args.database_url
+    if database_url is None:
+        database_file = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+        database_file.close()
+        database_url = 'sqlite:///' + database_file.name
+    engine = create_engine(database_url)
+    Base.metadata.clear()
+    audit_table = set_table(args.table, False)
+    rows = audit_rows(args.items, args.audits)
+    loader = database.get_bulk_loader(engine.dialect)
+
+    print('{0} rows into {1}+{2}'.format(len(rows), engine.dialect.name, engine.dialect.driver))
+    print('{0:<36}{1:>12}'.format('loader', 'rows/sec'))
+    for name, load, preload in [('bulk_insert_mappings', load_orm, False),
+                                (type(loader).__name__, load_bulk, False),
+                                ('upsert over existing rows', upsert, True)]:
+        seconds = time_load(engine, audit_table, rows, load, args.repeat, preload)
+        print('{0:<36}{1:>12.0f}'.format(name, len(rows) / seconds))
+    audit_table.__table__.drop(engine)
+    if args.database_url is None:
+        os.remove(database_file.name)
+
+
+if __name__ == '__main__':
+    main()
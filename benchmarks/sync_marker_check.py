@@ -0,0 +1,133 @@
+# coding=utf-8
+# Author: SafetyCulture
+# Copyright: © SafetyCulture 2016
+
+"""
+Checks that an audit which keeps failing does not make later syncs append the audits after it to the CSV export again.
+
+Runs several syncs of synthetic audits in csv format against a fake API client, in a temporary directory, with one
+audit that can never be downloaded. The sync marker is held back before that audit until it has failed
+max_audit_attempts times. After every sync the CSV export must hold the rows of each other audit exactly once.
+
+Exits with status 1 if any sync leaves duplicate or missing rows.
+
+Usage: python benchmarks/sync_marker_check.py [--items 50] [--audits 5] [--syncs 4] [--workers 1]
+"""
+
+import argparse
+import collections
+import copy
+import glob
+import logging
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'safetyculture-sdk-python'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import unicodecsv as csv
+
+import csvExporter
+import exporter
+from synthetic_audit import synthetic_audit
+
+FAILING_AUDIT = 1
+
+
+class FakeClient:
+    """
+    Serves synthetic audits the way SafetyCulture does, except for the audit at FAILING_AUDIT, which never downloads
+    """
+
+    def __init__(self, items, audits):
+        self.audits = []
+        for seed in range(audits):
+            audit = synthetic_audit(items, seed=seed)
+            audit['modified_at'] = '2019-01-{0:02d}T00:00:00.000Z'.format(seed + 1)
+            self.audits.append(audit)
+
+    def iter_audits(self, modified_after=None, modified_before=None, **kwargs):
+        audits = [{'audit_id': audit['audit_id'], 'modified_at': audit['modified_at']} for audit in self.audits
+                  if modified_after < audit['modified_at'] < modified_before]
+        if audits:
+            yield {'total': len(audits), 'audits': audits}
+
+    def get_audit(self, audit_id):
+        for seed, audit in enumerate(self.audits):
+            if audit['audit_id'] == audit_id:
+                return None if seed == FAILING_AUDIT else copy.deepcopy(audit)
+
+
+def check_csv(export_path, client):
+    """
+    :param export_path: directory holding the CSV export of each template
+    :param client:      FakeClient the audits were exported from
+    :return:            True if every audit that can be downloaded has each of its rows exactly once
+    """
+    rows = []
+    for csv_path in glob.glob(os.path.join(export_path, '*.csv')):
+        with open(csv_path, 'rb') as csv_file:
+            rows.extend(list(csv.reader(csv_file))[1:])
+    duplicates = sum(count - 1 for count in collections.Counter(tuple(row) for row in rows).values())
+    audits_found = set(row[csvExporter.CSV_HEADER_ROW.index('AuditID')] for row in rows)
+    expected = [audit['audit_id'] for seed, audit in enumerate(client.audits) if seed != FAILING_AUDIT]
+    missing = [audit_id for audit_id in expected if audit_id not in audits_found]
+    if duplicates or missing:
+        print('  {0} duplicate rows, {1} audits missing'.format(duplicates, len(missing)))
+        return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--items', type=int, default=50, help='number of items in each synthetic audit')
+    parser.add_argument('--audits', type=int, default=5, help='number of synthetic audits')
+    parser.add_argument('--syncs', type=int, default=4, help='number of syncs to run')
+    parser.add_argument('--workers', type=int, default=1, help='number of audits exported at the same time')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.CRITICAL)
+
+    client = FakeClient(args.items, args.audits)
+    settings = {
+        exporter.EXPORT_FORMATS: ['csv'],
+        exporter.EXPORT_PATH: 'exports',
+        exporter.EXPORT_ARCHIVED: False,
+        exporter.EXPORT_COMPLETED: True,
+        exporter.EXPORT_INACTIVE_ITEMS_TO_CSV: True,
+        exporter.USE_REAL_TEMPLATE_NAME: False,
+        exporter.CONFIG_NAME: 'sync_marker_check',
+        exporter.TEMPLATE_IDS: None,
+        exporter.PREFERENCES: None,
+        exporter.FILENAME_ITEM_ID: None,
+        exporter.MEDIA_SYNC_OFFSET_IN_SECONDS: 0,
+        exporter.STREAM_AUDITS_LARGER_THAN_MB: None,
+        exporter.REPORT_JOBS_IN_FLIGHT: exporter.sp.DEFAULT_MAX_REPORTS_IN_FLIGHT,
+        exporter.MAX_AUDIT_ATTEMPTS: exporter.DEFAULT_MAX_AUDIT_ATTEMPTS,
+        exporter.WORKERS: args.workers
+    }
+    logger = logging.getLogger('sync_marker_check')
+
+    working_dir = os.getcwd()
+    check_dir = tempfile.mkdtemp()
+    failed = 0
+    try:
+        os.chdir(check_dir)
+        os.makedirs('exports')
+        for sync in range(1, args.syncs + 1):
+            exporter.sync_exports(logger, settings, client)
+            with open(exporter.SYNC_MARKER_FILENAME, 'r') as sync_marker_file:
+                sync_marker = sync_marker_file.read()
+            matched = check_csv(settings[exporter.EXPORT_PATH], client)
+            print('sync {0:<4}sync marker {1:<28}{2}'.format(sync, sync_marker, 'ok' if matched else 'MISMATCH'))
+            failed += not matched
+    finally:
+        os.chdir(working_dir)
+        shutil.rmtree(check_dir, ignore_errors=True)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
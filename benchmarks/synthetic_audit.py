@@ -0,0 +1,137 @@
+# coding=utf-8
+# Author: SafetyCulture
+# Copyright: © SafetyCulture 2016
+
+"""
+Builds synthetic audits shaped like the audits API response, for benchmarking the exporter without an API token.
+"""
+
+import json
+import random
+import uuid
+
+YES_RESPONSE_ID = '8bcfbf00-e11b-11e1-9b23-0800200c9a66'
+NO_RESPONSE_ID = '8bcfbf01-e11b-11e1-9b23-0800200c9a66'
+DOCUMENT_NO_ID = 'f3245d46-ea77-11e1-aff1-0800200c9a66'
+CONDUCTED_ON_ID = 'f3245d42-ea77-11e1-aff1-0800200c9a66'
+PREPARED_BY_ID = 'f3245d43-ea77-11e1-aff1-0800200c9a66'
+LOCATION_ID = 'f3245d44-ea77-11e1-aff1-0800200c9a66'
+SMARTFIELD_IF_RESPONSE_IS = '3f206182-e4f6-11e1-aff1-0800200c9a66'
+
+ITEM_TYPES = ['question', 'question', 'question', 'text', 'textsingle', 'list', 'checkbox', 'switch', 'slider',
+              'datetime', 'signature', 'media', 'address', 'information', 'smartfield', 'temperature']
+
+
+def timestamp(rng):
+    return '2019-{0:02d}-{1:02d}T{2:02d}:{3:02d}:{4:02d}.{5:03d}Z'.format(
+        rng.randint(1, 12), rng.randint(1, 28), rng.randint(0, 23), rng.randint(0, 59), rng.randint(0, 59),
+        rng.randint(0, 999))
+
+
+def media(rng):
+    return {'media_id': str(uuid.UUID(int=rng.getrandbits(128))), 'file_ext': 'jpg',
+            'href': 'https://api.safetyculture.io/audits/media/' + str(rng.getrandbits(64))}
+
+
+def response_for(item_type, rng, response_set):
+    if item_type == 'question':
+        selected = rng.choice(response_set)
+        return {'selected': [selected], 'failed': selected['id'] == NO_RESPONSE_ID, 'text': 'Note ' * rng.randint(0, 5)}
+    if item_type in ('text', 'textsingle'):
+        return {'text': 'Free text answer ' * rng.randint(1, 10)}
+    if item_type == 'list':
+        return {'selected': rng.sample(response_set, 2)}
+    if item_type in ('checkbox', 'switch'):
+        return {'value': rng.choice(['0', '1'])}
+    if item_type == 'slider':
+        return {'value': str(rng.randint(0, 100))}
+    if item_type == 'datetime':
+        return {'datetime': timestamp(rng)}
+    if item_type == 'signature':
+        return {'name': 'Inspector', 'image': media(rng), 'timestamp': timestamp(rng)}
+    if item_type == 'address':
+        return {'location_text': '1 Example Street', 'location': {'geometry': {
+            'type': 'Point', 'coordinates': [rng.uniform(-180, 180), rng.uniform(-90, 90)]}}}
+    if item_type == 'temperature':
+        return {'temperature': str(rng.randint(-20, 40))}
+    return None
+
+
+def synthetic_audit(item_count=1000, seed=0, section_size=25):
+    """
+    :param item_count:     number of non-header items
+    :param seed:           random seed, so runs are repeatable
+    :param section_size:   number of items in each section
+    :return:               audit JSON as Python objects
+    """
+    rng = random.Random(seed)
+    response_set_id = 'responseset_' + str(seed)
+    response_set = [{'id': YES_RESPONSE_ID, 'label': 'Yes'}, {'id': NO_RESPONSE_ID, 'label': 'No'},
+                    {'id': str(uuid.UUID(int=rng.getrandbits(128))), 'label': 'Custom'}]
+    header_items = [
+        {'item_id': DOCUMENT_NO_ID, 'label': 'Document No.', 'type': 'textsingle',
+         'responses': {'text': '000' + str(seed)}},
+        {'item_id': CONDUCTED_ON_ID, 'label': 'Conducted on', 'type': 'datetime',
+         'responses': {'datetime': timestamp(rng)}},
+        {'item_id': PREPARED_BY_ID, 'label': 'Prepared by', 'type': 'text', 'responses': {'text': 'Inspector'}},
+        {'item_id': LOCATION_ID, 'label': 'Location', 'type': 'address',
+         'responses': response_for('address', rng, response_set)},
+    ]
+    items = []
+    section_id = None
+    smartfield_parent = None
+    for index in range(item_count):
+        if index % section_size == 0:
+            section_id = str(uuid.UUID(int=rng.getrandbits(128)))
+            items.append({'item_id': section_id, 'label': 'Section ' + str(index // section_size),
+                          'type': 'section', 'children': []})
+            continue
+        item_type = rng.choice(ITEM_TYPES)
+        parent_id = smartfield_parent or section_id
+        smartfield_parent = None
+        item = {'item_id': str(uuid.UUID(int=rng.getrandbits(128))), 'label': 'Item ' + str(index),
+                'type': item_type, 'parent_id': parent_id,
+                'options': {'is_mandatory': rng.random() < 0.2}}
+        response = response_for(item_type, rng, response_set)
+        if response is not None:
+            item['responses'] = response
+        if item_type == 'question':
+            item['scoring'] = {'score': rng.randint(0, 1), 'max_score': 1, 'score_percentage': 100}
+            item['options']['response_set'] = response_set_id
+        if item_type == 'information':
+            item['options'].update({'type': 'link', 'link': 'https://safetyculture.com'})
+        if item_type == 'smartfield':
+            item['options'].update({'condition': SMARTFIELD_IF_RESPONSE_IS, 'values': [YES_RESPONSE_ID]})
+            item['evaluation'] = rng.random() < 0.5
+            smartfield_parent = item['item_id']
+        if rng.random() < 0.1:
+            item['media'] = [media(rng) for _ in range(rng.randint(1, 3))]
+        items.append(item)
+    return {
+        'audit_id': 'audit_' + uuid.UUID(int=rng.getrandbits(128)).hex,
+        'template_id': 'template_' + uuid.UUID(int=seed).hex,
+        'created_at': timestamp(rng),
+        'modified_at': timestamp(rng),
+        'archived': False,
+        'audit_data': {
+            'name': 'Synthetic audit ' + str(seed),
+            'score': 50, 'total_score': 100, 'score_percentage': 50, 'duration': 3600,
+            'date_started': timestamp(rng), 'date_completed': timestamp(rng), 'date_modified': timestamp(rng),
+            'authorship': {'owner': 'Owner', 'owner_id': 'user_1', 'author': 'Author', 'author_id': 'user_2'},
+            'site': {'name': 'Site', 'area': {'name': 'Area'}, 'region': {'name': 'Region'}},
+        },
+        'template_data': {
+            'metadata': {'name': 'Synthetic template'},
+            'authorship': {'author': 'Author', 'author_id': 'user_2'},
+            'response_sets': {response_set_id: {'responses': response_set}},
+        },
+        'header_items': header_items,
+        'items': items,
+    }
+
+
+def synthetic_audit_bytes(item_count=1000, seed=0):
+    """
+    :return:  synthetic audit encoded the way the API returns it
+    """
+    return json.dumps(synthetic_audit(item_count, seed)).encode('utf-8')
@@ -0,0 +1,173 @@
+# coding=utf-8
+# Author: SafetyCulture
+# Copyright: © SafetyCulture 2016
+
+"""
+Checks that upserting rows through database.upsert leaves the audit table exactly as merging them one at a time with
+session.merge does, which is what the exporter did before upserts went through a staging table.
+
+Each case loads synthetic audits into two SQLite tables, then writes a second export to them: the audits again with
+changed responses, one audit modified later, a new audit, and rows repeated within the export. One table receives the
+second export through session.merge, the other through database.upsert, and their contents are compared. The cases
+cover the audit table with and without merge_rows, each with SQLite's ON CONFLICT statement and with the DELETE and
+INSERT statements used for databases without an upsert statement.
+
+Exits with status 1 if any case leaves the tables different.
+
+Usage: python benchmarks/upsert_check.py [--items 200] [--audits 3]
+"""
+
+import argparse
+import contextlib
+import os
+import sys
+import tempfile
+import warnings
+from datetime import timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'safetyculture-sdk-python'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import csvExporter
+import database
+import exporter
+from model import Base, set_table
+from synthetic_audit import synthetic_audit
+
+RESPONSE = exporter.SQL_COLUMNS.index('Response')
+DATE_MODIFIED = exporter.SQL_COLUMNS.index('DateModified')
+DATE_PK = exporter.SQL_COLUMNS.index('DatePK')
+
+
+def audit_rows(items, seed):
+    """
+    :param items:   number of items in the synthetic audit
+    :param seed:    seed of the synthetic audit
+    :return:        rows of the audit as produced by exporter.iter_sql_rows
+    """
+    csv_exporter = csvExporter.CsvExporter(synthetic_audit(items, seed=seed), eager=False)
+    return [row for rows in exporter.iter_sql_rows(csv_exporter) for row in rows]
+
+
+def second_export(items, audits):
+    """
+    :param items:   number of items in each synthetic audit
+    :param audits:  number of synthetic audits in the first export
+    :return:        rows of a later export of the same audits, overlapping the first export as a resync does
+    """
+    rows = []
+    for seed in range(audits):
+        for row in audit_rows(items, seed):
+            row = list(row)
+            row[RESPONSE] = 'updated ' + str(row[RESPONSE])
+            if seed == 0 and row[DATE_MODIFIED] is not None:
+                # modified after the first export, so its rows get a new DatePK
+                row[DATE_MODIFIED] += timedelta(days=1)
+                row[DATE_PK] = exporter.get_date_pk(row[DATE_MODIFIED])
+            rows.append(tuple(row))
+    rows.extend(audit_rows(items, audits))
+    # rows repeated later in the same export, where the last copy wins
+    rows.extend(row[:RESPONSE] + ('repeated',) + row[RESPONSE + 1:] for row in rows[::7])
+    return rows
+
+
+def merge(session, audit_table, rows):
+    for row in rows:
+        session.merge(audit_table(**dict(zip(exporter.SQL_COLUMNS, row))))
+
+
+def upsert(session, audit_table, rows):
+    database.upsert(session.connection(), audit_table.__table__, exporter.SQL_COLUMNS, rows)
+
+
+def table_contents(engine, audit_table):
+    """
+    :return:    every row of the table, ordered by its primary key
+    """
+    table = audit_table.__table__
+    query = table.select().order_by(*table.primary_key.columns)
+    return [tuple(row) for row in engine.execute(query)]
+
+
+@contextlib.contextmanager
+def generic_upsert():
+    """
+    Make database.upsert use the DELETE and INSERT statements of databases without an upsert statement
+    """
+    on_conflict_dialects = database.ON_CONFLICT_DIALECTS
+    database.ON_CONFLICT_DIALECTS = set()
+    try:
+        yield
+    finally:
+        database.ON_CONFLICT_DIALECTS = on_conflict_dialects
+
+
+def check(engine, merge_rows, first_rows, second_rows):
+    """
+    :param engine:      engine of the SQLite database
+    :param merge_rows:  merge_rows setting the audit table is created with
+    :param first_rows:  rows inserted into both tables
+    :param second_rows: rows written to one table through session.merge and to the other through database.upsert
+    :return:            True if both tables hold the same rows
+    """
+    contents = []
+    for name, load in [('merged', merge), ('upserted', upsert)]:
+        Base.metadata.clear()
+        audit_table = set_table('upsert_check_' + name, merge_rows)
+        audit_table.__table__.drop(engine, checkfirst=True)
+        audit_table.__table__.create(engine)
+        session = sessionmaker(bind=engine)()
+        database.bulk_load(session.connection(), audit_table.__table__, exporter.SQL_COLUMNS, first_rows)
+        session.commit()
+        load(session, audit_table, second_rows)
+        session.commit()
+        session.close()
+        contents.append(table_contents(engine, audit_table))
+        audit_table.__table__.drop(engine)
+    merged, upserted = contents
+    if merged == upserted:
+        return True
+    print('  {0} rows after session.merge, {1} after upsert'.format(len(merged), len(upserted)))
+    for expected, actual in zip(merged, upserted):
+        if expected != actual:
+            print('  first differing row\n  expected {0}\n  found    {1}'.format(expected, actual))
+            break
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--items', type=int, default=200, help='number of items in each synthetic audit')
+    parser.add_argument('--audits', type=int, default=3, help='number of synthetic audits in the first export')
+    args = parser.parse_args()
+    # every case maps a new class onto its tables
+    warnings.filterwarnings('ignore', 'This declarative base already contains a class')
+
+    database_file = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+    database_file.close()
+    engine = create_engine('sqlite:///' + database_file.name)
+    first_rows = [row for seed in range(args.audits) for row in audit_rows(args.items, seed)]
+    second_rows = second_export(args.items, args.audits)
+
+    failed = 0
+    try:
+        for merge_rows in (False, True):
+            for statements, statement_context in [('ON CONFLICT', contextlib.suppress),
+                                                  ('DELETE and INSERT', generic_upsert)]:
+                with statement_context():
+                    matched = check(engine, merge_rows, first_rows, second_rows)
+                print('{0:<24}{1:<20}{2}'.format('merge_rows: ' + str(merge_rows).lower(), statements,
+                                                 'ok' if matched else 'MISMATCH'))
+                failed += not matched
+    finally:
+        engine.dispose()
+        os.remove(database_file.name)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
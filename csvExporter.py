@@ -1,11 +1,26 @@
 import sqlalchemy
 import unicodecsv as csv
+import argparse
+import collections
+import functools
+import glob
+import itertools
 import json
+import logging
+import shutil
 import sys
 import os
-import copy
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
 CSV_HEADER_ROW = [
     'SortingIndex',
     'ItemType',
@@ -55,6 +70,31 @@ CSV_HEADER_ROW = [
     'Archived'
 ]
 
+# number of templates whose response sets and smartfield labels are kept by the shared TemplateCache
+DEFAULT_TEMPLATE_CACHE_SIZE = 256
+
+# number of leading CSV_HEADER_ROW columns taken from the item itself, see CsvExporter.item_properties_as_list
+ITEM_COLUMN_COUNT = 17
+
+# types of the columns produced by CsvExporter.convert_audit_to_columns. Other columns hold strings
+FLOAT_COLUMNS = {'ItemScore', 'ItemMaxScore', 'ItemScorePercentage', 'AuditScore', 'AuditMaxScore',
+                 'AuditScorePercentage', 'AuditDuration'}
+BOOLEAN_COLUMNS = {'Mandatory', 'FailedResponse', 'Inactive', 'Archived'}
+DATETIME_COLUMNS = {'DateStarted', 'DateCompleted', 'DateModified', 'ConductedOn'}
+
+# audit_data properties the DateStarted, DateCompleted and DateModified columns are typed from
+AUDIT_DATE_PROPERTIES = {'DateStarted': 'date_started', 'DateCompleted': 'date_completed',
+                         'DateModified': 'date_modified'}
+
+# number of files handed to a conversion process at a time
+CONVERSION_CHUNK_SIZE = 16
+
+# print conversion progress every this many files
+CONVERSION_PROGRESS_INTERVAL = 1000
+
+# number of distinct timestamps whose parsed and formatted values are memoised
+DATE_CACHE_SIZE = 4096
+
 # audit item empty response 
 EMPTY_RESPONSE = ''
 
@@ -168,28 +208,612 @@ def get_json_property(obj, *args):
     return obj if obj is not None else EMPTY_RESPONSE
 
 
+def parse_iso_date_time(date):
+    """
+    Parse a timestamp in the format returned by the API, slicing it directly instead of going through strptime
+    :param date:    date in the format: 2017-03-03T03:45:58.090Z
+    :return:        naive UTC datetime
+    :raises:        ValueError if the date is not in that format
+    """
+    fraction = date[20:-1]
+    if len(date) > 20 and date[4] == '-' and date[7] == '-' and date[10] == 'T' and date[13] == ':' \
+            and date[16] == ':' and date[19] == '.' and date[-1] == 'Z' and len(fraction) <= 6 and fraction.isdigit():
+        try:
+            return datetime(int(date[0:4]), int(date[5:7]), int(date[8:10]), int(date[11:13]), int(date[14:16]),
+                            int(date[17:19]), int(fraction.ljust(6, '0')))
+        except ValueError:
+            pass
+    return datetime.strptime(date, '%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+@functools.lru_cache(maxsize=DATE_CACHE_SIZE)
+def format_date_time(date):
+    """
+    Reformat datetime string from ISO format to 'DD Month YYYY HH:MM:SS AM/PM'. Results are memoised, as the same
+    timestamps appear on many rows.
+    :param date:    date in the format: 2017-03-03T03:45:58.090Z
+    :return:        date and time in the format: '03 March 2017 03:45:58 AM'
+    """
+    if date:
+        return parse_iso_date_time(date).strftime('%d %B %Y %I:%M:%S %p')
+    return EMPTY_RESPONSE
+
+
+@functools.lru_cache(maxsize=DATE_CACHE_SIZE)
+def parse_date_time(date):
+    """
+    :param date:    date in the format: 2017-03-03T03:45:58.090Z or 2017-03-03T03:45:58Z
+    :return:        datetime, or None if there is no date or it is in neither format. Results are memoised.
+    """
+    if date:
+        try:
+            return parse_iso_date_time(date)
+        except ValueError:
+            pass
+        try:
+            return datetime.strptime(date, '%Y-%m-%dT%H:%M:%SZ')
+        except ValueError:
+            pass
+    return None
+
+
+def format_date_times(dates):
+    """
+    Batch variant of format_date_time, formatting each distinct date of a column once
+    :param dates:   dates in the format: 2017-03-03T03:45:58.090Z
+    :return:        list of formatted dates
+    """
+    formatted = {date: format_date_time(date) for date in set(dates)}
+    return [formatted[date] for date in dates]
+
+
+def parse_date_times(dates):
+    """
+    Batch variant of parse_date_time, parsing each distinct date of a column once
+    :param dates:   dates in the format: 2017-03-03T03:45:58.090Z or 2017-03-03T03:45:58Z
+    :return:        list of datetimes or None
+    """
+    parsed = {date: parse_date_time(date) for date in set(dates)}
+    return [parsed[date] for date in dates]
+
+
+class TemplateMetadata:
+    """
+    Template-level lookups shared by every audit of the same template.
+
+    Attributes:
+        response_labels(dict): maps custom response IDs to their label
+        smartfield_labels(dict): maps smartfield condition and values to the label built for them
+    """
+
+    def __init__(self, template_data):
+        """
+        Constructor
+
+        :param template_data:   template_data property of an audit in JSON format
+        """
+        self.response_labels = dict()
+        response_sets = get_json_property(template_data, 'response_sets') or {}
+        for response_set in response_sets.values():
+            for response in response_set[RESPONSES]:
+                self.response_labels[response['id']] = response[LABEL]
+        self.smartfield_labels = dict()
+        self.flatten_plan = FlattenPlan()
+
+    def smartfield_label(self, conditional_id, values):
+        """
+        :param conditional_id:  smartfield condition ID
+        :param values:          values the smartfield condition is evaluated against
+        :return:                condition statement followed by the label of each value, each enclosed in '|'
+        """
+        try:
+            key = (conditional_id, tuple(values))
+            return self.smartfield_labels[key]
+        except KeyError:
+            label = self.build_smartfield_label(conditional_id, values)
+            self.smartfield_labels[key] = label
+            return label
+        except TypeError:
+            return self.build_smartfield_label(conditional_id, values)
+
+    def build_smartfield_label(self, conditional_id, values):
+        label = EMPTY_RESPONSE
+        if conditional_id:
+            label = smartfield_conditional_id_to_statement_map.get(conditional_id) or EMPTY_RESPONSE
+        for value in values:
+            label += '|'
+            if value in standard_response_id_map:
+                label += standard_response_id_map[value]
+            elif value in self.response_labels:
+                label += self.response_labels[value]
+            else:
+                label += str(value)
+            label += '|'
+        return label
+
+
+class FlattenPlan:
+    """
+    Columns of each template item that do not depend on the response: ItemType, Label and Mandatory.
+
+    The plan is compiled from the first audit of the template to be flattened. Later audits reuse an item's columns
+    as long as its type, label and options are unchanged; items the plan does not know, such as the instances of a
+    repeating section, are derived from scratch without growing the plan.
+
+    Attributes:
+        items(dict): maps item ID to the type, label and options the columns were derived from, and the columns
+    """
+
+    def __init__(self):
+        self.items = dict()
+        self.compiled = False
+
+    def static_columns(self, item, derive_columns):
+        """
+        :param item:            single item in JSON format
+        :param derive_columns:  function deriving the columns from the item, called when the plan cannot be used
+        :return:                ItemType, Label and Mandatory columns of the item
+        """
+        item_id = item.get(ID)
+        entry = self.items.get(item_id)
+        if entry is not None and entry[0] == item.get(TYPE) and entry[1] == item.get(LABEL) \
+                and entry[2] == item.get('options'):
+            return entry[3]
+        columns = derive_columns(item)
+        if item_id and (entry is not None or not self.compiled):
+            self.items[item_id] = (item.get(TYPE), item.get(LABEL), item.get('options'), columns)
+        return columns
+
+
+class TemplateCache:
+    """
+    Least recently used cache of TemplateMetadata, shared across audits and sync cycles.
+
+    Audits do not carry a template revision, so entries are keyed by template ID and the content of the template's
+    response sets: an audit of an edited template gets its own entry, and the stale one is eventually evicted.
+    """
+
+    def __init__(self, max_size=DEFAULT_TEMPLATE_CACHE_SIZE):
+        """
+        Constructor
+
+        :param max_size:    maximum number of templates to keep
+        """
+        self.max_size = max_size
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def template_key(audit_json):
+        """
+        :param audit_json:  audit in JSON format
+        :return:            template ID and a fingerprint of the template's response sets
+        """
+        response_sets = get_json_property(audit_json, 'template_data', 'response_sets') or {}
+        fingerprint = tuple((response_set_id, tuple((response['id'], response[LABEL])
+                                                    for response in response_set[RESPONSES]))
+                            for response_set_id, response_set in response_sets.items())
+        return audit_json['template_id'], hash(fingerprint)
+
+    def get(self, audit_json):
+        """
+        :param audit_json:  audit in JSON format
+        :return:            TemplateMetadata of the audit's template, built on the first audit of each template
+        """
+        key = self.template_key(audit_json)
+        with self.lock:
+            metadata = self.entries.get(key)
+            if metadata is not None:
+                self.entries.move_to_end(key)
+                return metadata
+        metadata = TemplateMetadata(audit_json['template_data'])
+        with self.lock:
+            self.entries[key] = metadata
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        return metadata
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+# shared by every CsvExporter that is not given its own cache, so templates are cached for the life of the process
+TEMPLATE_CACHE = TemplateCache()
+
+
+class ItemTree:
+    """
+    Parent/child index over the items of an audit, built once per audit.
+
+    The category (label of the nearest section or category) and repeating section (ID of the nearest element) of
+    every item are resolved in one pass: each chain of parent links is walked once, and every item on it shares the
+    result.
+
+    Attributes:
+        items(dict): maps each item ID to its parent ID, label and type
+        children(dict): maps each item ID to the IDs of its children, in audit order
+        categories(dict): maps each item ID to the label of the item itself or its nearest section or category
+        repeating_sections(dict): maps each item ID to the ID of the item itself or its nearest element
+    """
+
+    def __init__(self, items):
+        """
+        Constructor
+
+        :param items:   audit items in JSON format, header and non-header
+        """
+        self.items = {}
+        self.children = {}
+        for item in items:
+            if item.get('item_id'):
+                parent_id = item.get('parent_id') or EMPTY_RESPONSE
+                self.items[item['item_id']] = {
+                    'parent_id': parent_id,
+                    'label': item.get('label') or EMPTY_RESPONSE,
+                    'type': item.get('type') or EMPTY_RESPONSE
+                }
+                if parent_id:
+                    self.children.setdefault(parent_id, []).append(item['item_id'])
+        self.categories = self.resolve(
+            lambda item_id, node: node['label'] if node['type'] in ('section', 'category') else None)
+        self.repeating_sections = self.resolve(
+            lambda item_id, node: item_id if node['type'] == 'element' else None)
+
+    def resolve(self, own_value):
+        """
+        Resolve a value for every item: the value the item defines itself, or else the value resolved for its parent.
+        :param own_value:   function of item ID and item returning the value the item defines, or None to inherit
+        :return:            dictionary mapping item ID to the resolved value, EMPTY_RESPONSE where no ancestor defines
+                            one or the parent links are broken
+        """
+        resolved = {}
+        for item_id in self.items:
+            path = []
+            value = None
+            node_id = item_id
+            while node_id and node_id not in resolved and node_id in self.items and node_id not in path:
+                path.append(node_id)
+                value = own_value(node_id, self.items[node_id])
+                if value is not None:
+                    break
+                node_id = self.items[node_id]['parent_id']
+            else:
+                value = resolved.get(node_id, EMPTY_RESPONSE)
+            for node_id in path:
+                resolved[node_id] = value
+        return resolved
+
+    def category(self, item_id):
+        """
+        :param item_id: item ID
+        :return:        label of the item if it is a section or category, else that of its nearest such ancestor
+        """
+        return self.categories.get(item_id, EMPTY_RESPONSE) if item_id else EMPTY_RESPONSE
+
+    def repeating_section(self, item_id):
+        """
+        :param item_id: item ID
+        :return:        ID of the item if it is an element, else that of its nearest element ancestor
+        """
+        return self.repeating_sections.get(item_id, EMPTY_RESPONSE) if item_id else EMPTY_RESPONSE
+
+
+class StreamedItems:
+    """
+    The items of an audit JSON file, parsed incrementally each time they are iterated over, so only one item is held
+    in memory at a time. Requires ijson.
+    """
+
+    def __init__(self, audit_file_path):
+        """
+        Constructor
+
+        :param audit_file_path: path to the audit JSON file
+        """
+        self.audit_file_path = audit_file_path
+
+    def __iter__(self):
+        with open(self.audit_file_path, 'rb') as audit_file:
+            for item in ijson.items(audit_file, 'items.item', use_float=True):
+                yield item
+
+
+class StreamedAudit(dict):
+    """
+    Audit JSON read from a file without its items, which are parsed incrementally as they are needed. It can be used
+    wherever an audit JSON is expected, as long as 'items' is only iterated over.
+
+    Attributes:
+        audit_file_path(str): path to the audit JSON file
+    """
+
+    def __init__(self, audit_file_path):
+        """
+        Constructor
+
+        :param audit_file_path: path to the audit JSON file
+        """
+        super(StreamedAudit, self).__init__()
+        self.audit_file_path = audit_file_path
+        builder = ijson.ObjectBuilder()
+        with open(audit_file_path, 'rb') as audit_file:
+            for prefix, event, value in ijson.parse(audit_file, use_float=True):
+                if prefix == 'items' or prefix.startswith('items.') or \
+                        (prefix == '' and event == 'map_key' and value == 'items'):
+                    continue
+                builder.event(event, value)
+        self.update(builder.value)
+        self['items'] = StreamedItems(audit_file_path)
+
+
+class ItemHandler:
+    """
+    Extracts the columns of an item that depend on its type. The base class is used for item types without a
+    response, such as sections, and handles media attached to the item.
+
+    To support a new item type, subclass ItemHandler, override the columns that differ and register an instance with
+    register_item_handler.
+    """
+
+    def item_type(self, item, item_type):
+        """
+        :param item:        single item in JSON format
+        :param item_type:   type property of the item
+        :return:            ItemType column
+        """
+        return item_type
+
+    def response(self, item):
+        """
+        :param item:    single item in JSON format
+        :return:        Response column
+        """
+        return EMPTY_RESPONSE
+
+    def comment(self, item):
+        """
+        :param item:    single item in JSON format
+        :return:        Comment column
+        """
+        return get_json_property(item, RESPONSES, 'text')
+
+    def media(self, item):
+        """
+        :param item:    single item in JSON format
+        :return:        MediaHypertextReference column, the file names of the media attached to the item
+        """
+        media_list = []
+        for image in get_json_property(item, MEDIA):
+            if EXT in image.keys():
+                media_list.append(image[MEDIAID] + '.' + image[EXT])
+            else:
+                media_list.append(image[MEDIAID] + '.' + 'jpg')
+        return '\n'.join(media_list)
+
+    def location_coordinates(self, item):
+        """
+        :param item:    single item in JSON format
+        :return:        longitude and latitude columns
+        """
+        return [EMPTY_RESPONSE, EMPTY_RESPONSE]
+
+    def response_id(self, item):
+        """
+        :param item:    single item in JSON format
+        :return:        ResponseID column
+        """
+        return EMPTY_RESPONSE
+
+
+class ResponseHandler(ItemHandler):
+    """
+    Item whose response is a single property of its responses, such as text or a slider value
+    """
+
+    def __init__(self, *path):
+        """
+        Constructor
+
+        :param path:    keys leading to the response within the item's responses
+        """
+        self.path = path
+
+    def response(self, item):
+        return get_json_property(item, RESPONSES, *self.path)
+
+
+class QuestionHandler(ItemHandler):
+    def response(self, item):
+        return get_json_property(item, RESPONSES, 'selected', 0, LABEL)
+
+    def response_id(self, item):
+        return get_json_property(item, RESPONSES, 'selected', 0, 'id')
+
+
+class ListHandler(ItemHandler):
+    def response(self, item):
+        response = EMPTY_RESPONSE
+        for single_response in get_json_property(item, RESPONSES, 'selected'):
+            if single_response:
+                response += get_json_property(single_response, LABEL) + '\n'
+        return response[:-1]
+
+    def response_id(self, item):
+        response_id = EMPTY_RESPONSE
+        for single_response in get_json_property(item, RESPONSES, 'selected'):
+            if single_response:
+                response_id += get_json_property(single_response, 'id') + '\n'
+        return response_id[:-1]
+
+
+class AddressHandler(ResponseHandler):
+    def __init__(self):
+        super(AddressHandler, self).__init__('location_text')
+
+    def location_coordinates(self, item):
+        location_coordinates = get_json_property(item, 'responses', 'location', 'geometry', 'coordinates')
+        if isinstance(location_coordinates, list) and len(location_coordinates):
+            return str(location_coordinates).strip('[]').split(',')
+        return [EMPTY_RESPONSE, EMPTY_RESPONSE]
+
+
+class CheckboxHandler(ItemHandler):
+    def response(self, item):
+        return bool(get_json_property(item, RESPONSES, 'value'))
+
+
+class ImageResponseHandler(ResponseHandler):
+    """
+    Drawing and signature items, whose media is the image in their responses
+    """
+
+    def media(self, item):
+        media_href = '{}.{}'.format(get_json_property(item, RESPONSES, 'image', MEDIAID),
+                                    get_json_property(item, RESPONSES, 'image', EXT))
+        return None if media_href == '.' else media_href
+
+
+class MediaHandler(ItemHandler):
+    def response(self, item):
+        response = EMPTY_RESPONSE
+        for image in get_json_property(item, MEDIA):
+            response += '\n' + get_json_property(image, 'media_id')
+        return response[1:]
+
+
+class SmartfieldHandler(ItemHandler):
+    def response(self, item):
+        return get_json_property(item, 'evaluation')
+
+
+class DatetimeHandler(ItemHandler):
+    def response(self, item):
+        return CsvExporter.format_date_time(get_json_property(item, RESPONSES, 'datetime'))
+
+
+class TextHandler(ResponseHandler):
+    def __init__(self):
+        super(TextHandler, self).__init__('text')
+
+    def comment(self, item):
+        return EMPTY_RESPONSE
+
+
+class InformationHandler(ItemHandler):
+    def item_type(self, item, item_type):
+        return item_type + ' - ' + get_json_property(item, 'options', TYPE)
+
+    def response(self, item):
+        if get_json_property(item, 'options', TYPE) == 'link':
+            return get_json_property(item, 'options', 'link')
+        return EMPTY_RESPONSE
+
+    def media(self, item):
+        if get_json_property(item, 'options', TYPE) != MEDIA:
+            return super(InformationHandler, self).media(item)
+        media_href = '{}.{}'.format(get_json_property(item, 'options', MEDIA, MEDIAID),
+                                    get_json_property(item, 'options', MEDIA, EXT))
+        return None if media_href == '.' else media_href
+
+
+class UnhandledItemHandler(ItemHandler):
+    """
+    Used for item types without a registered handler. Their columns are extracted as for items without a response,
+    and each unknown type is logged once.
+    """
+
+    def __init__(self):
+        self.logged_types = set()
+
+    def item_type(self, item, item_type):
+        if item_type not in self.logged_types:
+            self.logged_types.add(item_type)
+            logging.getLogger('exporter_logger').warning(
+                'Unhandled item type: {0} from item {1}'.format(item_type, item.get(ID)))
+        return item_type
+
+
+# maps each item type to the ItemHandler extracting its columns
+ITEM_HANDLERS = {
+    'question': QuestionHandler(),
+    'list': ListHandler(),
+    'address': AddressHandler(),
+    'checkbox': CheckboxHandler(),
+    'switch': ResponseHandler('value'),
+    'slider': ResponseHandler('value'),
+    'drawing': ImageResponseHandler('image', 'media_id'),
+    MEDIA: MediaHandler(),
+    SIGNATURE: ImageResponseHandler('name'),
+    'smartfield': SmartfieldHandler(),
+    'datetime': DatetimeHandler(),
+    'text': TextHandler(),
+    'textsingle': TextHandler(),
+    INFORMATION: InformationHandler(),
+    'temperature': ResponseHandler('temperature'),
+    'dynamicfield': ItemHandler(),
+    'element': ItemHandler(),
+    'primeelement': ItemHandler(),
+    'asset': ItemHandler(),
+    'scanner': ItemHandler(),
+    'category': ItemHandler(),
+    'section': ItemHandler(),
+}
+
+UNHANDLED_ITEM_HANDLER = UnhandledItemHandler()
+
+
+def register_item_handler(item_type, handler):
+    """
+    Use handler to extract the columns of items of type item_type, replacing any handler already registered for it
+    :param item_type:   type property of the items
+    :param handler:     ItemHandler instance
+    """
+    ITEM_HANDLERS[item_type] = handler
+
+
+def get_item_handler(item_type):
+    """
+    :param item_type:   type property of an item
+    :return:            ItemHandler registered for the item type, or UNHANDLED_ITEM_HANDLER
+    """
+    return ITEM_HANDLERS.get(item_type, UNHANDLED_ITEM_HANDLER)
+
+
 class CsvExporter:
     """
     provides tools to convert single json audit to CSV
 
     Attributes:
         audit_json(json): audit to be converted to CSV
-        audit_table(list): the audit data converted to a table
+        audit_table(list): the audit data converted to a table, unless columnar is set
+        audit_columns(dict): the audit data converted to typed columns, if columnar is set
     """
 
-    def __init__(self, audit_json, export_inactive_items=True):
+    def __init__(self, audit_json, export_inactive_items=True, template_cache=None, columnar=False, eager=True):
         """
         Constructor
 
         :param audit_json:      audit in JSON format to be converted to CSV
+        :param template_cache:  TemplateCache to look up template metadata in, defaults to TEMPLATE_CACHE
+        :param columnar:        if True, convert the audit to audit_columns instead of audit_table
+        :param eager:           if False, convert nothing up front, and leave it to the caller to stream the audit
+                                with iter_rows or iter_column_chunks
         """
         self.audit_json = audit_json
+        self.template_cache = template_cache or TEMPLATE_CACHE
+        self.template_metadata = None
         self.export_inactive_items = export_inactive_items
         self.item_category = EMPTY_RESPONSE
         self.repeating_section_title = EMPTY_RESPONSE
-        self.item_map = {}
-        self.map_items()
-        self.audit_table = self.convert_audit_to_table()
+        self.item_tree = ItemTree(self.audit_items())
+        self.audit_level_data = None
+        self.audit_table = None
+        self.audit_columns = None
+        if eager and columnar:
+            self.audit_columns = self.convert_audit_to_columns()
+        elif eager:
+            self.audit_table = self.convert_audit_to_table()
 
     def audit_id(self):
         """
@@ -201,69 +825,54 @@ class CsvExporter:
         """
         :return:    All audit items, including header and non-header items
         """
-        return self.audit_json['header_items'] + self.audit_json['items']
-
-    def map_items(self):
-        """
-        Creates a dictionary which maps each item to it's parent ID, Label, and Type.
-        This tree can then be traversed recursively to find the Category or Section of a given item.
-        """
-        for item in self.audit_items():
-            if item.get('item_id'):
-                self.item_map[item['item_id']] = {
-                    'parent_id': item.get('parent_id') or EMPTY_RESPONSE,
-                    'label': item.get('label') or EMPTY_RESPONSE,
-                    'type': item.get('type') or EMPTY_RESPONSE
-                }
+        return itertools.chain(self.audit_json['header_items'], self.audit_json['items'])
 
     def get_item_category(self, item_id):
         """
-        Recursively traverses the item Map, following parent IDs until it gets to a Section or Category.
-        When a Section or Category is found, the item Category is set to the label of that Section or Category.
-        :param item_id: item ID to find Category for
-        :return:        Category or Section label 
+        Looks up the Category or Section of an item in the item tree.
+        :param item_id: item ID to find Category for, usually the parent ID of an item
+        :return:        Category or Section label
         """
-        if not item_id:
-            return EMPTY_RESPONSE
-        elif self.item_map[item_id]['type'] == 'section' or self.item_map[item_id]['type'] == 'category':
-            return self.item_map[item_id]['label'] or EMPTY_RESPONSE
-        else:
-            return self.get_item_category(self.item_map[item_id]['parent_id'])
+        return self.item_tree.category(item_id)
 
-    def get_repeating_section_title(self, item_id, count):
+    def get_repeating_section_title(self, item_id):
         """
-        Recursively traverses the item Map, following parent IDs until it gets to an element.
-        When a Section or Category is found, the item ID is logged - it can then be used to group like questions together.
-        Needed whenever questions are nested within a repeating section (e.g. within smart fields.)
-        Count used to stop it running longer than needed.
-        :param item_id: item ID to find Category for
+        Looks up the nearest element of an item in the item tree. Its ID can be used to group like questions
+        together, whenever questions are nested within a repeating section (e.g. within smart fields.)
+        :param item_id: item ID to find the element for, usually the parent ID of an item
         :return:        Item ID
         """
-        if not item_id or count >=10:
-            return EMPTY_RESPONSE
-        elif self.item_map[item_id]['type'] == 'element':
-            count = 0
-            return item_id
+        return self.item_tree.repeating_section(item_id)
 
-        else:
-            count += 1
-            return self.get_repeating_section_title(self.item_map[item_id]['parent_id'], count)
+    def get_template_metadata(self):
+        """
+        :return:     TemplateMetadata of the audit's template, from the template cache
+        """
+        if self.template_metadata is None:
+            self.template_metadata = self.template_cache.get(self.audit_json)
+        return self.template_metadata
 
     def audit_custom_response_id_to_label_map(self):
         """
         :return:     dictionary mapping custom response_id's to their label
         """
-        custom_response_sets = self.audit_json['template_data']['response_sets']
-        audit_custom_response_id_to_label_map = dict()
-        for response_set in custom_response_sets.keys():
-            for response in custom_response_sets[response_set][RESPONSES]:
-                audit_custom_response_id_to_label_map[response['id']] = response[LABEL]
-        return audit_custom_response_id_to_label_map
+        return self.get_template_metadata().response_labels
 
     def common_audit_data(self):
         """
         :return:    Selected sub-properties of the audit_data property of the audit JSON as a list
         """
+        if self.audit_level_data is None:
+            self.audit_level_data = self.audit_level_columns()
+        leading_columns, trailing_columns = self.audit_level_data
+        return leading_columns + [self.item_category, self.repeating_section_title] + trailing_columns
+
+    def audit_level_columns(self):
+        """
+        Collects the columns shared by every row of the audit. They only depend on the audit, so common_audit_data
+        computes them once and reuses them for every item.
+        :return:    the columns before and the columns after ItemCategory and RepeatingSectionParentID, as two lists
+        """
         audit_data_property = self.audit_json['audit_data']
         template_data_property = self.audit_json['template_data']
         audit_date_completed = audit_data_property['date_completed']
@@ -289,19 +898,18 @@ class CsvExporter:
             audit_data_as_list.append('Untitled Template')
         audit_data_as_list.append(template_data_property['authorship']['author'])
         audit_data_as_list.append(template_data_property['authorship']['author_id'])
-        audit_data_as_list.append(self.item_category)
-        audit_data_as_list.append(self.repeating_section_title)
-        audit_data_as_list.append(self.get_header_item(header_data, 'DocumentNo'))
-        audit_data_as_list.append(self.get_header_item(header_data, 'ConductedOn'))
-        audit_data_as_list.append(self.get_header_item(header_data, 'PreparedBy'))
-        audit_data_as_list.append(self.get_header_item(header_data, 'Location'))
-        audit_data_as_list.append(self.get_header_item(header_data, 'Personnel'))
-        audit_data_as_list.append(self.get_header_item(header_data, 'ClientSite'))
-        audit_data_as_list.append(get_json_property(audit_data_property, 'site', 'name'))
-        audit_data_as_list.append(get_json_property(audit_data_property, 'site', 'area', 'name'))
-        audit_data_as_list.append(get_json_property(audit_data_property, 'site', 'region', 'name'))
-        audit_data_as_list.append(self.audit_json['archived'])
-        return audit_data_as_list
+        trailing_data_as_list = list()
+        trailing_data_as_list.append(self.get_header_item(header_data, 'DocumentNo'))
+        trailing_data_as_list.append(self.get_header_item(header_data, 'ConductedOn'))
+        trailing_data_as_list.append(self.get_header_item(header_data, 'PreparedBy'))
+        trailing_data_as_list.append(self.get_header_item(header_data, 'Location'))
+        trailing_data_as_list.append(self.get_header_item(header_data, 'Personnel'))
+        trailing_data_as_list.append(self.get_header_item(header_data, 'ClientSite'))
+        trailing_data_as_list.append(get_json_property(audit_data_property, 'site', 'name'))
+        trailing_data_as_list.append(get_json_property(audit_data_property, 'site', 'area', 'name'))
+        trailing_data_as_list.append(get_json_property(audit_data_property, 'site', 'region', 'name'))
+        trailing_data_as_list.append(self.audit_json['archived'])
+        return audit_data_as_list, trailing_data_as_list
 
     @staticmethod
     def get_header_item(header_data, header_item_type):
@@ -326,36 +934,127 @@ class CsvExporter:
     @staticmethod
     def format_date_time(date):
         """
-        Reformat datetime string from ISO format to 'DD Month YYYY HH:MM AM/PM'
+        Reformat datetime string from ISO format to 'DD Month YYYY HH:MM:SS AM/PM', see format_date_time
         :param date:    date in the format: 2017-03-03T03:45:58.090Z
-        :return:        date and time in the format: '03 March 2017 03:45 AM',
+        :return:        date and time in the format: '03 March 2017 03:45:58 AM',
         """
-        if date:
-            date_object = datetime.strptime(date, '%Y-%m-%dT%H:%M:%S.%fZ')
-            formatted_date = date_object.strftime('%d %B %Y')
-            formatted_time = date_object.strftime('%I:%M:%S %p')
-            return formatted_date + ' ' + formatted_time
-        else:
-            return EMPTY_RESPONSE
+        return format_date_time(date)
 
     def convert_audit_to_table(self):
         """
         Collects all audit item responses, appends common audit data and returns a 2-dimensional list.
         :return:    2 dimensional list, each list is a single item, which corresponds to a single row
         """
-        self.audit_table = []
+        self.audit_table = list(self.iter_rows())
+        return self.audit_table
+
+    def iter_rows(self):
+        """
+        Generator over the rows of the audit, each built when it is requested. Use it instead of audit_table to keep
+        only one row of a large audit in memory at a time.
+        :return:    one list per item, which corresponds to a single row
+        """
+        flatten_plan = self.get_template_metadata().flatten_plan
         for item in self.audit_items():
+            if get_json_property(item, INACTIVE) and not self.export_inactive_items:
+                continue
             if item.get('parent_id'):
                 self.item_category = self.get_item_category(item['parent_id'])
-                self.repeating_section_title = self.get_repeating_section_title(item['parent_id'], 0)
+                self.repeating_section_title = self.get_repeating_section_title(item['parent_id'])
             else:
                 self.item_category = EMPTY_RESPONSE
                 self.repeating_section_title = EMPTY_RESPONSE
-            row_array = self.item_properties_as_list(item) + self.common_audit_data()
+            yield self.item_properties_as_list(item, flatten_plan) + self.common_audit_data()
+        flatten_plan.compiled = True
+
+    def convert_audit_to_columns(self):
+        """
+        Collects all audit item responses and common audit data as typed columns, without building a row per item.
+        :return:    dictionary mapping each CSV_HEADER_ROW column to a list with one value per item, see
+                    iter_column_chunks
+        """
+        return next(self.iter_column_chunks())
+
+    def iter_column_chunks(self, chunk_size=None):
+        """
+        Generator over the audit as typed columns, chunk_size items at a time. Audit-level values are converted once
+        and repeated for every item.
+        :param chunk_size:  maximum number of items in each chunk, None for a single chunk holding every item
+        :return:            dictionaries mapping each CSV_HEADER_ROW column to a list with one value per item. Scores
+                            and durations are floats, flags are booleans, DateStarted, DateCompleted, DateModified
+                            and ConductedOn are datetimes, and missing scores and dates are None. SortingIndex
+                            numbers the items of the audit from 1.
+        """
+        flatten_plan = self.get_template_metadata().flatten_plan
+        item_columns = [[] for _ in range(ITEM_COLUMN_COUNT)]
+        categories = []
+        repeating_section_titles = []
+        first_sorting_index = 1
+        for item in self.audit_items():
             if get_json_property(item, INACTIVE) and not self.export_inactive_items:
                 continue
-            self.audit_table.append(row_array)
-        return self.audit_table
+            parent_id = item.get('parent_id')
+            categories.append(self.get_item_category(parent_id))
+            repeating_section_titles.append(self.get_repeating_section_title(parent_id))
+            for column, value in zip(item_columns, self.item_properties_as_list(item, flatten_plan)):
+                column.append(value)
+            if chunk_size and len(categories) >= chunk_size:
+                yield self.typed_columns(item_columns, categories, repeating_section_titles, first_sorting_index)
+                first_sorting_index += len(categories)
+                item_columns = [[] for _ in range(ITEM_COLUMN_COUNT)]
+                categories = []
+                repeating_section_titles = []
+        flatten_plan.compiled = True
+        if categories or first_sorting_index == 1:
+            yield self.typed_columns(item_columns, categories, repeating_section_titles, first_sorting_index)
+
+    def typed_columns(self, item_columns, categories, repeating_section_titles, first_sorting_index):
+        """
+        :param item_columns:                values of the first ITEM_COLUMN_COUNT columns, one list per column
+        :param categories:                  ItemCategory of each item
+        :param repeating_section_titles:    RepeatingSectionParentID of each item
+        :param first_sorting_index:         SortingIndex of the first item
+        :return:                            dictionary mapping each CSV_HEADER_ROW column to its typed values
+        """
+        row_count = len(categories)
+        item_columns[0] = list(range(first_sorting_index, first_sorting_index + row_count))
+        if self.audit_level_data is None:
+            self.audit_level_data = self.audit_level_columns()
+        leading_columns, trailing_columns = self.audit_level_data
+        audit_level_values = leading_columns + [None, None] + trailing_columns
+        audit_columns = collections.OrderedDict()
+        for column_name, values in zip(CSV_HEADER_ROW, item_columns):
+            audit_columns[column_name] = self.typed_column(column_name, values)
+        for column_name, value in zip(CSV_HEADER_ROW[ITEM_COLUMN_COUNT:], audit_level_values):
+            if column_name in AUDIT_DATE_PROPERTIES:
+                value = self.audit_json['audit_data'][AUDIT_DATE_PROPERTIES[column_name]]
+            audit_columns[column_name] = self.typed_column(column_name, [value]) * row_count
+        audit_columns['ItemCategory'] = categories
+        audit_columns['RepeatingSectionParentID'] = repeating_section_titles
+        return audit_columns
+
+    @staticmethod
+    def typed_column(column_name, values):
+        """
+        :param column_name: name of the column in CSV_HEADER_ROW
+        :param values:      values of the column as they appear in audit_table
+        :return:            values converted to the type of the column
+        """
+        if column_name in BOOLEAN_COLUMNS:
+            return [bool(value) for value in values]
+        if column_name in DATETIME_COLUMNS:
+            return parse_date_times(values)
+        if column_name in FLOAT_COLUMNS:
+            return [float(value) if value not in (EMPTY_RESPONSE, None) else None for value in values]
+        return values
+
+    @staticmethod
+    def parse_date_time(date):
+        """
+        :param date:    date in the format: 2017-03-03T03:45:58.090Z or 2017-03-03T03:45:58Z
+        :return:        datetime, or None if there is no date or it is in neither format, see parse_date_time
+        """
+        return parse_date_time(date)
 
     def append_converted_audit_to_bulk_export_file(self, output_csv_path):
         """
@@ -389,63 +1088,50 @@ class CsvExporter:
         :param output_csv_path: the full path to file to save
         :param mode:    write ('wb') or append ('ab') mode
         """
+        self.write_rows(output_csv_path, mode, self.audit_table)
+
+    def append_rows_to_bulk_export_file(self, output_csv_path, rows):
+        """
+        Appends rows to bulk export file at output_csv_path as they are produced, adding the header row if the file
+        is new
+        :param output_csv_path: The full path to the file to save
+        :param rows:            rows to append, such as the iter_rows generator
+        """
+        if not os.path.isfile(output_csv_path):
+            rows = itertools.chain([CSV_HEADER_ROW], rows)
+        self.write_rows(output_csv_path, 'ab', rows)
+
+    @staticmethod
+    def write_rows(output_csv_path, mode, rows):
+        """
+        Writes rows to a file at 'path' one at a time. If producing or writing a row fails, the rows already written
+        are removed again, so the file never holds part of an audit, and the error is raised so the caller can treat
+        the audit as not exported.
+        :param output_csv_path: the full path to file to save
+        :param mode:    write ('wb') or append ('ab') mode
+        :param rows:    iterable of rows
+        """
         try:
-            csv_file = open(output_csv_path, mode)
-            wr = csv.writer(csv_file, dialect='excel', quoting=csv.QUOTE_ALL)
-            wr.writerows(self.audit_table)
-            csv_file.close()
+            with open(output_csv_path, mode) as csv_file:
+                start = csv_file.tell()
+                try:
+                    wr = csv.writer(csv_file, dialect='excel', quoting=csv.QUOTE_ALL)
+                    wr.writerows(rows)
+                except Exception:
+                    csv_file.truncate(start)
+                    raise
         except Exception as ex:
             print(str(ex) + ': Error saving audit_table to ' + output_csv_path)
+            raise
 
-    def get_item_response(self, item):
+    @staticmethod
+    def get_item_response(item):
         """
         Return item response value
         :param item:    single item in JSON format
         :return:        response property
         """
-        response = EMPTY_RESPONSE
-        item_type = get_json_property(item, TYPE)
-        if item_type == 'question':
-            response = get_json_property(item, RESPONSES, 'selected', 0, LABEL)
-        elif item_type == 'list':
-            for single_response in get_json_property(item, RESPONSES, 'selected'):
-                if single_response:
-                    response += get_json_property(single_response, LABEL) + '\n'
-            response = response[:-1]
-        elif item_type == 'address':
-            response = get_json_property(item, RESPONSES, 'location_text')
-        elif item_type == 'checkbox':
-            response = bool(get_json_property(item, RESPONSES, 'value'))
-        elif item_type == 'switch':
-            response = get_json_property(item, RESPONSES, 'value')
-        elif item_type == 'slider':
-            response = get_json_property(item, RESPONSES, 'value')
-        elif item_type == 'drawing':
-            response = get_json_property(item, RESPONSES, 'image', 'media_id')
-        elif item_type == MEDIA:
-            for image in get_json_property(item, MEDIA):
-                response += '\n' + get_json_property(image, 'media_id')
-            if response:
-                response = response[1:]
-        elif item_type == SIGNATURE:
-            response = get_json_property(item, RESPONSES, 'name')
-        elif item_type == 'smartfield':
-            response = get_json_property(item, 'evaluation')
-        elif item_type == 'datetime':
-            response = self.format_date_time(get_json_property(item, RESPONSES, 'datetime'))
-        elif item_type == 'text' or item_type == 'textsingle':
-            response = get_json_property(item, RESPONSES, 'text')
-        elif item_type == INFORMATION and get_json_property(item, 'options', TYPE) == 'link':
-            response = get_json_property(item, 'options', 'link')
-        elif item_type == 'temperature':
-            response = get_json_property(item, RESPONSES, 'temperature')
-        elif item_type in ['dynamicfield', 'element', 'primeelement', 'asset', 'scanner', 'category', 'section',
-                           INFORMATION]:
-            pass
-        else:
-            print('Unhandled item type: ' + str(item_type) + ' from ' +
-                  self.audit_id() + ', ' + item.get(ID))
-        return response
+        return get_item_handler(get_json_property(item, TYPE)).response(item)
 
     @staticmethod
     def get_item_response_id(item):
@@ -453,16 +1139,7 @@ class CsvExporter:
         :param item:    single item in JSON format
         :return:        response ID property
         """
-        response_id = EMPTY_RESPONSE
-        item_type = get_json_property(item, TYPE)
-        if item_type == 'question':
-            response_id = get_json_property(item, RESPONSES, 'selected', 0, 'id')
-        elif item_type == 'list':
-            for single_response in get_json_property(item, RESPONSES, 'selected'):
-                if single_response:
-                    response_id += get_json_property(single_response, 'id') + '\n'
-            response_id = response_id[:-1]
-        return response_id
+        return get_item_handler(get_json_property(item, TYPE)).response_id(item)
 
     @staticmethod
     def get_item_score(item):
@@ -512,23 +1189,10 @@ class CsvExporter:
         :param item:    single item in JSON format
         :return:        label property
         """
-        label = EMPTY_RESPONSE
         item_type = get_json_property(item, TYPE)
         if item_type == 'smartfield':
-            custom_response_id_to_label_map = self.audit_custom_response_id_to_label_map()
-            conditional_id = get_json_property(item, 'options', 'condition')
-            if conditional_id:
-                label = copy.deepcopy(smartfield_conditional_id_to_statement_map.get(conditional_id)) or EMPTY_RESPONSE
-            for value in get_json_property(item, 'options', 'values'):
-                label += '|'
-                if value in standard_response_id_map.keys():
-                    label += standard_response_id_map[value]
-                elif value in custom_response_id_to_label_map.keys():
-                    label += custom_response_id_to_label_map[value]
-                else:
-                    label += str(value)
-                label += '|'
-            return label
+            return self.get_template_metadata().smartfield_label(get_json_property(item, 'options', 'condition'),
+                                                                 get_json_property(item, 'options', 'values'))
         else:
             return get_json_property(item, LABEL)
 
@@ -539,9 +1203,7 @@ class CsvExporter:
         :return:        item type property
         """
         item_type = get_json_property(item, TYPE)
-        if item_type == INFORMATION:
-            item_type += ' - ' + get_json_property(item, 'options', TYPE)
-        return item_type
+        return get_item_handler(item_type).item_type(item, item_type)
 
     @staticmethod
     def get_item_media(item):
@@ -549,23 +1211,7 @@ class CsvExporter:
         :param item:    single item in JSON format
         :return:        item media href links
         """
-        item_type = get_json_property(item, TYPE)
-        if item_type == INFORMATION and get_json_property(item, 'options', TYPE) == MEDIA:
-            media_href = ('{}.{}'.format(get_json_property(item, 'options', MEDIA, MEDIAID), get_json_property(item, 'options', MEDIA, EXT)))
-        elif item_type in ['drawing', SIGNATURE]:
-            media_href = ('{}.{}'.format(get_json_property(item, RESPONSES, 'image', MEDIAID), get_json_property(item, RESPONSES, 'image', EXT)))
-        else:
-            media_list = []
-            for image in get_json_property(item, MEDIA):
-                if EXT in image.keys():
-                    media_list.append(image[MEDIAID] + '.' + image[EXT])
-                else:
-                    media_list.append(image[MEDIAID] + '.' + 'jpg')
-            media_href = '\n'.join(media_list)
-            # media_href = '\n'.join(image[MEDIAID]+'.'+image[EXT] for image in get_json_property(item, MEDIA))
-        if media_href == '.':
-            media_href = None
-        return media_href
+        return get_item_handler(get_json_property(item, TYPE)).media(item)
 
     @staticmethod
     def get_item_location_coordinates(item):
@@ -573,53 +1219,212 @@ class CsvExporter:
         :param item:    single item in JSON format
         :return:        comma separated longitude and latitude coordinates
         """
-        item_type = get_json_property(item, TYPE)
-        if item_type == 'address':
-            location_coordinates = get_json_property(item, 'responses', 'location', 'geometry', 'coordinates')
-            if isinstance(location_coordinates, list) and len(location_coordinates):
-                return str(location_coordinates).strip('[]').split(',')
-        return [EMPTY_RESPONSE, EMPTY_RESPONSE]
+        return get_item_handler(get_json_property(item, TYPE)).location_coordinates(item)
 
-    def item_properties_as_list(self, item):
+    def item_static_columns(self, item):
         """
-        Returns selected properties of the audit item JSON as a list
+        Returns the properties of the audit item JSON that are set by the template
         :param item:    single item in JSON format
-        :return:        array of item data, in format that CSV writer can handle
+        :return:        ItemType, Label and Mandatory columns
         """
-        location_coordinates = self.get_item_location_coordinates(item)
+        return (
+            self.get_item_type(item),
+            self.get_item_label(item),
+            get_json_property(item, 'options', 'is_mandatory') or False
+        )
+
+    def item_properties_as_list(self, item, flatten_plan=None):
+        """
+        Returns selected properties of the audit item JSON as a list
+        :param item:            single item in JSON format
+        :param flatten_plan:    FlattenPlan to look the columns set by the template up in, if any
+        :return:                array of item data, in format that CSV writer can handle
+        """
+        if flatten_plan is not None:
+            item_type, label, mandatory = flatten_plan.static_columns(item, self.item_static_columns)
+        else:
+            item_type, label, mandatory = self.item_static_columns(item)
+        handler = get_item_handler(get_json_property(item, TYPE))
+        location_coordinates = handler.location_coordinates(item)
         latitude = location_coordinates[1]
         longitude = location_coordinates[0]
         return [
             '',
-            self.get_item_type(item),
-            self.get_item_label(item),
-            self.get_item_response(item),
-            get_json_property(item, RESPONSES, 'text') if item.get(TYPE) not in ['text', 'textsingle'] else EMPTY_RESPONSE,
-            self.get_item_media(item),
+            item_type,
+            label,
+            handler.response(item),
+            handler.comment(item),
+            handler.media(item),
             latitude,
             longitude,
             self.get_item_score(item),
             self.get_item_max_score(item),
             self.get_item_score_percentage(item),
-            get_json_property(item, 'options', 'is_mandatory') or False,
+            mandatory,
             get_json_property(item, RESPONSES, FAILED) or False,
             get_json_property(item, INACTIVE) or False,
             get_json_property(item, ID),
-            self.get_item_response_id(item),
+            handler.response_id(item),
             get_json_property(item, PARENT_ID)
         ]
 
 
+def number_rows(rows):
+    """
+    Fill in the SortingIndex of each row as it goes by
+    :param rows:    rows produced by CsvExporter.iter_rows
+    :return:        the same rows, with SortingIndex counting from 1
+    """
+    for count, row in enumerate(rows, 1):
+        row[0] = count
+        yield row
+
+
+def find_json_files(paths):
+    """
+    Expand the paths given on the command line into the JSON files to convert
+    :param paths:   JSON files, directories searched recursively for *.json files, or glob patterns
+    :return:        sorted list of distinct file paths
+    """
+    json_files = set()
+    for path in paths:
+        if os.path.isdir(path):
+            json_files.update(glob.glob(os.path.join(path, '**', '*.json'), recursive=True))
+        elif glob.has_magic(path):
+            json_files.update(match for match in glob.glob(path, recursive=True) if os.path.isfile(match))
+        else:
+            json_files.add(path)
+    return sorted(set(os.path.normpath(json_file) for json_file in json_files))
+
+
+def csv_output_paths(json_files, output_dir):
+    """
+    Name the CSV file of each JSON file after its path relative to the directory all of them share, so the layout of
+    the JSON files is mirrored under output_dir and files of the same name in different directories do not collide
+    :param json_files:  distinct paths of the audit JSON files
+    :param output_dir:  directory to save the CSV files to
+    :return:            list of CSV file paths, in the order of json_files
+    """
+    if not json_files:
+        return []
+    json_paths = [os.path.abspath(json_file) for json_file in json_files]
+    root = os.path.commonpath([os.path.dirname(json_path) for json_path in json_paths])
+    return [os.path.join(output_dir, os.path.splitext(os.path.relpath(json_path, root))[0] + '.csv')
+            for json_path in json_paths]
+
+
+def convert_json_file(json_path, output_csv_path, part_dir=None):
+    """
+    Convert a single audit JSON file. Runs in the conversion processes, so failures are returned instead of raised.
+    :param json_path:   path to the audit JSON file
+    :param output_csv_path: path of the CSV file to save, if part_dir is None
+    :param part_dir:    if given, write the numbered rows without header to a part file in this directory instead, to
+                        be merged into the CSV of the template
+    :return:            tuple of json_path, template_id, path of the file written or None, and error message or None.
+                        A file that could not be converted leaves no CSV or part file behind.
+    """
+    csv_path = None
+    try:
+        with open(json_path, 'r') as json_file:
+            audit_json = json.load(json_file)
+        csv_exporter = CsvExporter(audit_json, eager=False)
+        if part_dir is None:
+            csv_path = output_csv_path
+            if not os.path.isdir(os.path.dirname(csv_path)):
+                os.makedirs(os.path.dirname(csv_path), exist_ok=True)
+            csv_exporter.write_rows(csv_path, 'wb', itertools.chain([CSV_HEADER_ROW], csv_exporter.iter_rows()))
+        else:
+            part_file, csv_path = tempfile.mkstemp(suffix='.csv', dir=part_dir)
+            os.close(part_file)
+            csv_exporter.write_rows(csv_path, 'wb', number_rows(csv_exporter.iter_rows()))
+        return json_path, audit_json['template_id'], csv_path, None
+    except Exception as ex:
+        if csv_path is not None and os.path.exists(csv_path):
+            os.remove(csv_path)
+        return json_path, None, None, '{0}: {1}'.format(type(ex).__name__, ex)
+
+
+def merge_part_file(part_path, template_csv_path, is_new):
+    """
+    Append a converted part file to the CSV of its template and remove it
+    :param part_path:           part file written by convert_json_file
+    :param template_csv_path:   CSV file of the template
+    :param is_new:              if True, (re)create the template CSV starting with the header row
+    """
+    if is_new:
+        CsvExporter.write_rows(template_csv_path, 'wb', [CSV_HEADER_ROW])
+    with open(template_csv_path, 'ab') as template_csv, open(part_path, 'rb') as part:
+        shutil.copyfileobj(part, template_csv)
+    os.remove(part_path)
+
+
+def convert_json_files(json_files, output_dir, jobs=None, merge=False):
+    """
+    Convert audit JSON files to CSV across a pool of processes, printing progress in files per second
+    :param json_files:  paths of the audit JSON files
+    :param output_dir:  directory to save the CSV files to, mirroring the directories of json_files
+    :param jobs:        number of conversion processes, defaults to the number of CPUs. 1 converts in this process.
+    :param merge:       if True, write one <template_id>.csv per template, holding the audits in the order of
+                        json_files, instead of one CSV per JSON file
+    :return:            number of files that could not be converted
+    """
+    jobs = jobs or os.cpu_count() or 1
+    part_dir = tempfile.mkdtemp(prefix='.parts-', dir=output_dir) if merge else None
+    merged_templates = set()
+    failed = 0
+    start = time.time()
+    executor = ProcessPoolExecutor(max_workers=jobs) if jobs > 1 else None
+    try:
+        convert = functools.partial(convert_json_file, part_dir=part_dir)
+        csv_paths = csv_output_paths(json_files, output_dir)
+        if executor is None:
+            results = map(convert, json_files, csv_paths)
+        else:
+            results = executor.map(convert, json_files, csv_paths, chunksize=CONVERSION_CHUNK_SIZE)
+        for count, (json_path, template_id, csv_path, error) in enumerate(results, 1):
+            if error is not None:
+                failed += 1
+                print('Unable to convert {0}: {1}'.format(json_path, error))
+            elif merge:
+                merge_part_file(csv_path, os.path.join(output_dir, template_id + '.csv'),
+                                template_id not in merged_templates)
+                merged_templates.add(template_id)
+            if count % CONVERSION_PROGRESS_INTERVAL == 0:
+                elapsed = time.time() - start
+                print('{0} of {1} files converted ({2:.1f} files/sec)'.format(count, len(json_files),
+                                                                             count / elapsed))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        if part_dir is not None:
+            shutil.rmtree(part_dir, ignore_errors=True)
+    elapsed = time.time() - start
+    print('Converted {0} files in {1:.1f} seconds ({2:.1f} files/sec), {3} failed'.format(
+        len(json_files) - failed, elapsed, len(json_files) / elapsed if elapsed else 0, failed))
+    return failed
+
+
 def main():
     """
-    saves JSON file as CSV. Path to JSON file provided as command line argument
+    saves JSON files as CSV. Paths to JSON files, directories or glob patterns provided as command line arguments
     """
-    for arg in sys.argv[1:]:
-        audit_json = json.load(open(arg, 'r'))
-        csv_exporter = CsvExporter(audit_json)
-        csv_exporter.save_converted_audit_to_file(os.path.splitext(arg.split('/')[-1])[0] + '.csv',
-                                                  allow_overwrite=True)
+    parser = argparse.ArgumentParser(description='Convert audit JSON files to CSV')
+    parser.add_argument('paths', nargs='+', help='JSON files, directories to search for *.json files, or glob '
+                                                 'patterns such as "exports/**/*.json"')
+    parser.add_argument('--output_dir', default='.', help='directory to save CSV files to, mirroring the directories '
+                                                          'of the JSON files, defaults to the current directory')
+    parser.add_argument('--jobs', type=int, default=None, help='number of conversion processes, defaults to the '
+                                                               'number of CPUs')
+    parser.add_argument('--merge', action='store_true', help='write one <template_id>.csv per template, like the '
+                                                             'csv export format, instead of one CSV per JSON file')
+    args = parser.parse_args()
+
+    json_files = find_json_files(args.paths)
+    if not os.path.isdir(args.output_dir):
+        os.makedirs(args.output_dir)
+    failed = convert_json_files(json_files, args.output_dir, args.jobs, args.merge)
     print('Exiting')
+    sys.exit(1 if failed else 0)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,333 @@
+import csv
+import io
+import threading
+
+from sqlalchemy import Column, MetaData, Table, create_engine, text
+from sqlalchemy.exc import DBAPIError
+
+# Number of rows sent to the database in each executemany or COPY
+LOAD_CHUNK_SIZE = 10000
+
+# Placeholders of the DBAPI parameter styles that take a sequence of values
+POSITIONAL_PLACEHOLDERS = {'qmark': '?', 'format': '%s', 'pyformat': '%s'}
+
+# Written for None in the CSV streamed to COPY, which reads it back as NULL
+COPY_NULL = '\\N'
+
+# Dialects that upsert with INSERT ... ON CONFLICT DO UPDATE
+ON_CONFLICT_DIALECTS = {'postgresql', 'sqlite'}
+
+# Oldest SQLite version that understands INSERT ... ON CONFLICT DO UPDATE
+SQLITE_ON_CONFLICT_VERSION = (3, 24, 0)
+
+
+class EngineRegistry:
+    """
+    Keeps one engine, and so one connection pool, per connection string and pool settings for the life of the process,
+    so that every sync of a loop reuses the open connections instead of connecting through the driver again. Tables
+    found to exist are remembered too, so their existence is only checked once.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.engines = {}
+        self.existing_tables = set()
+
+    def get_engine(self, connection_string, pool_size=None, pool_pre_ping=True, pool_recycle=-1):
+        """
+        :param connection_string:   SQLAlchemy URL of the database
+        :param pool_size:           number of connections kept open, None for the default of the dialect
+        :param pool_pre_ping:       if True, test connections as they are taken from the pool and replace dead ones
+        :param pool_recycle:        replace connections older than this many seconds, -1 to keep them
+        :return:                    engine created by the first call with the same arguments
+        """
+        key = (connection_string, pool_size, pool_pre_ping, pool_recycle)
+        with self.lock:
+            engine = self.engines.get(key)
+            if engine is None:
+                options = {'pool_pre_ping': pool_pre_ping, 'pool_recycle': pool_recycle}
+                if pool_size is not None:
+                    options['pool_size'] = pool_size
+                engine = create_engine(connection_string, **options)
+                self.engines[key] = engine
+            return engine
+
+    def has_table(self, engine, table_name, schema=None):
+        """
+        :param engine:      engine of the database
+        :param table_name:  name of the table
+        :param schema:      schema of the table, None for the default schema
+        :return:            True if the table exists. Only a missing table is checked again on the next call.
+        """
+        key = (engine, schema, table_name)
+        if key in self.existing_tables:
+            return True
+        if engine.dialect.has_table(engine, table_name, schema=schema):
+            self.existing_tables.add(key)
+            return True
+        return False
+
+    def dispose(self):
+        """
+        Close the pooled connections of every engine and forget them
+        """
+        with self.lock:
+            for engine in self.engines.values():
+                engine.dispose()
+            self.engines.clear()
+            self.existing_tables.clear()
+
+
+# Engines shared by every sync of this process
+ENGINE_REGISTRY = EngineRegistry()
+
+
+class BulkLoader:
+    """
+    Inserts rows into a table with executemany on the DBAPI cursor, skipping the ORM and per-row dictionaries. Drivers
+    such as sqlite3, PyMySQL and mysqlclient send each chunk in a single call; the MySQL drivers rewrite it into
+    multi-row INSERT statements.
+
+    To load rows faster on a particular database, subclass BulkLoader, override load_chunk and register an instance
+    with register_bulk_loader.
+    """
+
+    def load(self, connection, table, columns, rows):
+        """
+        Insert rows into table, LOAD_CHUNK_SIZE rows at a time, as part of the current transaction of connection.
+        Driver errors are raised as the matching SQLAlchemy exception, such as IntegrityError for duplicate keys.
+        :param connection:  SQLAlchemy connection, such as session.connection()
+        :param table:       Table to insert into
+        :param columns:     names of the columns, in the order of the values of each row
+        :param rows:        sequence of tuples of typed values, such as datetimes for DateTime columns
+        """
+        dbapi = connection.dialect.dbapi
+        rows = bind_rows(connection.dialect, table, columns, rows)
+        for start in range(0, len(rows), LOAD_CHUNK_SIZE):
+            try:
+                self.load_chunk(connection, table, columns, rows[start:start + LOAD_CHUNK_SIZE])
+            except dbapi.Error as ex:
+                raise DBAPIError.instance('bulk load into ' + table.name, None, ex, dbapi.Error)
+
+    def load_chunk(self, connection, table, columns, rows):
+        """
+        :param connection:  SQLAlchemy connection
+        :param table:       Table to insert into
+        :param columns:     names of the columns, in the order of the values of each row
+        :param rows:        rows whose values have been converted for the DBAPI driver
+        """
+        placeholder = POSITIONAL_PLACEHOLDERS.get(connection.dialect.dbapi.paramstyle)
+        if placeholder is None:
+            connection.execute(table.insert(), [dict(zip(columns, row)) for row in rows])
+            return
+        cursor = connection.connection.cursor()
+        try:
+            cursor.executemany(insert_statement(connection.dialect, table, columns, placeholder), rows)
+        finally:
+            cursor.close()
+
+
+class FastExecutemanyLoader(BulkLoader):
+    """
+    Loads rows through pyodbc with fast_executemany, which sends each chunk to SQL Server as one array of parameters
+    instead of making a round trip per row
+    """
+
+    def load_chunk(self, connection, table, columns, rows):
+        cursor = connection.connection.cursor()
+        try:
+            cursor.fast_executemany = True
+            cursor.executemany(insert_statement(connection.dialect, table, columns, '?'), rows)
+        finally:
+            cursor.close()
+
+
+class CopyLoader(BulkLoader):
+    """
+    Streams rows to PostgreSQL as CSV through COPY ... FROM STDIN with psycopg2, which is parsed by the server in bulk
+    instead of as one INSERT per row
+    """
+
+    def load_chunk(self, connection, table, columns, rows):
+        preparer = connection.dialect.identifier_preparer
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator='\n')
+        for row in rows:
+            writer.writerow([COPY_NULL if value is None else value for value in row])
+        buffer.seek(0)
+        cursor = connection.connection.cursor()
+        try:
+            cursor.copy_expert("COPY {0} ({1}) FROM STDIN WITH (FORMAT csv, NULL '{2}')".format(
+                preparer.format_table(table), ', '.join(preparer.quote(name) for name in columns), COPY_NULL), buffer)
+        finally:
+            cursor.close()
+
+
+# Bulk loaders by database_type, either dialect+driver such as 'mssql+pyodbc' or just the dialect
+BULK_LOADERS = {
+    'mssql+pyodbc': FastExecutemanyLoader(),
+    'postgresql+psycopg2': CopyLoader(),
+}
+
+# Used for databases without a registered bulk loader
+DEFAULT_BULK_LOADER = BulkLoader()
+
+
+def register_bulk_loader(database_type, loader):
+    """
+    Use loader to insert rows into databases of database_type, replacing any loader already registered for it
+    :param database_type:   dialect+driver, such as 'mssql+pyodbc', or a dialect name to cover all of its drivers
+    :param loader:          BulkLoader instance
+    """
+    BULK_LOADERS[database_type] = loader
+
+
+def get_bulk_loader(dialect):
+    """
+    :param dialect:     dialect of the connection
+    :return:            BulkLoader registered for the dialect and driver, else for the dialect, else DEFAULT_BULK_LOADER
+    """
+    loader = BULK_LOADERS.get('{0}+{1}'.format(dialect.name, dialect.driver))
+    if loader is None:
+        loader = BULK_LOADERS.get(dialect.name, DEFAULT_BULK_LOADER)
+    return loader
+
+
+def bulk_load(connection, table, columns, rows):
+    """
+    Insert rows into table with the bulk loader of the database
+    :param connection:  SQLAlchemy connection, such as session.connection()
+    :param table:       Table to insert into, such as Database.__table__
+    :param columns:     names of the columns, in the order of the values of each row
+    :param rows:        sequence of tuples of typed values
+    """
+    get_bulk_loader(connection.dialect).load(connection, table, columns, rows)
+
+
+def bind_rows(dialect, table, columns, rows):
+    """
+    Apply the conversions SQLAlchemy would make before handing values to the driver, such as turning datetimes into
+    strings for SQLite. Only columns whose type needs a conversion on this dialect are touched.
+    :param dialect:     dialect of the connection
+    :param table:       Table the rows are for
+    :param columns:     names of the columns, in the order of the values of each row
+    :param rows:        sequence of tuples of typed values
+    :return:            list of rows ready for the driver
+    """
+    processors = [(position, table.columns[name].type.bind_processor(dialect)) for position, name in enumerate(columns)]
+    processors = [(position, processor) for position, processor in processors if processor is not None]
+    if not processors:
+        return rows if isinstance(rows, list) else list(rows)
+    bound_rows = []
+    for row in rows:
+        row = list(row)
+        for position, processor in processors:
+            row[position] = processor(row[position])
+        bound_rows.append(row)
+    return bound_rows
+
+
+def insert_statement(dialect, table, columns, placeholder):
+    """
+    :param dialect:     dialect of the connection
+    :param table:       Table to insert into
+    :param columns:     names of the columns
+    :param placeholder: parameter placeholder of the DBAPI driver
+    :return:            INSERT statement taking one value per column
+    """
+    preparer = dialect.identifier_preparer
+    return 'INSERT INTO {0} ({1}) VALUES ({2})'.format(preparer.format_table(table),
+                                                       ', '.join(preparer.quote(name) for name in columns),
+                                                       ', '.join([placeholder] * len(columns)))
+
+
+def upsert(connection, table, columns, rows):
+    """
+    Insert rows into table, replacing the rows that have the same primary key, with a handful of set-based statements
+    instead of a SELECT and an INSERT or UPDATE per row. The rows are loaded into a temporary staging table, which is
+    then merged into table with the statement the dialect supports:
+        mssql:              MERGE
+        postgresql, sqlite: INSERT ... SELECT ... ON CONFLICT DO UPDATE
+        mysql:              INSERT ... SELECT ... ON DUPLICATE KEY UPDATE
+        anything else:      DELETE of the existing rows, then INSERT ... SELECT
+    Run it inside a transaction, as the staging table only exists on this connection.
+    :param connection:  SQLAlchemy connection, such as session.connection()
+    :param table:       Table to upsert into, such as Database.__table__
+    :param columns:     names of the columns, in the order of the values of each row. Must include the primary key.
+    :param rows:        sequence of tuples of typed values. If several rows have the same primary key, the last one
+                        wins.
+    """
+    if not rows:
+        return
+    key_columns = [column.name for column in table.primary_key.columns]
+    key_positions = [columns.index(name) for name in key_columns]
+    unique_rows = list({tuple(row[position] for position in key_positions): row for row in rows}.values())
+
+    staging = staging_table(connection.dialect, table, columns)
+    staging.create(connection)
+    try:
+        bulk_load(connection, staging, columns, unique_rows)
+        for statement in upsert_statements(connection.dialect, table, staging, columns, key_columns):
+            connection.execute(text(statement))
+    finally:
+        staging.drop(connection)
+
+
+def staging_table(dialect, table, columns):
+    """
+    :param dialect:     dialect of the connection
+    :param table:       Table the staging table is for
+    :param columns:     names of the columns to stage
+    :return:            temporary Table with the same columns and types as table, but no keys or constraints
+    """
+    staging_columns = [Column(table.columns[name].name, table.columns[name].type) for name in columns]
+    if dialect.name == 'mssql':
+        return Table('#staging_' + table.name, MetaData(), *staging_columns)
+    return Table('staging_' + table.name, MetaData(), *staging_columns, prefixes=['TEMPORARY'])
+
+
+def upsert_statements(dialect, table, staging, columns, key_columns):
+    """
+    :param dialect:     dialect of the connection
+    :param table:       Table to upsert into
+    :param staging:     staging Table holding the rows
+    :param columns:     names of the staged columns
+    :param key_columns: names of the primary key columns of table
+    :return:            SQL statements merging the staging table into table
+    """
+    preparer = dialect.identifier_preparer
+    target = preparer.format_table(table)
+    source = preparer.format_table(staging)
+    quoted = [preparer.quote(name) for name in columns]
+    quoted_keys = [preparer.quote(name) for name in key_columns]
+    updated = [name for name in quoted if name not in quoted_keys]
+    column_list = ', '.join(quoted)
+    key_match = ' AND '.join('target.{0} = source.{0}'.format(name) for name in quoted_keys)
+    insert_select = 'INSERT INTO {0} ({1}) SELECT {1} FROM {2}'.format(target, column_list, source)
+
+    if dialect.name == 'mssql':
+        return ['MERGE INTO {0} AS target USING {1} AS source ON {2} '
+                'WHEN MATCHED THEN UPDATE SET {3} '
+                'WHEN NOT MATCHED THEN INSERT ({4}) VALUES ({5});'.format(
+                    target, source, key_match, ', '.join('target.{0} = source.{0}'.format(name) for name in updated),
+                    column_list, ', '.join('source.' + name for name in quoted))]
+    if dialect.name in ON_CONFLICT_DIALECTS and supports_on_conflict(dialect):
+        # WHERE true keeps SQLite from reading ON CONFLICT as part of a join
+        return ['{0} WHERE true ON CONFLICT ({1}) DO UPDATE SET {2}'.format(
+            insert_select, ', '.join(quoted_keys), ', '.join('{0} = excluded.{0}'.format(name) for name in updated))]
+    if dialect.name == 'mysql':
+        return ['{0} ON DUPLICATE KEY UPDATE {1}'.format(
+            insert_select, ', '.join('{0} = VALUES({0})'.format(name) for name in updated))]
+    return ['DELETE FROM {0} WHERE EXISTS (SELECT 1 FROM {1} AS source WHERE {2})'.format(
+                target, source, ' AND '.join('{0}.{1} = source.{1}'.format(target, name) for name in quoted_keys)),
+            insert_select]
+
+
+def supports_on_conflict(dialect):
+    """
+    :param dialect:     dialect of the connection
+    :return:            True if the database understands INSERT ... ON CONFLICT DO UPDATE
+    """
+    if dialect.name == 'sqlite':
+        return dialect.dbapi.sqlite_version_info >= SQLITE_ON_CONFLICT_VERSION
+    return True
@@ -3,23 +3,26 @@
 # Copyright: © SafetyCulture 2016
 
 import argparse
+import calendar
 import errno
+import functools
+import importlib.util
+import itertools
 import json
 import os
 import re
 import shutil
 import sys
+import tempfile
+import threading
 import time
 from builtins import input
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from datetime import timedelta
 
 import coloredlogs
-import dateutil.parser
 import logging
-import numpy as np
-import pandas as pd
-import pytz
 import unicodecsv as csv
 import yaml
 from safetypy import safetypy as sp
@@ -28,6 +31,7 @@ from sqlalchemy.exc import IntegrityError, OperationalError
 from sqlalchemy.orm import sessionmaker
 
 import csvExporter
+import database
 from model import Base, set_table, SQL_HEADER_ROW, ACTIONS_HEADER_ROW, set_actions_table
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
@@ -51,12 +55,52 @@ SYNC_MARKER_FILENAME = 'last_successful/last_successful.txt'
 # The file that stores the ISO date/time string of the last successful actions export
 ACTIONS_SYNC_MARKER_FILENAME = 'last_successful/last_successful_actions_export.txt'
 
+# The file that records how far through the pages of the current actions export the last run got
+ACTIONS_PAGE_CHECKPOINT_FILENAME = 'last_successful/actions_page_checkpoint.txt'
+
+# the file that stores how many syncs in a row each failing audit has failed in
+FAILED_AUDITS_FILENAME = 'last_successful/failed_audits.txt'
+
+# the file that stores the audits exported after the sync marker was held back, so the next sync does not export them
+# again
+EXPORTED_AUDITS_FILENAME = 'last_successful/exported_audits.txt'
+
 # the file that stores all exported actions in CSV format
 ACTIONS_EXPORT_FILENAME = 'iauditor_actions.csv'
 
 # Whether to export inactive items to CSV
 DEFAULT_EXPORT_INACTIVE_ITEMS_TO_CSV = True
 
+# Number of audits fetched and exported at the same time. 1 keeps the original sequential behaviour
+DEFAULT_WORKERS = 1
+
+# Number of pages of actions requested at the same time during an actions export
+DEFAULT_ACTIONS_WORKERS = 1
+
+# Number of rows of an audit converted and inserted into the database at a time
+SQL_CHUNK_SIZE = 1000
+
+# Columns of the rows loaded into the audit and actions tables, in the order of the values of each row
+SQL_COLUMNS = csvExporter.CSV_HEADER_ROW + ['DatePK']
+ACTIONS_SQL_COLUMNS = ACTIONS_HEADER_ROW + ['DatePK']
+
+# Positions of the columns of an action row holding ISO formatted dates
+ACTIONS_DATETIME_POSITIONS = [ACTIONS_HEADER_ROW.index(column_name) for column_name in
+                              ('dueDatetime', 'createdDatetime', 'modifiedDatetime', 'completedDatetime')]
+
+# Rows of many audits are buffered and committed in a single transaction once this many rows, or this many seconds
+# since the first buffered audit, have accumulated
+DEFAULT_SQL_BATCH_ROWS = 10000
+DEFAULT_SQL_BATCH_SECONDS = 60
+
+# Database connections are tested before use and replaced once they are an hour old, so connections kept open between
+# syncs do not fail after the server or a firewall drops them
+DEFAULT_DATABASE_POOL_PRE_PING = True
+DEFAULT_DATABASE_POOL_RECYCLE = 3600
+
+# An audit that fails this many times is skipped, so the sync marker moves past it. 0 retries failing audits forever
+DEFAULT_MAX_AUDIT_ATTEMPTS = 3
+
 # When exporting actions to CSV, if property is None, print this value to CSV
 EMPTY_RESPONSE = ''
 
@@ -92,6 +136,24 @@ MERGE_ROWS = 'merge_rows'
 ALLOW_TABLE_CREATION = 'allow_table_creation'
 ACTIONS_TABLE = 'actions_table'
 ACTIONS_MERGE_ROWS = 'actions_merge_rows'
+WORKERS = 'workers'
+ACTIONS_WORKERS = 'actions_workers'
+API_REQUESTS_PER_SECOND = 'api_requests_per_second'
+REPORT_JOBS_IN_FLIGHT = 'report_jobs_in_flight'
+STREAM_AUDITS_LARGER_THAN_MB = 'stream_audits_larger_than_mb'
+SQL_BATCH_ROWS = 'sql_batch_rows'
+SQL_BATCH_SECONDS = 'sql_batch_seconds'
+DB_POOL_SIZE = 'database_pool_size'
+DB_POOL_PRE_PING = 'database_pool_pre_ping'
+DB_POOL_RECYCLE = 'database_pool_recycle'
+MAX_AUDIT_ATTEMPTS = 'max_audit_attempts'
+
+# Mapped classes built by get_table_class, by 'audit' or 'actions', table name and merge setting
+SQL_TABLE_CLASSES = {}
+
+# Serialises writes to the export sinks that are shared between audits (bulk CSV files, the database and the
+# web report link file) when audits are processed by several worker threads
+EXPORT_SINK_LOCK = threading.Lock()
 
 # Used to create a default config file for new users
 DEFAULT_CONFIG_FILE_YAML = [
@@ -107,6 +169,12 @@ DEFAULT_CONFIG_FILE_YAML = [
     '\n    export_inactive_items: false',
     '\n    preferences: ',
     '\n    sync_delay_in_seconds: 300',
+    '\n    api_requests_per_second: ',
+    '\n    report_jobs_in_flight: ',
+    '\n    stream_audits_larger_than_mb: ',
+    '\n    sql_batch_rows: ',
+    '\n    sql_batch_seconds: ',
+    '\n    max_audit_attempts: ',
     '\n    media_sync_offset_in_seconds: ',
     '\n    template_ids: ',
     '\n    merge_rows: false',
@@ -119,7 +187,10 @@ DEFAULT_CONFIG_FILE_YAML = [
     '\n    database_pwd: ',
     '\n    database_port: ',
     '\n    database_name: DB-NAME?driver=ODBC Driver 17 for SQL Server',
-    '\n    database_schema: '
+    '\n    database_schema: ',
+    '\n    database_pool_size: ',
+    '\n    database_pool_pre_ping: true',
+    '\n    database_pool_recycle: 3600'
 ]
 
 
@@ -294,6 +365,174 @@ def load_setting_media_sync_offset(logger, config_settings):
         return DEFAULT_MEDIA_SYNC_OFFSET_IN_SECONDS
 
 
+def load_setting_api_requests_per_second(logger, requests_per_second):
+    """
+    Validate the rate at which API requests are paced
+
+    :param logger:               the logger
+    :param requests_per_second:  api_requests_per_second from the config file or environment
+    :return:                     requests per second as a positive float, or None to not pace requests
+    """
+    if requests_per_second in (None, ''):
+        return None
+    try:
+        requests_per_second = float(requests_per_second)
+        if requests_per_second > 0:
+            return requests_per_second
+    except (TypeError, ValueError):
+        pass
+    logger.info('Invalid api_requests_per_second value from configuration, requests will not be paced')
+    return None
+
+
+def load_setting_report_jobs_in_flight(logger, report_jobs_in_flight):
+    """
+    Validate the number of PDF and Word report jobs kept submitted to the API at the same time
+
+    :param logger:                 the logger
+    :param report_jobs_in_flight:  report_jobs_in_flight from the config file or environment
+    :return:                       number of report jobs as a positive int, else sp.DEFAULT_MAX_REPORTS_IN_FLIGHT
+    """
+    if report_jobs_in_flight in (None, ''):
+        return sp.DEFAULT_MAX_REPORTS_IN_FLIGHT
+    if re.match('^[0-9]+$', str(report_jobs_in_flight)) and int(report_jobs_in_flight) > 0:
+        return int(report_jobs_in_flight)
+    logger.info('Invalid report_jobs_in_flight value from configuration, defaulting to {0}'.format(
+        sp.DEFAULT_MAX_REPORTS_IN_FLIGHT))
+    return sp.DEFAULT_MAX_REPORTS_IN_FLIGHT
+
+
+def load_setting_stream_audits_larger_than_mb(logger, stream_audits_larger_than_mb):
+    """
+    Validate the size above which audits are parsed incrementally instead of being loaded into memory at once
+
+    :param logger:                          the logger
+    :param stream_audits_larger_than_mb:    stream_audits_larger_than_mb from the config file or environment
+    :return:                                size in bytes, or None to always load audits into memory
+    """
+    if stream_audits_larger_than_mb in (None, ''):
+        return None
+    try:
+        size_in_bytes = float(stream_audits_larger_than_mb) * 1024 * 1024
+    except (TypeError, ValueError):
+        logger.info('Invalid stream_audits_larger_than_mb value from configuration, audits will not be streamed')
+        return None
+    if csvExporter.ijson is None:
+        logger.warning('stream_audits_larger_than_mb requires ijson, audits will not be streamed. Install it with: '
+                       'pip install ijson')
+        return None
+    return max(size_in_bytes, 0)
+
+
+def load_setting_sql_batch_rows(logger, sql_batch_rows):
+    """
+    Validate the number of database rows buffered before they are committed
+
+    :param logger:          the logger
+    :param sql_batch_rows:  sql_batch_rows from the config file or environment
+    :return:                number of rows as a positive int, else DEFAULT_SQL_BATCH_ROWS. 1 commits every audit in
+                            its own transaction.
+    """
+    if sql_batch_rows in (None, ''):
+        return DEFAULT_SQL_BATCH_ROWS
+    if re.match('^[0-9]+$', str(sql_batch_rows)) and int(sql_batch_rows) > 0:
+        return int(sql_batch_rows)
+    logger.info('Invalid sql_batch_rows value from configuration, defaulting to {0}'.format(DEFAULT_SQL_BATCH_ROWS))
+    return DEFAULT_SQL_BATCH_ROWS
+
+
+def load_setting_sql_batch_seconds(logger, sql_batch_seconds):
+    """
+    Validate the longest time database rows are buffered before they are committed
+
+    :param logger:              the logger
+    :param sql_batch_seconds:   sql_batch_seconds from the config file or environment
+    :return:                    seconds as a non-negative float, else DEFAULT_SQL_BATCH_SECONDS
+    """
+    if sql_batch_seconds in (None, ''):
+        return DEFAULT_SQL_BATCH_SECONDS
+    try:
+        sql_batch_seconds = float(sql_batch_seconds)
+        if sql_batch_seconds >= 0:
+            return sql_batch_seconds
+    except (TypeError, ValueError):
+        pass
+    logger.info('Invalid sql_batch_seconds value from configuration, defaulting to {0}'.format(
+        DEFAULT_SQL_BATCH_SECONDS))
+    return DEFAULT_SQL_BATCH_SECONDS
+
+
+def load_setting_max_audit_attempts(logger, max_audit_attempts):
+    """
+    Validate the number of times an audit is attempted before the sync marker moves past it
+
+    :param logger:              the logger
+    :param max_audit_attempts:  max_audit_attempts from the config file or environment
+    :return:                    number of attempts as a non-negative int, else DEFAULT_MAX_AUDIT_ATTEMPTS. 0 never
+                                skips an audit.
+    """
+    if max_audit_attempts in (None, ''):
+        return DEFAULT_MAX_AUDIT_ATTEMPTS
+    if re.match('^[0-9]+$', str(max_audit_attempts)):
+        return int(max_audit_attempts)
+    logger.info('Invalid max_audit_attempts value from configuration, defaulting to {0}'.format(
+        DEFAULT_MAX_AUDIT_ATTEMPTS))
+    return DEFAULT_MAX_AUDIT_ATTEMPTS
+
+
+def load_setting_database_pool_size(logger, database_pool_size):
+    """
+    Validate the number of database connections kept open between syncs
+
+    :param logger:              the logger
+    :param database_pool_size:  database_pool_size from the config file or environment
+    :return:                    number of connections as a positive int, or None for the default of the database driver
+    """
+    if database_pool_size in (None, ''):
+        return None
+    if re.match('^[0-9]+$', str(database_pool_size)) and int(database_pool_size) > 0:
+        return int(database_pool_size)
+    logger.info('Invalid database_pool_size value from configuration, using the default pool size')
+    return None
+
+
+def load_setting_database_pool_pre_ping(logger, database_pool_pre_ping):
+    """
+    Validate whether database connections are tested before they are used
+
+    :param logger:                  the logger
+    :param database_pool_pre_ping:  database_pool_pre_ping from the config file or environment
+    :return:                        True or False, else DEFAULT_DATABASE_POOL_PRE_PING
+    """
+    if database_pool_pre_ping in (None, ''):
+        return DEFAULT_DATABASE_POOL_PRE_PING
+    if isinstance(database_pool_pre_ping, bool):
+        return database_pool_pre_ping
+    if str(database_pool_pre_ping).lower() in ('true', 'false'):
+        return str(database_pool_pre_ping).lower() == 'true'
+    logger.info('Invalid database_pool_pre_ping value from configuration, defaulting to {0}'.format(
+        DEFAULT_DATABASE_POOL_PRE_PING))
+    return DEFAULT_DATABASE_POOL_PRE_PING
+
+
+def load_setting_database_pool_recycle(logger, database_pool_recycle):
+    """
+    Validate the age in seconds after which database connections are replaced
+
+    :param logger:                  the logger
+    :param database_pool_recycle:   database_pool_recycle from the config file or environment
+    :return:                        seconds as a positive int, -1 if set to 0 to never replace connections, else
+                                    DEFAULT_DATABASE_POOL_RECYCLE
+    """
+    if database_pool_recycle in (None, ''):
+        return DEFAULT_DATABASE_POOL_RECYCLE
+    if re.match('^[0-9]+$', str(database_pool_recycle)):
+        return int(database_pool_recycle) or -1
+    logger.info('Invalid database_pool_recycle value from configuration, defaulting to {0}'.format(
+        DEFAULT_DATABASE_POOL_RECYCLE))
+    return DEFAULT_DATABASE_POOL_RECYCLE
+
+
 def configure_logging(path_to_log_directory):
     """
     Configure logger
@@ -382,21 +621,14 @@ def save_exported_actions_to_db(logger, actions_array, settings, get_started):
     actions_db = get_started[4]
 
     if not actions_array:
-        logger.info('No actions returned after ' + get_last_successful_actions_export(logger))
         return
     logger.info('Exporting ' + str(len(actions_array)) + ' actions')
     Session = sessionmaker(bind=engine)
     session = Session()
-    bulk_actions = []
-    for action in actions_array:
-        action_as_list = transform_action_object_to_list(action)
-        bulk_actions.append(action_as_list)
-    df = pd.DataFrame.from_records(bulk_actions, columns=ACTIONS_HEADER_ROW)
-    df['DatePK'] = pd.to_datetime(df['modifiedDatetime']).values.astype(np.int64) // 10 ** 6
-    df_dict = df.to_dict(orient='records')
+    rows = [transform_action_object_to_sql_row(action) for action in actions_array]
 
     try:
-        session.bulk_insert_mappings(actions_db, df_dict)
+        database.bulk_load(session.connection(), actions_db.__table__, ACTIONS_SQL_COLUMNS, rows)
     except KeyboardInterrupt:
         logger.warning('Interrupted by user, exiting.')
         session.rollback()
@@ -405,12 +637,10 @@ def save_exported_actions_to_db(logger, actions_array, settings, get_started):
         session.rollback()
         logger.warning('Something went wrong. Here are the details: {}'.format(ex))
     except IntegrityError as ex:
-        # If the bulk insert fails, we do a slower merge
+        # If the bulk insert fails, we replace the existing rows through a staging table
         logger.warning('Duplicate found, attempting to update')
         session.rollback()
-        for action in df_dict:
-            row_to_dict = actions_db(**action)
-            session.merge(row_to_dict)
+        database.upsert(session.connection(), actions_db.__table__, ACTIONS_SQL_COLUMNS, rows)
         logger.debug('Row successfully updated.')
     session.commit()
 
@@ -423,26 +653,21 @@ def save_exported_actions_to_csv_file(logger, export_path, actions_array):
     :param actions_array:   Array of action objects to be converted to CSV and saved to disk
     """
     if not actions_array:
-        logger.info('No actions returned after ' + get_last_successful_actions_export(logger))
         return
     filename = ACTIONS_EXPORT_FILENAME
     file_path = os.path.join(export_path, filename)
     logger.info('Exporting ' + str(len(actions_array)) + ' actions to ' + file_path)
-    if os.path.isfile(file_path):
-        actions_csv = open(file_path, 'ab')
+    write_header = not os.path.isfile(file_path)
+    with open(file_path, 'ab') as actions_csv:
         actions_csv_wr = csv.writer(actions_csv, dialect='excel', quoting=csv.QUOTE_ALL)
-    else:
-        actions_csv = open(file_path, 'wb')
-        actions_csv_wr = csv.writer(actions_csv, dialect='excel', quoting=csv.QUOTE_ALL)
-        actions_csv_wr.writerow([
-            'actionId', 'description', 'assignee', 'priority', 'priorityCode', 'status', 'statusCode', 'dueDatetime',
-            'audit', 'auditId', 'linkedToItem', 'linkedToItemId', 'creatorName', 'creatorId', 'createdDatetime',
-            'modifiedDatetime', 'completedDatetime'
-        ])
-    for action in actions_array:
-        actions_list = transform_action_object_to_list(action)
-        actions_csv_wr.writerow(actions_list)
-        del actions_list
+        if write_header:
+            actions_csv_wr.writerow([
+                'actionId', 'description', 'assignee', 'priority', 'priorityCode', 'status', 'statusCode',
+                'dueDatetime', 'audit', 'auditId', 'linkedToItem', 'linkedToItemId', 'creatorName', 'creatorId',
+                'createdDatetime', 'modifiedDatetime', 'completedDatetime'
+            ])
+        for action in actions_array:
+            actions_csv_wr.writerow(transform_action_object_to_list(action))
 
 
 def transform_action_object_to_list(action):
@@ -471,6 +696,23 @@ def transform_action_object_to_list(action):
     return actions_list
 
 
+def transform_action_object_to_sql_row(action):
+    """
+    :param action:  action object from the actions search
+    :return:        tuple of values in the order of ACTIONS_SQL_COLUMNS. Dates are datetimes, or None if missing, and
+                    DatePK is modifiedDatetime in milliseconds since the epoch, or 0 if missing.
+    """
+    action_as_list = transform_action_object_to_list(action)
+    for position in ACTIONS_DATETIME_POSITIONS:
+        action_as_list[position] = csvExporter.parse_date_time(action_as_list[position])
+    modified = action_as_list[ACTIONS_HEADER_ROW.index('modifiedDatetime')]
+    date_pk = 0
+    if modified is not None:
+        date_pk = calendar.timegm(modified.timetuple()) * 1000 + modified.microsecond // 1000
+    action_as_list.append(date_pk)
+    return tuple(action_as_list)
+
+
 def save_exported_media_to_file(logger, export_dir, media_file, filename, extension):
     """
     Write exported media item to disk at specified location with specified file name.
@@ -490,9 +732,11 @@ def save_exported_media_to_file(logger, export_dir, media_file, filename, extens
     try:
         with open(file_path, 'wb') as out_file:
             shutil.copyfileobj(media_file.raw, out_file)
-        del media_file
     except Exception as ex:
         log_critical_error(logger, ex, 'Exception while writing' + file_path + ' to file')
+    finally:
+        # Hand the pooled connection back to the SDK session even if the write failed
+        media_file.close()
 
 
 def save_exported_document(logger, export_dir, export_doc, filename, extension):
@@ -527,6 +771,295 @@ def update_sync_marker_file(date_modified):
         sync_marker_file.write(date_modified)
 
 
+class SyncMarkerTracker:
+    """
+    Advances the sync marker when audits finish out of order.
+
+    Audits are registered in discovery order (ascending modified_at). The sync marker file is only moved forward to
+    the modified_at of an audit once that audit and every audit registered before it have finished successfully. An
+    audit that is skipped or fails stops the marker for the rest of the run, so it is picked up again next sync.
+
+    Failures are counted per audit across syncs in FAILED_AUDITS_FILENAME. Once an audit has failed max_attempts
+    times it no longer stops the marker, so an audit that can never be exported does not make every later audit be
+    exported again on each sync.
+
+    Audits that finish successfully while the marker is held back are recorded in EXPORTED_AUDITS_FILENAME with their
+    modified_at, so the next sync skips them instead of appending their rows to the CSV export again. An audit leaves
+    the record once the marker moves past it.
+
+    Each audit is held once when it is registered; callers may add further holds for work that finishes later (such
+    as report downloads) and the audit only counts as finished once every hold is released.
+    """
+
+    def __init__(self, logger, max_attempts=DEFAULT_MAX_AUDIT_ATTEMPTS):
+        """
+        :param logger:          the logger
+        :param max_attempts:    number of failures after which an audit is skipped, 0 to never skip an audit
+        """
+        self.logger = logger
+        self.max_attempts = max_attempts
+        self.lock = threading.Lock()
+        self.audits = {}
+        self.next_index = 0
+        self.head = 0
+        self.blocked = False
+        self.failed_attempts = self.read_failed_attempts()
+        self.exported = self.read_exported()
+
+    def register(self, modified_at, audit_id):
+        """
+        :param modified_at:  modified_at of the next audit in discovery order
+        :param audit_id:     audit_id of the audit
+        :return:             index identifying the audit in later calls
+        """
+        with self.lock:
+            index = self.next_index
+            self.audits[index] = {'modified_at': modified_at, 'audit_id': audit_id, 'holds': 1, 'succeeded': True}
+            self.next_index += 1
+            return index
+
+    def is_exported(self, index):
+        """
+        :param index:  audit index returned by register
+        :return:       True if an earlier sync already exported the audit as it was last modified
+        """
+        with self.lock:
+            audit = self.audits[index]
+            return self.exported.get(audit['audit_id']) == audit['modified_at']
+
+    def hold(self, index):
+        """
+        Delay completion of an audit until a matching release
+        :param index:  audit index returned by register
+        """
+        with self.lock:
+            self.audits[index]['holds'] += 1
+
+    def release(self, index, succeeded=True):
+        """
+        Release one hold on an audit and move the sync marker forward as far as finished audits allow
+        :param index:      audit index returned by register
+        :param succeeded:  False if the work covered by this hold did not complete
+        """
+        with self.lock:
+            audit = self.audits[index]
+            audit['holds'] -= 1
+            audit['succeeded'] = audit['succeeded'] and succeeded
+            if audit['holds'] == 0:
+                self.count_attempt(audit)
+            last_modified = None
+            exported_changed = False
+            while not self.blocked and self.head in self.audits and self.audits[self.head]['holds'] == 0:
+                finished = self.audits.pop(self.head)
+                if not finished['succeeded']:
+                    attempts = self.failed_attempts.get(finished['audit_id'], 0)
+                    if self.max_attempts == 0 or attempts < self.max_attempts:
+                        self.blocked = True
+                        self.logger.info('Sync marker held back before audit modified at ' + finished['modified_at'])
+                        # audits that already finished behind the failed one
+                        for waiting in self.audits.values():
+                            exported_changed = self.record_exported(waiting) or exported_changed
+                        break
+                    self.logger.error('Audit {0} failed {1} times, skipping it and moving the sync marker past '
+                                      'it'.format(finished['audit_id'], attempts))
+                    del self.failed_attempts[finished['audit_id']]
+                    self.write_failed_attempts()
+                if self.exported.pop(finished['audit_id'], None) is not None:
+                    exported_changed = True
+                last_modified = finished['modified_at']
+                self.head += 1
+            if self.blocked and index in self.audits:
+                exported_changed = self.record_exported(audit) or exported_changed
+            if exported_changed:
+                self.write_exported()
+            if last_modified is not None:
+                self.logger.debug('setting last modified to ' + last_modified)
+                update_sync_marker_file(last_modified)
+
+    def record_exported(self, audit):
+        """
+        Remember an audit that finished successfully but cannot move the marker, so the next sync skips it
+        :param audit:  registered audit
+        :return:       True if the record changed
+        """
+        if audit['holds'] != 0 or not audit['succeeded'] or \
+                self.exported.get(audit['audit_id']) == audit['modified_at']:
+            return False
+        self.exported[audit['audit_id']] = audit['modified_at']
+        return True
+
+    def count_attempt(self, audit):
+        """
+        Record the outcome of a finished audit in the failure counts
+        :param audit:  registered audit whose holds have all been released
+        """
+        if audit['succeeded']:
+            if self.failed_attempts.pop(audit['audit_id'], None) is not None:
+                self.write_failed_attempts()
+            return
+        self.failed_attempts[audit['audit_id']] = self.failed_attempts.get(audit['audit_id'], 0) + 1
+        self.write_failed_attempts()
+
+    def read_failed_attempts(self):
+        """
+        :return:  dictionary of audit_id to the number of times the audit has failed, from FAILED_AUDITS_FILENAME
+        """
+        failed_attempts = {}
+        if os.path.isfile(FAILED_AUDITS_FILENAME):
+            with open(FAILED_AUDITS_FILENAME, 'r') as failed_audits_file:
+                for line in failed_audits_file:
+                    fields = line.split()
+                    if len(fields) == 2 and fields[1].isdigit():
+                        failed_attempts[fields[0]] = int(fields[1])
+        return failed_attempts
+
+    def read_exported(self):
+        """
+        :return:  dictionary of audit_id to the modified_at it was exported at, from EXPORTED_AUDITS_FILENAME
+        """
+        exported = {}
+        if os.path.isfile(EXPORTED_AUDITS_FILENAME):
+            with open(EXPORTED_AUDITS_FILENAME, 'r') as exported_audits_file:
+                for line in exported_audits_file:
+                    fields = line.split()
+                    if len(fields) == 2:
+                        exported[fields[0]] = fields[1]
+        return exported
+
+    def write_exported(self):
+        """
+        Replace the contents of EXPORTED_AUDITS_FILENAME with the audits exported while the marker is held back
+        """
+        try:
+            with open(EXPORTED_AUDITS_FILENAME, 'w') as exported_audits_file:
+                for audit_id, modified_at in sorted(self.exported.items()):
+                    exported_audits_file.write('{0} {1}\n'.format(audit_id, modified_at))
+        except Exception as ex:
+            log_critical_error(self.logger, ex, 'Unable to update ' + EXPORTED_AUDITS_FILENAME)
+
+    def write_failed_attempts(self):
+        """
+        Replace the contents of FAILED_AUDITS_FILENAME with the current failure counts
+        """
+        try:
+            with open(FAILED_AUDITS_FILENAME, 'w') as failed_audits_file:
+                for audit_id, attempts in sorted(self.failed_attempts.items()):
+                    failed_audits_file.write('{0} {1}\n'.format(audit_id, attempts))
+        except Exception as ex:
+            log_critical_error(self.logger, ex, 'Unable to update ' + FAILED_AUDITS_FILENAME)
+
+
+class SqlBatchWriter:
+    """
+    Buffers the database rows of many audits and commits them in a single transaction, instead of committing every
+    audit on its own.
+
+    The batch is committed once it holds batch_rows rows, or when an audit is added batch_seconds or more after the
+    first audit of the batch, and whenever flush is called. Each buffered audit is held in the SyncMarkerTracker until
+    its batch has been committed, so the sync marker never moves past an audit whose rows are not in the database.
+    An audit of batch_rows rows or more is not buffered but committed on its own while it is converted, a chunk at a
+    time.
+    """
+
+    def __init__(self, logger, engine, audit_table, sync_marker, batch_rows=DEFAULT_SQL_BATCH_ROWS,
+                 batch_seconds=DEFAULT_SQL_BATCH_SECONDS):
+        """
+        :param logger:          the logger
+        :param engine:          SQLAlchemy engine of the database
+        :param audit_table:     mapped class of the audit table, from sql_setup
+        :param sync_marker:     SyncMarkerTracker used to advance the sync marker
+        :param batch_rows:      commit once this many rows are buffered
+        :param batch_seconds:   commit once the first buffered audit has waited this many seconds
+        """
+        self.logger = logger
+        self.session_maker = sessionmaker(bind=engine)
+        self.audit_table = audit_table
+        self.sync_marker = sync_marker
+        self.batch_rows = batch_rows
+        self.batch_seconds = batch_seconds
+        self.lock = threading.RLock()
+        self.audits = []
+        self.row_count = 0
+        self.batch_started = None
+
+    def add(self, index, make_chunks):
+        """
+        Buffer the rows of an audit, committing the batch if it is full
+        :param index:           index of the audit in sync_marker
+        :param make_chunks:     callable returning the rows of the audit in chunks, as iter_sql_rows does. It is
+                                called again to upsert the rows of a large audit if some of them already exist.
+        """
+        rows = []
+        chunks = iter(make_chunks())
+        for chunk in chunks:
+            rows.extend(chunk)
+            if len(rows) >= self.batch_rows:
+                self.logger.debug('Committing an audit of {0} rows or more on its own'.format(self.batch_rows))
+                self.sync_marker.hold(index)
+                self.sync_marker.release(index, self.commit(itertools.chain([rows], chunks), make_chunks))
+                return
+        with self.lock:
+            self.sync_marker.hold(index)
+            self.audits.append((index, rows))
+            self.row_count += len(rows)
+            if self.batch_started is None:
+                self.batch_started = time.time()
+            if self.row_count >= self.batch_rows or time.time() - self.batch_started >= self.batch_seconds:
+                self.flush()
+
+    def flush(self):
+        """
+        Commit the buffered rows and release their audits in the sync marker tracker. Audits whose rows could not be
+        committed are released as failed, so they are exported again on the next sync.
+        """
+        with self.lock:
+            if not self.audits:
+                return
+            audits = self.audits
+            self.audits = []
+            self.row_count = 0
+            self.batch_started = None
+            self.logger.debug('Committing {0} rows of {1} audits'.format(sum(len(rows) for _, rows in audits),
+                                                                        len(audits)))
+            batch = [row for _, rows in audits for row in rows]
+            if self.commit([batch], lambda: [batch]):
+                succeeded = [True] * len(audits)
+            else:
+                # Commit the audits one at a time, so only the ones that fail are exported again
+                succeeded = [self.commit([rows], lambda: [rows]) for _, rows in audits]
+            for (index, _), audit_succeeded in zip(audits, succeeded):
+                self.sync_marker.release(index, audit_succeeded)
+
+    def commit(self, chunks, make_chunks):
+        """
+        Insert rows of one or more audits in a single transaction. If any of the rows already exist, all of them are
+        upserted through a staging table instead.
+        :param chunks:          lists of rows to insert
+        :param make_chunks:     callable returning the same chunks again, used to upsert them
+        :return:                True if the rows were committed
+        """
+        session = self.session_maker()
+        try:
+            try:
+                for rows in chunks:
+                    database.bulk_load(session.connection(), self.audit_table.__table__, SQL_COLUMNS, rows)
+                session.commit()
+            except IntegrityError:
+                self.logger.warning('Duplicate found, attempting to update')
+                session.rollback()
+                for rows in make_chunks():
+                    database.upsert(session.connection(), self.audit_table.__table__, SQL_COLUMNS, rows)
+                session.commit()
+                self.logger.debug('Rows successfully updated.')
+            return True
+        except Exception as ex:
+            session.rollback()
+            self.logger.warning('Something went wrong. Here are the details: {}'.format(ex))
+            return False
+        finally:
+            session.close()
+
+
 def get_last_successful(logger):
     """
     Read the date and time of the last successfully exported audit data from the sync marker file
@@ -583,6 +1116,41 @@ def get_last_successful_actions_export(logger):
     return last_successful_actions_export
 
 
+def get_actions_page_checkpoint(logger, last_successful_actions_export):
+    """
+    Read the offset reached by an earlier, interrupted export of the same actions
+    :param logger:                          the logger
+    :param last_successful_actions_export:  actions sync marker the export is searching from
+    :return:                                offset to resume the actions search from, 0 to start from the first page
+    """
+    if not os.path.isfile(ACTIONS_PAGE_CHECKPOINT_FILENAME):
+        return 0
+    with open(ACTIONS_PAGE_CHECKPOINT_FILENAME, 'r') as checkpoint_file:
+        checkpoint = checkpoint_file.read().split()
+    if len(checkpoint) == 2 and checkpoint[0] == last_successful_actions_export.strip() and checkpoint[1].isdigit():
+        logger.info('Resuming actions export from offset ' + checkpoint[1])
+        return int(checkpoint[1])
+    return 0
+
+
+def update_actions_page_checkpoint(logger, last_successful_actions_export, offset):
+    """
+    Record that every action before offset has been exported, so an interrupted export can resume from there
+    :param logger:                          the logger
+    :param last_successful_actions_export:  actions sync marker the export is searching from
+    :param offset:                          offset of the first action not yet exported, or None to clear the record
+    """
+    try:
+        if offset is None:
+            if os.path.isfile(ACTIONS_PAGE_CHECKPOINT_FILENAME):
+                os.remove(ACTIONS_PAGE_CHECKPOINT_FILENAME)
+            return
+        with open(ACTIONS_PAGE_CHECKPOINT_FILENAME, 'w') as checkpoint_file:
+            checkpoint_file.write(last_successful_actions_export.strip() + '\n' + str(offset))
+    except Exception as ex:
+        log_critical_error(logger, ex, 'Unable to update ' + ACTIONS_PAGE_CHECKPOINT_FILENAME)
+
+
 def parse_export_filename(audit_json, filename_item_id):
     """
     Get 'response' value of specified header item to use for export file name
@@ -700,6 +1268,18 @@ def load_config_settings(logger, path_to_config_file, docker_enabled):
             ALLOW_TABLE_CREATION: set_env_defaults('ALLOW_TABLE_CREATION', os.environ['ALLOW_TABLE_CREATION'], logger),
             ACTIONS_TABLE: 'iauditor_actions_data',
             ACTIONS_MERGE_ROWS: set_env_defaults('ACTIONS_MERGE_ROWS', os.environ['ACTIONS_MERGE_ROWS'], logger),
+            API_REQUESTS_PER_SECOND: load_setting_api_requests_per_second(
+                logger, os.environ.get('API_REQUESTS_PER_SECOND')),
+            REPORT_JOBS_IN_FLIGHT: load_setting_report_jobs_in_flight(
+                logger, os.environ.get('REPORT_JOBS_IN_FLIGHT')),
+            STREAM_AUDITS_LARGER_THAN_MB: load_setting_stream_audits_larger_than_mb(
+                logger, os.environ.get('STREAM_AUDITS_LARGER_THAN_MB')),
+            SQL_BATCH_ROWS: load_setting_sql_batch_rows(logger, os.environ.get('SQL_BATCH_ROWS')),
+            SQL_BATCH_SECONDS: load_setting_sql_batch_seconds(logger, os.environ.get('SQL_BATCH_SECONDS')),
+            MAX_AUDIT_ATTEMPTS: load_setting_max_audit_attempts(logger, os.environ.get('MAX_AUDIT_ATTEMPTS')),
+            DB_POOL_SIZE: load_setting_database_pool_size(logger, os.environ.get('DB_POOL_SIZE')),
+            DB_POOL_PRE_PING: load_setting_database_pool_pre_ping(logger, os.environ.get('DB_POOL_PRE_PING')),
+            DB_POOL_RECYCLE: load_setting_database_pool_recycle(logger, os.environ.get('DB_POOL_RECYCLE')),
             PREFERENCES: None,
             FILENAME_ITEM_ID: None,
             EXPORT_INACTIVE_ITEMS_TO_CSV: None
@@ -753,23 +1333,50 @@ def load_config_settings(logger, path_to_config_file, docker_enabled):
             MERGE_ROWS: config_settings['export_options']['merge_rows'],
             ALLOW_TABLE_CREATION: table_creation,
             ACTIONS_TABLE: config_settings['export_options']['sql_table']+'_actions',
-            ACTIONS_MERGE_ROWS: config_settings['export_options']['actions_merge_rows']
+            ACTIONS_MERGE_ROWS: config_settings['export_options']['actions_merge_rows'],
+            API_REQUESTS_PER_SECOND: load_setting_api_requests_per_second(
+                logger, config_settings['export_options'].get('api_requests_per_second')),
+            REPORT_JOBS_IN_FLIGHT: load_setting_report_jobs_in_flight(
+                logger, config_settings['export_options'].get('report_jobs_in_flight')),
+            STREAM_AUDITS_LARGER_THAN_MB: load_setting_stream_audits_larger_than_mb(
+                logger, config_settings['export_options'].get('stream_audits_larger_than_mb')),
+            SQL_BATCH_ROWS: load_setting_sql_batch_rows(
+                logger, config_settings['export_options'].get('sql_batch_rows')),
+            SQL_BATCH_SECONDS: load_setting_sql_batch_seconds(
+                logger, config_settings['export_options'].get('sql_batch_seconds')),
+            MAX_AUDIT_ATTEMPTS: load_setting_max_audit_attempts(
+                logger, config_settings['export_options'].get('max_audit_attempts')),
+            DB_POOL_SIZE: load_setting_database_pool_size(
+                logger, config_settings['export_options'].get('database_pool_size')),
+            DB_POOL_PRE_PING: load_setting_database_pool_pre_ping(
+                logger, config_settings['export_options'].get('database_pool_pre_ping')),
+            DB_POOL_RECYCLE: load_setting_database_pool_recycle(
+                logger, config_settings['export_options'].get('database_pool_recycle'))
         }
     return settings
 
 
-def configure(logger, path_to_config_file, export_formats, docker_enabled):
+def configure(logger, path_to_config_file, export_formats, docker_enabled, workers=DEFAULT_WORKERS,
+              actions_workers=DEFAULT_ACTIONS_WORKERS):
     """
     instantiate and configure logger, load config settings from file, instantiate SafetyCulture SDK
     :param logger:              the logger
     :param path_to_config_file: path to config file
     :param export_formats:      desired export formats
+    :param docker_enabled:      True to load settings from environment variables
+    :param workers:             number of audits to export at the same time
+    :param actions_workers:     number of pages of actions to fetch at the same time
     :return:                    instance of SafetyCulture SDK object, config settings
     """
 
     config_settings = load_config_settings(logger, path_to_config_file, docker_enabled)
     config_settings[EXPORT_FORMATS] = export_formats
-    sc_client = sp.SafetyCulture(config_settings[API_TOKEN])
+    config_settings[WORKERS] = workers
+    config_settings[ACTIONS_WORKERS] = actions_workers
+    # Every worker needs its own pooled connection, plus headroom for the media and report downloads it makes
+    sc_client = sp.SafetyCulture(config_settings[API_TOKEN],
+                                 pool_maxsize=max(sp.DEFAULT_POOL_MAXSIZE, workers * 2, actions_workers),
+                                 requests_per_second=config_settings[API_REQUESTS_PER_SECOND])
 
     if config_settings[EXPORT_PATH] is not None:
         if config_settings[CONFIG_NAME] is not None:
@@ -799,6 +1406,9 @@ def parse_command_line_arguments(logger):
                     export_formats passed as argument if any, else 'pdf'
                     list_preferences if passed as argument, else None
                     do_loop False if passed as argument, else True
+                    docker_enabled True if passed as argument, else False
+                    workers passed as argument if any, else DEFAULT_WORKERS
+                    actions_workers passed as argument if any, else DEFAULT_ACTIONS_WORKERS
     """
     parser = argparse.ArgumentParser()
     parser.add_argument('--config', help='config file to use, defaults to ' + DEFAULT_CONFIG_FILENAME)
@@ -808,6 +1418,12 @@ def parse_command_line_arguments(logger):
     parser.add_argument('--list_preferences', nargs='*', help='display all preferences, or restrict to specific'
                                                                   ' template_id if supplied as additional argument')
     parser.add_argument('--loop', nargs='*', help='execute continuously until interrupted')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help='number of audits to fetch and export at the same time, defaults to ' +
+                             str(DEFAULT_WORKERS))
+    parser.add_argument('--actions_workers', type=int, default=DEFAULT_ACTIONS_WORKERS,
+                        help='number of pages of actions to fetch at the same time, defaults to ' +
+                             str(DEFAULT_ACTIONS_WORKERS))
     parser.add_argument('--setup', action='store_true', help='Automatically create new directory containing the '
                                                              'necessary config file.'
                                                              'Directory will be named iAuditor Audit Exports, and will '
@@ -845,7 +1461,18 @@ def parse_command_line_arguments(logger):
     loop_enabled = True if args.loop is not None else False
     docker_enabled = True if args.docker is not None else False
 
-    return config_filename, export_formats, args.list_preferences, loop_enabled, docker_enabled
+    workers = args.workers
+    if workers < 1:
+        logger.info('invalid number of workers: {0}, defaulting to {1}'.format(workers, DEFAULT_WORKERS))
+        workers = DEFAULT_WORKERS
+    actions_workers = args.actions_workers
+    if actions_workers < 1:
+        logger.info('invalid number of actions workers: {0}, defaulting to {1}'.format(actions_workers,
+                                                                                        DEFAULT_ACTIONS_WORKERS))
+        actions_workers = DEFAULT_ACTIONS_WORKERS
+
+    return config_filename, export_formats, args.list_preferences, loop_enabled, docker_enabled, workers, \
+        actions_workers
 
 
 def initial_setup(logger):
@@ -947,15 +1574,28 @@ def export_actions(logger, settings, sc_client, get_started):
 
     logger.info('Exporting iAuditor actions')
     last_successful_actions_export = get_last_successful_actions_export(logger)
-    actions_array = sc_client.get_audit_actions(last_successful_actions_export)
-    if actions_array is not None:
-        logger.info('Found ' + str(len(actions_array)) + ' actions')
-        if not get_started:
-            save_exported_actions_to_csv_file(logger, settings[EXPORT_PATH], actions_array)
-        else:
-            save_exported_actions_to_db(logger, actions_array, settings, get_started)
-        utc_iso_datetime_now = datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.000Z')
-        update_actions_sync_marker_file(logger, utc_iso_datetime_now)
+    # Taken before searching so actions modified while the export runs are picked up again by the next one
+    utc_iso_datetime_now = datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.000Z')
+    offset = get_actions_page_checkpoint(logger, last_successful_actions_export)
+    total = 0
+    try:
+        for page in sc_client.iter_audit_actions(last_successful_actions_export, offset,
+                                                 concurrency=settings.get(ACTIONS_WORKERS, DEFAULT_ACTIONS_WORKERS)):
+            if not total:
+                total = page['total']
+                logger.info('Found ' + str(total) + ' actions')
+            if not get_started:
+                save_exported_actions_to_csv_file(logger, settings[EXPORT_PATH], page['actions'])
+            else:
+                save_exported_actions_to_db(logger, page['actions'], settings, get_started)
+            update_actions_page_checkpoint(logger, last_successful_actions_export, page['offset'] + page['count'])
+    except sp.ActionsSearchError as ex:
+        log_critical_error(logger, ex, 'Actions export incomplete, it will resume on the next sync')
+        return
+    if not total:
+        logger.info('No actions returned after ' + last_successful_actions_export)
+    update_actions_sync_marker_file(logger, utc_iso_datetime_now)
+    update_actions_page_checkpoint(logger, last_successful_actions_export, None)
 
 
 def sync_exports(logger, settings, sc_client):
@@ -986,6 +1626,7 @@ def sync_exports(logger, settings, sc_client):
                                              'doc_creation'}):
         return
     last_successful = get_last_successful(logger)
+    ids_to_search = None
     if settings[TEMPLATE_IDS] is not None:
         if settings[TEMPLATE_IDS].endswith('.txt'):
             file = settings[TEMPLATE_IDS].strip()
@@ -997,55 +1638,174 @@ def sync_exports(logger, settings, sc_client):
             ids_to_search = settings[TEMPLATE_IDS].split(",")
         else:
             ids_to_search = [settings[TEMPLATE_IDS][0]]
-        list_of_audits = sc_client.discover_audits(modified_after=last_successful, template_id=ids_to_search, completed=completed_setting, archived=archived_setting)
-    else:
-        list_of_audits = sc_client.discover_audits(modified_after=last_successful,completed=completed_setting,archived=archived_setting)
+    media_sync_cutoff = get_media_sync_cutoff(settings)
+    logger.info('Audits modified after {0} will be exported on a later sync, once their media has synced'.format(
+        media_sync_cutoff))
+    pages_of_audits = sc_client.iter_audits(modified_after=last_successful, template_id=ids_to_search,
+                                            completed=completed_setting, archived=archived_setting,
+                                            modified_before=media_sync_cutoff)
+    list_of_audits = next(pages_of_audits, None)
     if list_of_audits is not None:
         logger.info(str(list_of_audits['total']) + ' audits discovered')
         export_count = 1
         export_total = list_of_audits['total']
+        audits = itertools.chain(list_of_audits['audits'],
+                                 (audit for page in pages_of_audits for audit in page['audits']))
         get_started = 'ignored'
+        sync_marker = SyncMarkerTracker(logger, settings[MAX_AUDIT_ATTEMPTS])
+        sql_writer = None
         for export_format in settings[EXPORT_FORMATS]:
             if export_format == 'sql':
                 get_started = sql_setup(logger, settings, 'audit')
+                sql_writer = SqlBatchWriter(logger, get_started[1], get_started[4], sync_marker,
+                                            settings[SQL_BATCH_ROWS], settings[SQL_BATCH_SECONDS])
             elif export_format in ['pickle']:
                 get_started = ['complete', 'complete']
+                if importlib.util.find_spec('pandas') is None:
+                    logger.error('The pickle format requires pandas. Install it with: pip install pandas')
+                    sys.exit(1)
                 if export_format == 'pickle' and os.path.isfile('{}.pkl'.format(settings[SQL_TABLE])):
                     logger.error(
                         'The Pickle file already exists. Appending to Pickles isn\'t currently possible, please '
                         'remove {}.pkl and try again.'.format(
                             settings[SQL_TABLE]))
                     sys.exit(0)
-        for audit in list_of_audits['audits']:
+        report_scheduler = None
+        if {'pdf', 'docx'} & set(settings[EXPORT_FORMATS]):
+            report_scheduler = sp.ReportScheduler(sc_client, max_in_flight=settings[REPORT_JOBS_IN_FLIGHT])
+            report_scheduler.start()
+        try:
+            if settings[WORKERS] > 1:
+                process_audits_concurrently(logger, settings, sc_client, audits, export_total,
+                                            get_started, sync_marker, report_scheduler, sql_writer)
+            else:
+                for audit in audits:
+                    logger.info('Processing audit (' + str(export_count) + '/' + str(export_total) + ')')
+                    process_audit_and_release(logger, settings, sc_client, audit, get_started, sync_marker,
+                                              sync_marker.register(audit['modified_at'], audit['audit_id']),
+                                              report_scheduler,
+                                              sql_writer)
+                    export_count += 1
+        finally:
+            pages_of_audits.close()
+            if sql_writer is not None:
+                sql_writer.flush()
+            if report_scheduler is not None:
+                logger.info('Waiting for outstanding PDF and Word reports')
+                report_scheduler.close()
+                report_scheduler.join()
+
+
+def process_audits_concurrently(logger, settings, sc_client, audits, export_total, get_started, sync_marker,
+                                report_scheduler=None, sql_writer=None):
+    """
+    Fetch and export audits on a bounded pool of worker threads. At most twice as many audits as there are workers
+    are queued at any time, and the sync marker only advances past audits whose predecessors have all finished.
+    :param logger:          the logger
+    :param settings:        Settings from command line and configuration file
+    :param sc_client:       instance of safetypy.SafetyCulture class
+    :param audits:          audits to export, in ascending modified_at order
+    :param export_total:    number of audits discovered, used for progress logging
+    :param get_started:     result of sql_setup, or a placeholder when not exporting to a database
+    :param sync_marker:     SyncMarkerTracker used to advance the sync marker
+    :param report_scheduler:    ReportScheduler generating PDF and Word reports, if any
+    :param sql_writer:          SqlBatchWriter buffering database rows, if exporting to a database
+    """
+    workers = settings[WORKERS]
+    queue_slots = threading.BoundedSemaphore(workers * 2)
+    logger.info('Exporting audits with ' + str(workers) + ' workers')
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for export_count, audit in enumerate(audits, 1):
+            queue_slots.acquire()
             logger.info('Processing audit (' + str(export_count) + '/' + str(export_total) + ')')
-            process_audit(logger, settings, sc_client, audit, get_started)
-            export_count += 1
+            future = executor.submit(process_audit_and_release, logger, settings, sc_client, audit, get_started,
+                                     sync_marker, sync_marker.register(audit['modified_at'], audit['audit_id']),
+                                     report_scheduler,
+                                     sql_writer)
+            future.add_done_callback(lambda _: queue_slots.release())
+
+
+def process_audit_and_release(logger, settings, sc_client, audit, get_started, sync_marker, index,
+                              report_scheduler=None, sql_writer=None):
+    """
+    Export a single audit and report the outcome to the sync marker tracker. PDF and Word reports are queued on
+    report_scheduler if one is given and hold the audit in the tracker until they have been saved. Likewise, database
+    rows are buffered on sql_writer if one is given and hold the audit until they have been committed. An audit that
+    an earlier sync already exported, while the sync marker was held back, is skipped.
+    :param logger:          the logger
+    :param settings:        Settings from command line and configuration file
+    :param sc_client:       instance of safetypy.SafetyCulture class
+    :param audit:           Audit JSON from audit discovery
+    :param get_started:     result of sql_setup, or a placeholder when not exporting to a database
+    :param sync_marker:     SyncMarkerTracker used to advance the sync marker
+    :param index:           index of the audit in sync_marker
+    :param report_scheduler:    ReportScheduler generating PDF and Word reports, if any
+    :param sql_writer:          SqlBatchWriter buffering database rows, if any
+    """
+    if sync_marker.is_exported(index):
+        logger.info('Audit ' + audit['audit_id'] + ' was exported by an earlier sync, skipping it')
+        sync_marker.release(index, True)
+        return
+    schedule_report = None
+    if report_scheduler is not None:
+        schedule_report = functools.partial(schedule_audit_report, logger, settings, report_scheduler, sync_marker,
+                                            index)
+    write_sql_rows = None
+    if sql_writer is not None:
+        write_sql_rows = functools.partial(sql_writer.add, index)
+    succeeded = False
+    try:
+        succeeded = process_audit(logger, settings, sc_client, audit, get_started, schedule_report, write_sql_rows)
+    except Exception as ex:
+        log_critical_error(logger, ex, 'Exception while exporting audit ' + audit['audit_id'])
+    finally:
+        sync_marker.release(index, succeeded)
+
+
+def schedule_audit_report(logger, settings, report_scheduler, sync_marker, index, audit_id, preference_id,
+                          export_format, export_filename):
+    """
+    Queue a PDF or Word report on the report scheduler. The audit is held in the sync marker tracker until the
+    report has been saved to disk.
+    :param logger:              The logger
+    :param settings:            Settings from command line and configuration file
+    :param report_scheduler:    ReportScheduler generating the report
+    :param sync_marker:         SyncMarkerTracker used to advance the sync marker
+    :param index:               index of the audit in sync_marker
+    :param audit_id:            Unique audit UUID
+    :param preference_id:       Unique preference UUID
+    :param export_format:       'pdf' or 'docx' string
+    :param export_filename:     String indicating what to name the exported audit file
+    """
+    def save_report(export_doc):
+        succeeded = False
+        try:
+            if export_doc is None:
+                logger.error('Unable to export {0} report for {1}, it will be retried on the next sync'.format(
+                    export_format, audit_id))
+            else:
+                save_exported_document(logger, settings[EXPORT_PATH], export_doc, export_filename, export_format)
+                succeeded = True
+        finally:
+            sync_marker.release(index, succeeded)
+
+    sync_marker.hold(index)
+    report_scheduler.submit(audit_id, preference_id, export_format, save_report)
 
 
-def check_if_media_sync_offset_satisfied(logger, settings, audit):
+def get_media_sync_cutoff(settings):
     """
-    Check if the media sync offset is satisfied. The media sync offset is a duration in seconds specified in the
-    configuration file. This duration is the amount of time audit media is given to sync up with SafetyCulture servers
-    before this tool exports the audit data.
-    :param logger:    The logger
+    Audits modified after the cutoff are left for a later sync cycle. The media sync offset is a duration in seconds
+    specified in the configuration file. This duration is the amount of time audit media is given to sync up with
+    SafetyCulture servers before this tool exports the audit data.
     :param settings:  Settings from command line and configuration file
-    :param audit:     Audit JSON
-    :return:          Boolean - True if the media sync offset is satisfied, otherwise, returns false.
-    """
-    modified_at = dateutil.parser.parse(audit['modified_at'])
-    now = datetime.utcnow()
-    elapsed_time_difference = (pytz.utc.localize(now) - modified_at)
-    # if the media_sync_offset has been satisfied
-    if not elapsed_time_difference > timedelta(seconds=settings[MEDIA_SYNC_OFFSET_IN_SECONDS]):
-        logger.info(
-            'Audit {0} modified too recently, some media may not have completed syncing. '
-            'Skipping export until next sync cycle'.format(
-                audit['audit_id']))
-        return False
-    return True
+    :return:          UTC timestamp, now minus the media sync offset, in the format used by audit discovery
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=settings[MEDIA_SYNC_OFFSET_IN_SECONDS])
+    return cutoff.strftime('%Y-%m-%dT%H:%M:%S.') + '{0:03d}Z'.format(cutoff.microsecond // 1000)
 
 
-def process_audit(logger, settings, sc_client, audit, get_started):
+def process_audit(logger, settings, sc_client, audit, get_started, schedule_report=None, write_sql_rows=None):
     """
     Export audit in the format specified in settings. Formats include PDF, JSON, CSV, MS Word (docx), media, or
     web report link.
@@ -1053,12 +1813,70 @@ def process_audit(logger, settings, sc_client, audit, get_started):
     :param settings:    Settings from command line and configuration file
     :param sc_client:   instance of safetypy.SafetyCulture class
     :param audit:       Audit JSON to be exported
+    :param schedule_report: if given, called to queue PDF and Word reports instead of waiting for each one
+    :param write_sql_rows:  if given, called with the database rows of the audit instead of committing them
+    :return:            True if the audit was exported, False if it was skipped
     """
-    if not check_if_media_sync_offset_satisfied(logger, settings, audit):
-        return
     audit_id = audit['audit_id']
     logger.info('downloading ' + audit_id)
-    audit_json = sc_client.get_audit(audit_id)
+    if settings.get(STREAM_AUDITS_LARGER_THAN_MB) is not None:
+        audit_json = download_audit(logger, settings, sc_client, audit_id)
+    else:
+        audit_json = sc_client.get_audit(audit_id)
+    if audit_json is None:
+        logger.error('Unable to download audit ' + audit_id + ', it will be retried on the next sync')
+        return False
+    try:
+        export_audit(logger, settings, sc_client, audit_json, audit_id, get_started, schedule_report, write_sql_rows)
+    finally:
+        if isinstance(audit_json, csvExporter.StreamedAudit):
+            os.remove(audit_json.audit_file_path)
+    return True
+
+
+def download_audit(logger, settings, sc_client, audit_id):
+    """
+    Download an audit to a temporary file. Audits larger than stream_audits_larger_than_mb are parsed incrementally,
+    so their items are never all held in memory; smaller ones are loaded as usual.
+    :param logger:      The logger
+    :param settings:    Settings from command line and configuration file
+    :param sc_client:   instance of safetypy.SafetyCulture class
+    :param audit_id:    Unique audit UUID
+    :return:            csvExporter.StreamedAudit, whose file the caller must remove, audit JSON, or None if the
+                        download failed
+    """
+    audit_file, audit_file_path = tempfile.mkstemp(prefix=audit_id + '_', suffix='.json')
+    streamed = False
+    try:
+        with os.fdopen(audit_file, 'wb') as audit_file:
+            if not sc_client.download_audit(audit_id, audit_file):
+                return None
+        if os.path.getsize(audit_file_path) > settings[STREAM_AUDITS_LARGER_THAN_MB]:
+            logger.info('Parsing {0} incrementally ({1:.1f} MB)'.format(
+                audit_id, os.path.getsize(audit_file_path) / 1024 / 1024))
+            audit_json = csvExporter.StreamedAudit(audit_file_path)
+            streamed = True
+            return audit_json
+        with open(audit_file_path, 'rb') as audit_file:
+            return sc_client.parse_json(audit_file.read())
+    finally:
+        if not streamed:
+            os.remove(audit_file_path)
+
+
+def export_audit(logger, settings, sc_client, audit_json, audit_id, get_started, schedule_report=None,
+                 write_sql_rows=None):
+    """
+    Export a downloaded audit in the formats specified in settings
+    :param logger:      The logger
+    :param settings:    Settings from command line and configuration file
+    :param sc_client:   instance of safetypy.SafetyCulture class
+    :param audit_json:  Audit JSON, or csvExporter.StreamedAudit
+    :param audit_id:    Unique audit UUID
+    :param get_started: result of sql_setup, or a placeholder when not exporting to a database
+    :param schedule_report: if given, called to queue PDF and Word reports instead of waiting for each one
+    :param write_sql_rows:  if given, called with the database rows of the audit instead of committing them
+    """
     template_id = audit_json['template_id']
     preference_id = None
     if settings[PREFERENCES] is not None and template_id in settings[PREFERENCES].keys():
@@ -1066,12 +1884,17 @@ def process_audit(logger, settings, sc_client, audit, get_started):
     export_filename = parse_export_filename(audit_json, settings[FILENAME_ITEM_ID]) or audit_id
     for export_format in settings[EXPORT_FORMATS]:
         if export_format in ['pdf', 'docx']:
-             export_audit_pdf_word(logger, sc_client, settings, audit_id, preference_id, export_format, export_filename)
+            if schedule_report is not None:
+                schedule_report(audit_id, preference_id, export_format, export_filename)
+            else:
+                export_audit_pdf_word(logger, sc_client, settings, audit_id, preference_id, export_format,
+                                      export_filename)
 
         elif export_format == 'json':
             export_audit_json(logger, settings, audit_json, export_filename)
         elif export_format == 'csv':
-            export_audit_csv(settings, audit_json)
+            with EXPORT_SINK_LOCK:
+                export_audit_csv(settings, audit_json)
         elif export_format == 'doc_creation':
             print('Not currently implemented')
             sys.exit()
@@ -1082,7 +1905,8 @@ def process_audit(logger, settings, sc_client, audit, get_started):
         #     export_template_creation(logger, settings, audit_json)
         elif export_format in ['sql', 'pickle']:
             if get_started[0] == 'complete':
-                export_audit_pandas(logger, settings, audit_json, get_started)
+                with EXPORT_SINK_LOCK:
+                    export_audit_pandas(logger, settings, audit_json, get_started, write_sql_rows)
             elif get_started[0] != 'complete':
                 logger.error('Something went wrong connecting to the database, please check your settings.')
                 sys.exit(1)
@@ -1090,8 +1914,6 @@ def process_audit(logger, settings, sc_client, audit, get_started):
             export_audit_media(logger, sc_client, settings, audit_json, audit_id, export_filename)
         elif export_format == 'web-report-link':
             export_audit_web_report_link(logger, settings, sc_client, audit_json, audit_id, template_id)
-    logger.debug('setting last modified to ' + audit['modified_at'])
-    update_sync_marker_file(audit['modified_at'])
 
 
 def export_audit_pdf_word(logger, sc_client, settings, audit_id, preference_id, export_format, export_filename):
@@ -1118,6 +1940,14 @@ def export_audit_json(logger, settings, audit_json, export_filename):
     :param export_filename:     String indicating what to name the exported audit file
     """
     export_format = 'json'
+    if isinstance(audit_json, csvExporter.StreamedAudit):
+        # Copied as downloaded rather than re-indented, to avoid loading every item into memory
+        file_path = os.path.join(settings[EXPORT_PATH], export_filename + '.' + export_format)
+        try:
+            shutil.copyfile(audit_json.audit_file_path, file_path)
+        except Exception as ex:
+            log_critical_error(logger, ex, 'Exception while writing' + file_path + ' to file')
+        return
     export_doc = json.dumps(audit_json, indent=4)
     save_exported_document(logger, settings[EXPORT_PATH], export_doc.encode(), export_filename, export_format)
 
@@ -1129,8 +1959,7 @@ def export_audit_csv(settings, audit_json):
     :param audit_json:  Audit JSON
     """
 
-    csv_exporter = csvExporter.CsvExporter(audit_json, settings[EXPORT_INACTIVE_ITEMS_TO_CSV])
-    count = 0
+    csv_exporter = csvExporter.CsvExporter(audit_json, settings[EXPORT_INACTIVE_ITEMS_TO_CSV], eager=False)
     if settings[USE_REAL_TEMPLATE_NAME] is False:
         csv_export_filename = audit_json['template_id']
     elif settings[USE_REAL_TEMPLATE_NAME] is True:
@@ -1141,16 +1970,33 @@ def export_audit_csv(settings, audit_json):
     else:
         csv_export_filename = audit_json['template_id']
 
-    for row in csv_exporter.audit_table:
-        count += 1
-        row[0] = count
-
     # if settings[CONFIG_NAME] is not None:
     #     csv_exporter.append_converted_audit_to_bulk_export_file(
     #         os.path.join(settings[EXPORT_PATH], settings[CONFIG_NAME], csv_export_filename + '.csv'))
     # else:
-    csv_exporter.append_converted_audit_to_bulk_export_file(
-        os.path.join(settings[EXPORT_PATH], csv_export_filename + '.csv'))
+    csv_exporter.append_rows_to_bulk_export_file(os.path.join(settings[EXPORT_PATH], csv_export_filename + '.csv'),
+                                                 csvExporter.number_rows(csv_exporter.iter_rows()))
+
+
+def get_table_class(action_or_audit, table, merge):
+    """
+    Build the mapped class of the audit or actions table once, and reuse it for every later sync
+    :param action_or_audit: 'audit' or 'actions'
+    :param table:           name of the table
+    :param merge:           merge_rows or actions_merge_rows setting, which decides the primary key
+    :return:                mapped class from model.set_table or model.set_actions_table
+    """
+    key = (action_or_audit, table, merge)
+    table_class = SQL_TABLE_CLASSES.get(key)
+    if table_class is None or Base.metadata.tables.get(table) is not table_class.__table__:
+        if table in Base.metadata.tables:
+            Base.metadata.remove(Base.metadata.tables[table])
+        if action_or_audit == 'audit':
+            table_class = set_table(table, merge)
+        else:
+            table_class = set_actions_table(table, merge)
+        SQL_TABLE_CLASSES[key] = table_class
+    return table_class
 
 
 def sql_setup(logger, settings, action_or_audit):
@@ -1164,20 +2010,18 @@ def sql_setup(logger, settings, action_or_audit):
     else:
         actions_merge = False
 
-    Base.metadata.clear()
-
     if action_or_audit == 'audit':
         if settings[SQL_TABLE] is not None:
             table = settings[SQL_TABLE]
         else:
             table = 'iauditor_data'
-        Database = set_table(table, merge)
+        Database = get_table_class(action_or_audit, table, merge)
     elif action_or_audit == 'actions':
         if settings[ACTIONS_TABLE] is not None:
             table = settings[ACTIONS_TABLE]
         else:
             table = 'iauditor_actions_data'
-        ActionsDatabase = set_actions_table(table, actions_merge)
+        ActionsDatabase = get_table_class(action_or_audit, table, actions_merge)
     else:
         print('No Match')
         sys.exit()
@@ -1188,11 +2032,13 @@ def sql_setup(logger, settings, action_or_audit):
                                                      settings[DB_PORT],
                                                      settings[DB_NAME])
 
-    engine = create_engine(connection_string)
+    engine = database.ENGINE_REGISTRY.get_engine(connection_string, settings.get(DB_POOL_SIZE),
+                                                 settings.get(DB_POOL_PRE_PING, DEFAULT_DATABASE_POOL_PRE_PING),
+                                                 settings.get(DB_POOL_RECYCLE, DEFAULT_DATABASE_POOL_RECYCLE))
     meta = MetaData()
     logger.debug('Making connection to ' + str(engine))
     if action_or_audit == 'audit':
-        if not engine.dialect.has_table(engine, settings[SQL_TABLE], schema=settings[DB_SCHEMA]):
+        if not database.ENGINE_REGISTRY.has_table(engine, settings[SQL_TABLE], schema=settings[DB_SCHEMA]):
             logger.info(settings[SQL_TABLE] + ' not Found.')
             if settings[ALLOW_TABLE_CREATION] == 'true':
                 Database.__table__.create(engine)
@@ -1215,7 +2061,7 @@ def sql_setup(logger, settings, action_or_audit):
         setup = 'complete'
         logger.info('Successfully setup Database and connection')
     else:
-        if not engine.dialect.has_table(engine, settings[ACTIONS_TABLE], schema=settings[DB_SCHEMA]):
+        if not database.ENGINE_REGISTRY.has_table(engine, settings[ACTIONS_TABLE], schema=settings[DB_SCHEMA]):
             logger.info(settings[ACTIONS_TABLE] + ' not Found.')
             if settings[ALLOW_TABLE_CREATION] == 'true':
                 ActionsDatabase.__table__.create(engine)
@@ -1244,31 +2090,29 @@ def sql_setup(logger, settings, action_or_audit):
         return setup, engine, connection_string, meta, ActionsDatabase
 
 
-def export_audit_sql(logger, settings, audit_json, get_started):
+def export_audit_sql(logger, settings, audit_json, get_started, write_sql_rows=None):
     """
     Save audit to a database.
     :param logger:      The logger
     :param settings:    Settings from command line and configuration file
     :param audit_json:  Audit JSON
+    :param write_sql_rows:  if given, called with a function returning the rows of the audit in chunks, such as
+                            SqlBatchWriter.add, instead of committing them here
     """
     engine = get_started[1]
-    database = get_started[4]
+    audit_table = get_started[4]
     
-    csv_exporter = csvExporter.CsvExporter(audit_json, settings[EXPORT_INACTIVE_ITEMS_TO_CSV])
-    df = csv_exporter.audit_table
-    df = pd.DataFrame.from_records(df, columns=SQL_HEADER_ROW)
-    df['DatePK'] = pd.to_datetime(df['DateModified']).values.astype(np.int64) // 10 ** 6
-    # df.replace({'DateCompleted': ''}, '1900-01-01 00:00:00', inplace=True)
-    df.replace({'ItemScore': '', 'ItemMaxScore': '', 'ItemScorePercentage': ''}, np.nan, inplace=True)
-    df.fillna(0, inplace=True)
-    df['SortingIndex'] = range(1, len(df) + 1)
-    df_dict = df.to_dict(orient='records')
+    csv_exporter = csvExporter.CsvExporter(audit_json, settings[EXPORT_INACTIVE_ITEMS_TO_CSV], eager=False)
+    if write_sql_rows is not None:
+        write_sql_rows(functools.partial(iter_sql_rows, csv_exporter))
+        return
 
     Session = sessionmaker(bind=engine)
     session = Session()
 
     try:
-        session.bulk_insert_mappings(database, df_dict)
+        for rows in iter_sql_rows(csv_exporter):
+            database.bulk_load(session.connection(), audit_table.__table__, SQL_COLUMNS, rows)
     except KeyboardInterrupt:
         logger.warning('Interrupted by user, exiting.')
         session.rollback()
@@ -1277,34 +2121,61 @@ def export_audit_sql(logger, settings, audit_json, get_started):
         session.rollback()
         logger.warning('Something went wrong. Here are the details: {}'.format(ex))
     except IntegrityError as ex:
-        # If the bulk insert fails, we do a slower merge
+        # If the bulk insert fails, we replace the existing rows through a staging table
         logger.warning('Duplicate found, attempting to update')
         session.rollback()
-        for row in df_dict:
-            row_to_dict = database(**row)
-            session.merge(row_to_dict)
+        for rows in iter_sql_rows(csv_exporter):
+            database.upsert(session.connection(), audit_table.__table__, SQL_COLUMNS, rows)
         logger.debug('Row successfully updated.')
     session.commit()
 
 
-def export_audit_pandas(logger, settings, audit_json, get_started):
+def iter_sql_rows(csv_exporter, chunk_size=SQL_CHUNK_SIZE):
+    """
+    Convert an audit to database rows, chunk_size rows at a time, so only one chunk of a large audit is held in
+    memory at once
+    :param csv_exporter:    CsvExporter of the audit, created with eager=False
+    :param chunk_size:      maximum number of rows in each chunk
+    :return:                lists of tuples of typed values in the order of SQL_COLUMNS, one per row
+    """
+    for audit_columns in csv_exporter.iter_column_chunks(chunk_size):
+        date_modified = audit_columns['DateModified'][0] if audit_columns['DateModified'] else None
+        audit_columns['DatePK'] = [get_date_pk(date_modified)] * len(audit_columns['DateModified'])
+        for column_name, values in audit_columns.items():
+            if column_name not in csvExporter.DATETIME_COLUMNS and None in values:
+                audit_columns[column_name] = [0 if value is None else value for value in values]
+        yield list(zip(*[audit_columns[column_name] for column_name in SQL_COLUMNS]))
+
+
+def get_date_pk(date_modified):
+    """
+    :param date_modified:   DateModified of the audit as a datetime, or None
+    :return:                DatePK of the audit rows: DateModified, to the second, in milliseconds since the epoch
+    """
+    if date_modified is None:
+        return 0
+    return calendar.timegm(date_modified.timetuple()) * 1000
+
+
+def export_audit_pandas(logger, settings, audit_json, get_started, write_sql_rows=None):
     """
     Save audit to a database.
     :param logger:      The logger
     :param settings:    Settings from command line and configuration file
     :param audit_json:  Audit JSON
+    :param write_sql_rows:  see export_audit_sql
     """
 
     for export_format in settings[EXPORT_FORMATS]:
         if export_format == 'sql':
-            export_audit_sql(logger, settings, audit_json, get_started)
+            export_audit_sql(logger, settings, audit_json, get_started, write_sql_rows)
 
         elif export_format == 'pickle':
+            # pandas is only imported for this format, as importing it takes longer than exporting most audits
+            import pandas as pd
             logger.info('Writing to Pickle')
-            csv_exporter = csvExporter.CsvExporter(audit_json, settings[EXPORT_INACTIVE_ITEMS_TO_CSV])
-            df = csv_exporter.audit_table
-            df = pd.DataFrame.from_records(df, columns=SQL_HEADER_ROW)
-            df.replace({'ItemScore': '', 'ItemMaxScore': '', 'ItemScorePercentage': ''}, np.nan, inplace=True)
+            csv_exporter = csvExporter.CsvExporter(audit_json, settings[EXPORT_INACTIVE_ITEMS_TO_CSV], columnar=True)
+            df = pd.DataFrame(csv_exporter.audit_columns, columns=SQL_HEADER_ROW)
             df.fillna(value={'Latitude': 0, 'Longitude': 0}, inplace=True)
             df.to_pickle('{}.pkl'.format(settings[SQL_TABLE]))
 
@@ -1392,7 +2263,8 @@ def export_audit_web_report_link(logger, settings, sc_client, audit_json, audit_
         csvExporter.get_json_property(audit_json, 'audit_data', 'name'),
         web_report_link
     ]
-    save_web_report_link_to_file(logger, settings[EXPORT_PATH], web_report_data)
+    with EXPORT_SINK_LOCK:
+        save_web_report_link_to_file(logger, settings[EXPORT_PATH], web_report_data)
 
 
 def get_media_from_audit(logger, audit_json):
@@ -1403,7 +2275,7 @@ def get_media_from_audit(logger, audit_json):
     :return: list of media IDs
     """
     media_id_list = []
-    for item in audit_json['header_items'] + audit_json['items']:
+    for item in itertools.chain(audit_json['header_items'], audit_json['items']):
         # This condition checks for media attached to question and media type fields.
         if 'media' in item.keys():
             for media in item['media']:
@@ -1486,13 +2358,22 @@ def loop(logger, sc_client, settings):
 def main():
     try:
         logger = configure_logger()
-        path_to_config_file, export_formats, preferences_to_list, loop_enabled, docker_enabled = parse_command_line_arguments(logger)
-        sc_client, settings = configure(logger, path_to_config_file, export_formats, docker_enabled)
+        path_to_config_file, export_formats, preferences_to_list, loop_enabled, docker_enabled, workers, \
+            actions_workers = parse_command_line_arguments(logger)
+        sc_client, settings = configure(logger, path_to_config_file, export_formats, docker_enabled, workers,
+                                        actions_workers)
         if settings[CONFIG_NAME] is not None:
             global ACTIONS_SYNC_MARKER_FILENAME
             ACTIONS_SYNC_MARKER_FILENAME = 'last_successful/last_successful_actions_export-{}.txt'.format(settings[CONFIG_NAME])
             global SYNC_MARKER_FILENAME
             SYNC_MARKER_FILENAME = 'last_successful/last_successful-{}.txt'.format(settings[CONFIG_NAME])
+            global ACTIONS_PAGE_CHECKPOINT_FILENAME
+            ACTIONS_PAGE_CHECKPOINT_FILENAME = 'last_successful/actions_page_checkpoint-{}.txt'.format(
+                settings[CONFIG_NAME])
+            global FAILED_AUDITS_FILENAME
+            FAILED_AUDITS_FILENAME = 'last_successful/failed_audits-{}.txt'.format(settings[CONFIG_NAME])
+            global EXPORTED_AUDITS_FILENAME
+            EXPORTED_AUDITS_FILENAME = 'last_successful/exported_audits-{}.txt'.format(settings[CONFIG_NAME])
         if preferences_to_list is not None:
             show_preferences_and_exit(preferences_to_list, sc_client)
         if loop_enabled:
@@ -0,0 +1,303 @@
+# coding=utf-8
+# Author: SafetyCulture
+# Copyright: © SafetyCulture 2016
+# pylint: disable=E1101
+
+import asyncio
+import collections
+import logging
+import re
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from safetypy.safetypy import SafetyCulture, DEFAULT_EXPORT_FORMAT, GUID_PATTERN, MAX_EXPORT_ATTEMPTS
+
+# Maximum number of requests the client keeps in flight at the same time
+DEFAULT_MAX_CONCURRENCY = 100
+
+# Seconds to wait between polls of an export job that is still in progress
+EXPORT_POLL_DELAY_IN_SECONDS = 5
+
+# Status, body and headers of a completed request. The body is read before the connection is handed back to the pool.
+AsyncResponse = collections.namedtuple('AsyncResponse', ['status_code', 'content', 'headers'])
+
+
+class AsyncSafetyCulture:
+    """
+    asyncio twin of safetypy.SafetyCulture for the endpoints used to export audits.
+
+    All requests share one aiohttp session and run on the caller's event loop. A semaphore caps the number of requests
+    in flight, so a single thread can keep hundreds of requests going without exhausting the API or the host.
+
+    Token validation, URL building and logging are delegated to a regular SafetyCulture instance, available as
+    `client` for the endpoints this class does not cover.
+
+    Usage:
+        async with AsyncSafetyCulture(api_token) as sc:
+            audits = await asyncio.gather(*[sc.get_audit(audit_id) for audit_id in audit_ids])
+    """
+
+    def __init__(self, api_token, max_concurrency=DEFAULT_MAX_CONCURRENCY, requests_per_second=None,
+                 retry_policy=None, json_decoder=None):
+        """
+        :param api_token:            iAuditor API token
+        :param max_concurrency:      maximum number of requests in flight at the same time
+        :param requests_per_second:  pace requests to this rate, see SafetyCulture
+        :param retry_policy:         RetryPolicy for throttled and failed requests, see SafetyCulture
+        :param json_decoder:         callable decoding response bodies, see SafetyCulture
+        """
+        if aiohttp is None:
+            raise ImportError('AsyncSafetyCulture requires aiohttp. Install it with: pip install aiohttp')
+        self.client = SafetyCulture(api_token, requests_per_second=requests_per_second, retry_policy=retry_policy,
+                                    json_decoder=json_decoder)
+        self.max_concurrency = max_concurrency
+        self.session = None
+        self.semaphore = None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def open(self):
+        """
+        Create the shared HTTP session. Must be called from the event loop the client will be used on; requests open
+        the session on first use if this has not been called.
+        :return:  the aiohttp session
+        """
+        if self.session is None:
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency)
+            self.session = aiohttp.ClientSession(connector=connector, headers=self.client.custom_http_headers)
+        return self.session
+
+    async def close(self):
+        """
+        Close the shared HTTP session and all pooled connections
+        """
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+        self.client.close()
+
+    async def authenticated_request(self, method, url, data=None):
+        """
+        Send an authenticated request once a concurrency slot is free and read its body. Requests are paced and
+        retried with the rate limiter and retry policy of the wrapped SafetyCulture client.
+        :param method:  HTTP method
+        :param url:     URL to request
+        :param data:    JSON encoded request body, if any
+        :return:        AsyncResponse of the last attempt
+        """
+        logger = logging.getLogger('sp_logger')
+        retry_policy = self.client.retry_policy
+        session = await self.open()
+        headers = {'content-type': 'application/json'} if data is not None else None
+        attempt = 0
+        while True:
+            await asyncio.sleep(self.client.rate_limiter.reserve())
+            try:
+                async with self.semaphore:
+                    async with session.request(method, url, data=data, headers=headers) as response:
+                        result = AsyncResponse(response.status, await response.read(), response.headers)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as ex:
+                sent = not isinstance(ex, aiohttp.ClientConnectorError)
+                if not retry_policy.should_retry(None, attempt, method, sent):
+                    raise
+                delay = retry_policy.delay(attempt)
+                logger.warning('{0} on {1} {2}, retrying in {3:.1f} seconds'.format(ex, method, url, delay))
+            else:
+                if not retry_policy.should_retry(result.status_code, attempt, method):
+                    return result
+                delay = retry_policy.delay(attempt, result.headers.get('Retry-After'))
+                if result.status_code == 429:
+                    self.client.rate_limiter.pause(delay)
+                logger.warning('{0} status received on {1} {2}, retrying in {3:.1f} seconds'.format(
+                    result.status_code, method, url, delay))
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def authenticated_request_get(self, url):
+        return await self.authenticated_request('GET', url)
+
+    async def authenticated_request_post(self, url, data):
+        return await self.authenticated_request('POST', url, data)
+
+    def parse_ok_response(self, response, message):
+        """
+        Log the status of a response and decode its JSON body
+        :param response:  AsyncResponse
+        :param message:   to describe where the status code was obtained
+        :return:          decoded JSON if the request succeeded, else None
+        """
+        self.client.log_http_status(response.status_code, message)
+        return self.client.parse_json(response.content) if response.status_code == 200 else None
+
+    async def discover_audits(self, template_id=None, modified_after=None, completed=True, archived=False):
+        """
+        Return IDs of all completed audits if no parameters are passed, otherwise restrict search
+        based on parameter values
+        :param template_id:     Restrict discovery to this template_id
+        :param modified_after:  Restrict discovery to audits modified after this UTC timestamp
+        :param completed:       Restrict discovery to audits marked as completed, default to True
+        :return:                JSON object containing IDs of all audits returned by API
+        """
+        search_url = self.client.audit_search_url(template_id, modified_after, completed, archived)
+        response = await self.authenticated_request_get(search_url)
+        result = self.client.parse_json(response.content) if response.status_code == 200 else None
+        number_discovered = str(result['total']) if result is not None else '0'
+        self.client.log_http_status(response.status_code,
+                                    'on audit_discovery: ' + number_discovered + ' discovered using ' + search_url)
+        return result
+
+    async def get_audit(self, audit_id):
+        """
+        Request JSON representation of a single specified audit and return it
+
+        :param audit_id:  audit_id of document to fetch
+        :return:          JSON audit object
+        """
+        response = await self.authenticated_request_get(self.client.audit_url + audit_id)
+        return self.parse_ok_response(response, 'on GET for ' + audit_id)
+
+    async def get_media(self, audit_id, media_id):
+        """
+        Get media item associated with a specified audit and media ID
+        :param audit_id:    audit ID of document that contains media
+        :param media_id:    media ID of image to fetch
+        :return:            AsyncResponse whose content is the media itself and whose Content-Type header is the
+                            MIME type associated with the media
+        """
+        return await self.authenticated_request_get(self.client.audit_url + audit_id + '/media/' + media_id)
+
+    async def get_export_job_id(self, audit_id, preference_id=None, export_format=DEFAULT_EXPORT_FORMAT):
+        """
+        Request export job ID from API and return it
+
+        :param audit_id:           audit_id to retrieve export_job_id for
+        :param preference_id:      preference to apply to exports
+        :param export_format:      desired format of exported document
+        :return:                   export job ID obtained from API
+        """
+        export_url, export_data = self.client.export_job_request(audit_id, preference_id, export_format)
+        response = await self.authenticated_request_post(export_url, export_data)
+        return self.parse_ok_response(response, 'on request to ' + export_url)
+
+    async def poll_for_export(self, audit_id, export_job_id, preference_id=None, export_format=DEFAULT_EXPORT_FORMAT):
+        """
+        Poll API for given export job until job is complete. A failed job is resubmitted once.
+        :param audit_id:       audit_id of the export to poll for
+        :param export_job_id:  export_job_id of the export to poll for
+        :param preference_id:  preference to apply if the job has to be resubmitted
+        :param export_format:  format to request if the job has to be resubmitted
+        :return:               href for export download, or None if the export failed
+        """
+        logger = logging.getLogger('sp_logger')
+        export_attempts = 1
+        while True:
+            if export_job_id is None or not re.match('^' + GUID_PATTERN, export_job_id):
+                self.client.log_critical_error(ValueError,
+                                               'export_job_id {0} does not match expected pattern'.format(
+                                                   export_job_id))
+                return None
+            poll_url = self.client.audit_url + audit_id + '/report/' + export_job_id
+            response = await self.authenticated_request_get(poll_url)
+            status = self.client.parse_json(response.content) if response.status_code == 200 else None
+            if status is None or 'status' not in status.keys():
+                logger.critical('Unexpected response from API: {0}'.format(status))
+                return None
+            logger.info(str(status['status']) + ' : ' + audit_id)
+            if status['status'] == 'IN_PROGRESS':
+                await asyncio.sleep(EXPORT_POLL_DELAY_IN_SECONDS)
+            elif status['status'] == 'SUCCESS':
+                return status['url']
+            elif export_attempts < MAX_EXPORT_ATTEMPTS:
+                export_attempts += 1
+                logger.info('attempt # {0} exporting report for: {1}'.format(export_attempts, audit_id))
+                retry_id = await self.get_export_job_id(audit_id, preference_id, export_format)
+                if retry_id is None:
+                    return None
+                export_job_id = retry_id.get('messageId')
+            else:
+                logger.error('export for ' + audit_id + ' failed {0} times - skipping'.format(export_attempts))
+                return None
+
+    async def download_export(self, export_href):
+        """
+
+        :param export_href:  href for export document to download
+        :return:             String representation of exported document
+        """
+        try:
+            response = await self.authenticated_request_get(export_href)
+            self.client.log_http_status(response.status_code, 'on GET for href: ' + export_href)
+            return response.content if response.status_code == 200 else None
+        except Exception as ex:
+            self.client.log_critical_error(ex, 'Exception occurred while attempting download_export({0})'.format(
+                export_href))
+
+    async def get_export(self, audit_id, preference_id=None, export_format=DEFAULT_EXPORT_FORMAT):
+        """
+        Obtain exported document from API and return string representation of it
+
+        :param audit_id:           audit_id of export to obtain
+        :param preference_id:      ID of preference to apply to exports
+        :param export_format:      desired format of exported document
+        :return:                   String representation of exported document
+        """
+        export_job = await self.get_export_job_id(audit_id, preference_id, export_format)
+        if export_job is None:
+            return None
+        export_href = await self.poll_for_export(audit_id, export_job.get('messageId'), preference_id, export_format)
+        if export_href is None:
+            return None
+        return await self.download_export(export_href)
+
+    async def get_web_report(self, audit_id):
+        """
+        Generate Web Report link associated with a specified audit
+        :param audit_id:   Audit ID
+        :return:           Web Report link
+        """
+        url = self.client.audit_url + audit_id + '/web_report_link'
+        result = self.parse_ok_response(await self.authenticated_request_get(url),
+                                        'on GET web report for ' + audit_id)
+        return result.get('url') if result else None
+
+    async def get_page_of_actions(self, date_modified, offset=0):
+        """
+        :param date_modified:   ISO formatted date/time string. Only actions modified after this date are returned.
+        :param offset:          The index to start retrieving actions from
+        :return:                decoded actions/search response, or None if the request failed
+        """
+        response = await self.authenticated_request_post(self.client.api_url + 'actions/search',
+                                                         self.client.actions_search_data(date_modified, offset))
+        result = self.parse_ok_response(response, 'GET actions')
+        return result if self.client.is_valid_actions_page(result) else None
+
+    async def get_audit_actions(self, date_modified, offset=0, page_length=100):
+        """
+        Get all actions modified after a specified date. Once the first page reports the total, the remaining pages
+        are requested concurrently.
+
+        :param date_modified:   ISO formatted date/time string. Only actions modified after this date are returned.
+        :param offset:          The index to start retrieving actions from
+        :param page_length:     How many actions the API returns for each page of action results
+        :return:                Array of action objects, or None if any page failed
+        """
+        first_page = await self.get_page_of_actions(date_modified, offset)
+        if first_page is None:
+            return None
+        offsets = range(offset + page_length, first_page['total'], page_length)
+        pages = await asyncio.gather(*[self.get_page_of_actions(date_modified, page) for page in offsets])
+        if None in pages:
+            return None
+        actions = list(first_page['actions'])
+        for page in pages:
+            actions.extend(page['actions'])
+        return actions
@@ -7,19 +7,71 @@ import collections
 import json
 import logging
 import os
+import random
 import re
 import sys
+import threading
 import time
 import errno
+import itertools
 from builtins import input
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from email.utils import parsedate_to_datetime
 import requests
+import urllib3
 from getpass import getpass
+from requests.adapters import HTTPAdapter
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Decodes API responses straight from bytes. orjson is used when it is installed, as it decodes large audits several
+# times faster than the standard library
+DEFAULT_JSON_DECODER = orjson.loads if orjson is not None else json.loads
 
 DEFAULT_EXPORT_FORMAT = 'PDF'
 GUID_PATTERN = '[A-Fa-f0-9]{8}-[A-Fa-f0-9]{4}-[A-Fa-f0-9]{4}-[A-Fa-f0-9]{4}-[A-Fa-f0-9]{12}$'
 HTTP_USER_AGENT_ID = 'safetyculture-python-sdk'
 
+# Number of per-host connection pools kept by the shared HTTP session
+DEFAULT_POOL_CONNECTIONS = 10
+
+# Maximum number of keep-alive connections kept open in each per-host pool
+DEFAULT_POOL_MAXSIZE = 10
+
+# How many times a throttled (429), failed (5xx) or dropped request is retried before giving up
+DEFAULT_MAX_RETRIES = 5
+
+# Exponential backoff between retries starts at this many seconds and never exceeds DEFAULT_BACKOFF_MAX
+DEFAULT_BACKOFF_BASE = 1
+DEFAULT_BACKOFF_MAX = 60
+
+# HTTP status codes that are worth retrying
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# HTTP methods that can be sent twice without changing the outcome. Other requests, such as POSTs, are only retried
+# when the server cannot have acted on them
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+
+# Number of bytes of a streamed response read at a time
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Number of audits requested per page by iter_audits
+DEFAULT_AUDIT_SEARCH_PAGE_SIZE = 1000
+
+# How many times a report is requested before a failed export job is given up on
+MAX_EXPORT_ATTEMPTS = 2
+
+# Number of report jobs ReportScheduler keeps submitted to the API at the same time
+DEFAULT_MAX_REPORTS_IN_FLIGHT = 20
+
+# ReportScheduler polls outstanding jobs at least this often, backing off towards the maximum while nothing completes
+DEFAULT_MIN_REPORT_POLL_INTERVAL = 1
+DEFAULT_MAX_REPORT_POLL_INTERVAL = 30
+
 
 def get_user_api_token(logger):
     """
@@ -43,8 +95,320 @@ def get_user_api_token(logger):
         return None
 
 
+class ActionsSearchError(Exception):
+    """
+    Raised when a page of actions could not be retrieved while paging through actions/search results
+    """
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket that paces requests made by every thread sharing a client.
+
+    Callers reserve a token and sleep for the returned delay, which keeps the limiter usable from both threads and
+    coroutines. A throttled response can pause the whole bucket so every caller backs off, not only the one that was
+    told to.
+    """
+
+    def __init__(self, requests_per_second, burst=None):
+        """
+        :param requests_per_second:  sustained request rate, or None to only honour pauses
+        :param burst:                number of requests that may be sent back to back, defaults to one second's worth
+        """
+        self.rate = requests_per_second
+        self.capacity = burst or max(1, int(requests_per_second or 1))
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """
+        Take a token from the bucket
+        :return:  seconds the caller must wait before sending its request
+        """
+        with self.lock:
+            now = time.monotonic()
+            delay = max(0.0, self.paused_until - now)
+            if self.rate is None:
+                return delay
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            self.tokens -= 1
+            if self.tokens < 0:
+                delay = max(delay, -self.tokens / self.rate)
+            return delay
+
+    def pause(self, seconds):
+        """
+        Stop handing out tokens for the given number of seconds
+        :param seconds:  how long every caller should back off for
+        """
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+class RetryPolicy:
+    """
+    Decides whether a request is retried and how long to wait first: the server's Retry-After if it sent one,
+    otherwise exponential backoff with full jitter.
+
+    Requests whose method is not in IDEMPOTENT_METHODS are only retried when they were throttled (429) or could not
+    be sent at all, as a timed out or failed POST may already have been carried out by the server.
+    """
+
+    def __init__(self, max_retries=DEFAULT_MAX_RETRIES, backoff_base=DEFAULT_BACKOFF_BASE,
+                 backoff_max=DEFAULT_BACKOFF_MAX, status_codes=RETRY_STATUS_CODES):
+        """
+        :param max_retries:   how many times a request is retried before its last response is returned
+        :param backoff_base:  backoff in seconds before the first retry
+        :param backoff_max:   upper limit of the exponential backoff in seconds. A Retry-After sent by the server is
+                              honoured even if it is longer
+        :param status_codes:  HTTP status codes that are retried
+        """
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.status_codes = status_codes
+
+    def should_retry(self, status_code, attempt, method='GET', sent=True):
+        """
+        :param status_code:  status code of the last response, or None if the request raised a connection error
+        :param attempt:      number of retries made so far
+        :param method:       HTTP method of the request
+        :param sent:         False if the request raised while opening the connection, before anything was sent
+        :return:             True if the request should be sent again
+        """
+        if attempt >= self.max_retries:
+            return False
+        if method.upper() not in IDEMPOTENT_METHODS:
+            return status_code == 429 or (status_code is None and not sent)
+        return status_code is None or status_code in self.status_codes
+
+    def delay(self, attempt, retry_after=None):
+        """
+        :param attempt:      number of retries made so far
+        :param retry_after:  value of the Retry-After response header, if any
+        :return:             seconds to wait before the next attempt
+        """
+        server_delay = self.parse_retry_after(retry_after)
+        if server_delay is not None:
+            return server_delay
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    @staticmethod
+    def parse_retry_after(retry_after):
+        """
+        :param retry_after:  Retry-After header, either a number of seconds or an HTTP date
+        :return:             seconds to wait, or None if the header is missing or malformed
+        """
+        if not retry_after:
+            return None
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            pass
+        try:
+            retry_at = parsedate_to_datetime(retry_after)
+        except (TypeError, ValueError):
+            return None
+        return max(0.0, (retry_at - datetime.now(retry_at.tzinfo)).total_seconds())
+
+
+def is_connect_error(ex):
+    """
+    :param ex:  ConnectionError or Timeout raised by requests
+    :return:    True if the connection could not be opened, so none of the request reached the server
+    """
+    if isinstance(ex, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(ex.args[0], 'reason', None) if ex.args else None
+    return isinstance(reason, urllib3.exceptions.ConnectTimeoutError)
+
+
+class ReportScheduler:
+    """
+    Generates PDF and Word reports for many audits at once.
+
+    Report requests are queued with submit. A background thread keeps up to max_in_flight export jobs submitted to the
+    API, polls all outstanding jobs in rounds and downloads each report as soon as its job succeeds. Reports submitted
+    between rounds are sent to the API straight away but do not bring the next round forward. The poll interval
+    starts at min_poll_interval, grows while a round completes nothing and drops back once jobs start finishing.
+
+    Usage:
+        scheduler = ReportScheduler(sc_client)
+        scheduler.start()
+        scheduler.submit(audit_id, preference_id, 'pdf', callback)
+        scheduler.close()
+        scheduler.join()
+    """
+
+    def __init__(self, sc_client, max_in_flight=DEFAULT_MAX_REPORTS_IN_FLIGHT,
+                 min_poll_interval=DEFAULT_MIN_REPORT_POLL_INTERVAL,
+                 max_poll_interval=DEFAULT_MAX_REPORT_POLL_INTERVAL):
+        """
+        :param sc_client:          SafetyCulture instance used to submit, poll and download jobs
+        :param max_in_flight:      maximum number of export jobs submitted to the API at the same time
+        :param min_poll_interval:  seconds between poll rounds while jobs are completing
+        :param max_poll_interval:  upper limit of the seconds between poll rounds
+        """
+        self.sc_client = sc_client
+        self.max_in_flight = max_in_flight
+        self.min_poll_interval = min_poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.queue = collections.deque()
+        self.in_flight = []
+        self.closed = False
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def submit(self, audit_id, preference_id, export_format, callback):
+        """
+        Queue a report. Safe to call from any thread.
+        :param audit_id:       audit_id of the report to generate
+        :param preference_id:  preference to apply to the report, or None
+        :param export_format:  'pdf' or 'docx'
+        :param callback:       called from the scheduler thread with the report content, or None if it failed
+        """
+        with self.condition:
+            self.queue.append({'audit_id': audit_id, 'preference_id': preference_id, 'export_format': export_format,
+                               'callback': callback, 'attempts': 0, 'job_id': None})
+            self.condition.notify()
+
+    def start(self):
+        """
+        Run the scheduler on a background thread
+        """
+        self.thread = threading.Thread(target=self.run, name='report-scheduler')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def close(self):
+        """
+        Stop accepting reports. The scheduler finishes every report already queued before run returns.
+        """
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+
+    def join(self):
+        """
+        Wait for the background thread to finish every queued report
+        """
+        if self.thread is not None:
+            self.thread.join()
+
+    def run(self):
+        """
+        Submit, poll and download reports until the scheduler is closed and no work is left
+        """
+        interval = self.min_poll_interval
+        next_poll = None
+        while True:
+            with self.condition:
+                while True:
+                    if self.queue and len(self.in_flight) < self.max_in_flight:
+                        break
+                    if self.in_flight and time.monotonic() >= next_poll:
+                        break
+                    if not self.queue and not self.in_flight and self.closed:
+                        return
+                    self.condition.wait(next_poll - time.monotonic() if self.in_flight else None)
+                new_jobs = []
+                while self.queue and len(self.in_flight) + len(new_jobs) < self.max_in_flight:
+                    new_jobs.append(self.queue.popleft())
+            for job in new_jobs:
+                self.submit_job(job)
+            if not self.in_flight:
+                next_poll = None
+            elif next_poll is None:
+                next_poll = time.monotonic() + interval
+            elif time.monotonic() >= next_poll:
+                if self.poll_round():
+                    interval = self.min_poll_interval
+                else:
+                    interval = min(self.max_poll_interval, interval * 1.5)
+                next_poll = time.monotonic() + interval
+
+    def submit_job(self, job):
+        """
+        Request an export job from the API for a queued report
+        :param job:  queued report
+        """
+        job['attempts'] += 1
+        try:
+            export_job = self.sc_client.get_export_job_id(job['audit_id'], job['preference_id'], job['export_format'])
+        except Exception as ex:
+            self.sc_client.log_critical_error(ex, 'Exception requesting report for ' + job['audit_id'])
+            export_job = None
+        if export_job is None:
+            self.finish(job, None)
+        else:
+            job['job_id'] = export_job['messageId']
+            self.in_flight.append(job)
+
+    def poll_round(self):
+        """
+        Poll every in-flight job once, downloading reports whose job succeeded and resubmitting failed jobs
+        :return:  number of jobs that finished this round
+        """
+        logger = logging.getLogger('sp_logger')
+        still_running = []
+        finished = 0
+        for job in self.in_flight:
+            try:
+                status = self.sc_client.get_export_status(job['audit_id'], job['job_id'])
+            except Exception as ex:
+                self.sc_client.log_critical_error(ex, 'Exception polling report for ' + job['audit_id'])
+                status = None
+            if status is not None and status['status'] == 'IN_PROGRESS':
+                still_running.append(job)
+                continue
+            finished += 1
+            if status is not None and status['status'] == 'SUCCESS':
+                logger.info(str(status['status']) + ' : ' + job['audit_id'])
+                self.finish(job, self.sc_client.download_export(status['url']))
+            elif status is not None and job['attempts'] < MAX_EXPORT_ATTEMPTS:
+                logger.info('attempt # {0} exporting report for: {1}'.format(job['attempts'] + 1, job['audit_id']))
+                with self.condition:
+                    self.queue.appendleft(job)
+            else:
+                logger.error('export for ' + job['audit_id'] + ' failed {0} times - skipping'.format(job['attempts']))
+                self.finish(job, None)
+        self.in_flight = still_running
+        return finished
+
+    def finish(self, job, export_content):
+        """
+        Hand a finished report to its callback
+        :param job:             the report
+        :param export_content:  downloaded report, or None if it failed
+        """
+        try:
+            job['callback'](export_content)
+        except Exception as ex:
+            self.sc_client.log_critical_error(ex, 'Exception handling report for ' + job['audit_id'])
+
+
 class SafetyCulture:
-    def __init__(self, api_token):
+    def __init__(self, api_token, pool_connections=DEFAULT_POOL_CONNECTIONS, pool_maxsize=DEFAULT_POOL_MAXSIZE,
+                 pool_block=False, keep_alive=True, requests_per_second=None, retry_policy=None, json_decoder=None):
+        """
+        :param api_token:            iAuditor API token
+        :param pool_connections:     number of per-host connection pools to cache
+        :param pool_maxsize:         maximum number of connections kept open per host. Set this to at least the number
+                                     of threads sharing the client so none of them has to open a throwaway connection
+        :param pool_block:           if True, a thread waits for a free pooled connection instead of opening a new one
+        :param keep_alive:           if False, connections are closed after every request
+        :param requests_per_second:  pace requests from every thread sharing this client to this rate. None only
+                                     applies the back off requested by throttled responses
+        :param retry_policy:         RetryPolicy for throttled and failed requests, defaults to RetryPolicy()
+        :param json_decoder:         callable decoding a JSON response body (bytes) to Python objects, defaults to
+                                     DEFAULT_JSON_DECODER
+        """
+        self.json_decoder = json_decoder or DEFAULT_JSON_DECODER
+        self.rate_limiter = RateLimiter(requests_per_second)
+        self.retry_policy = retry_policy or RetryPolicy()
         self.current_dir = os.getcwd()
         self.log_dir = self.current_dir + '/log/'
         self.api_url = 'https://api.safetyculture.io/'
@@ -76,33 +440,97 @@ class SafetyCulture:
         else:
             logger.error('No valid API token parsed! Exiting.')
             sys.exit(1)
+        self.session = self.create_session(pool_connections, pool_maxsize, pool_block, keep_alive)
 
-    def authenticated_request_get(self, url):
-        return requests.get(url, headers=self.custom_http_headers)
+    @staticmethod
+    def create_session(pool_connections, pool_maxsize, pool_block, keep_alive):
+        """
+        Create the HTTP session shared by every endpoint method. The session keeps TCP/TLS connections alive between
+        requests so consecutive calls to the API do not pay for a new handshake each time.
+
+        :param pool_connections:  number of per-host connection pools to cache
+        :param pool_maxsize:      maximum number of connections kept open per host
+        :param pool_block:        whether to wait for a free pooled connection when the pool is exhausted
+        :param keep_alive:        if False, ask the server to close the connection after every request
+        :return:                  configured requests.Session
+        """
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, pool_block=pool_block)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        if not keep_alive:
+            session.headers['Connection'] = 'close'
+        return session
+
+    def close(self):
+        """
+        Close all pooled connections held by this client
+        """
+        self.session.close()
+
+    def json_http_headers(self):
+        """
+        :return:  a copy of the authenticated headers with a JSON content-type. A copy is returned, rather than the
+                  shared headers being modified in place, so the client can be used from several threads at once.
+        """
+        headers = dict(self.custom_http_headers)
+        headers['content-type'] = 'application/json'
+        return headers
+
+    def authenticated_request(self, method, url, **kwargs):
+        """
+        Send a request through the shared session, pacing it with the rate limiter. Throttled (429) and failed (5xx)
+        responses and dropped connections are retried according to the retry policy, which only retries requests
+        that are not idempotent when they were throttled or never sent; a throttled response pauses every thread
+        sharing the client for the time the server asked for.
+
+        :param method:  HTTP method
+        :param url:     URL to request
+        :param kwargs:  passed on to requests.Session.request
+        :return:        the response of the last attempt
+        """
+        logger = logging.getLogger('sp_logger')
+        attempt = 0
+        while True:
+            time.sleep(self.rate_limiter.reserve())
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as ex:
+                if not self.retry_policy.should_retry(None, attempt, method, not is_connect_error(ex)):
+                    raise
+                delay = self.retry_policy.delay(attempt)
+                logger.warning('{0} on {1} {2}, retrying in {3:.1f} seconds'.format(ex, method, url, delay))
+            else:
+                if not self.retry_policy.should_retry(response.status_code, attempt, method):
+                    return response
+                delay = self.retry_policy.delay(attempt, response.headers.get('Retry-After'))
+                if response.status_code == 429:
+                    self.rate_limiter.pause(delay)
+                logger.warning('{0} status received on {1} {2}, retrying in {3:.1f} seconds'.format(
+                    response.status_code, method, url, delay))
+                response.close()
+            time.sleep(delay)
+            attempt += 1
+
+    def authenticated_request_get(self, url, stream=False):
+        return self.authenticated_request('GET', url, headers=self.custom_http_headers, stream=stream)
 
     def authenticated_request_post(self, url, data):
-        self.custom_http_headers['content-type'] = 'application/json'
-        response = requests.post(url, data, headers=self.custom_http_headers)
-        del self.custom_http_headers['content-type']
-        return response
+        return self.authenticated_request('POST', url, data=data, headers=self.json_http_headers())
 
     def authenticated_request_put(self, url, data):
-        self.custom_http_headers['content-type'] = 'application/json'
-        response = requests.put(url, data, headers=self.custom_http_headers)
-        del self.custom_http_headers['content-type']
-        return response
+        return self.authenticated_request('PUT', url, data=data, headers=self.json_http_headers())
 
     def authenticated_request_delete(self, url):
-        return requests.delete(url, headers=self.custom_http_headers)
+        return self.authenticated_request('DELETE', url, headers=self.custom_http_headers)
 
-    @staticmethod
-    def parse_json(json_to_parse):
+    def parse_json(self, json_to_parse):
         """
-        Parse JSON string to OrderedDict and return
-        :param json_to_parse:  string representation of JSON
-        :return:               OrderedDict representation of JSON
+        Parse JSON with the client's json_decoder and return it
+        :param json_to_parse:  JSON response body, as bytes or string
+        :return:               dict representation of JSON
         """
-        return json.JSONDecoder(object_pairs_hook=collections.OrderedDict).decode(json_to_parse.decode('utf-8'))
+        return self.json_decoder(json_to_parse)
 
     @staticmethod
     def log_critical_error(ex, message):
@@ -156,16 +584,18 @@ class SafetyCulture:
                 self.log_critical_error(ex, 'An error happened trying to create ' + path)
                 raise
 
-    def discover_audits(self, template_id=None, modified_after=None, completed=True, archived=False):
+    def audit_search_url(self, template_id=None, modified_after=None, completed=True, archived=False, limit=None,
+                         modified_before=None):
         """
-        Return IDs of all completed audits if no parameters are passed, otherwise restrict search
-        based on parameter values
+        Build the audits/search URL used by audit discovery
         :param template_id:     Restrict discovery to this template_id
         :param modified_after:  Restrict discovery to audits modified after this UTC timestamp
+        :param modified_before: Restrict discovery to audits modified before this UTC timestamp
         :param completed:       Restrict discovery to audits marked as completed, default to True
-        :return:                JSON object containing IDs of all audits returned by API
+        :param archived:        Restrict discovery to archived (True), unarchived (False) or 'both'
+        :param limit:           Maximum number of audits to return, or None for the API default
+        :return:                search URL
         """
-
         logger = logging.getLogger('sp_logger')
 
         last_modified = modified_after if modified_after is not None else '2000-01-01T00:00:00.000Z'
@@ -175,6 +605,9 @@ class SafetyCulture:
         log_string = '\nInitiating audit_discovery with the parameters: ' + '\n'
         log_string += 'template_id    = ' + str(template_id) + '\n'
         log_string += 'modified_after = ' + str(last_modified) + '\n'
+        if modified_before is not None:
+            search_url += '&modified_before=' + modified_before
+            log_string += 'modified_before = ' + modified_before + '\n'
         log_string += 'completed      = ' + str(completed) + '\n'
         logger.info(log_string)
 
@@ -201,14 +634,115 @@ class SafetyCulture:
         if completed == 'both':
             search_url += '&completed=both'
 
+        if limit is not None:
+            search_url += '&limit=' + str(limit)
+        return search_url
+
+    def discover_audits(self, template_id=None, modified_after=None, completed=True, archived=False):
+        """
+        Return IDs of all completed audits if no parameters are passed, otherwise restrict search
+        based on parameter values
+        :param template_id:     Restrict discovery to this template_id
+        :param modified_after:  Restrict discovery to audits modified after this UTC timestamp
+        :param completed:       Restrict discovery to audits marked as completed, default to True
+        :return:                JSON object containing IDs of all audits returned by API
+        """
+        search_url = self.audit_search_url(template_id, modified_after, completed, archived)
+
         response = self.authenticated_request_get(search_url)
-        result = response.json() if response.status_code == requests.codes.ok else None
+        result = self.parse_json(response.content) if response.status_code == requests.codes.ok else None
         number_discovered = str(result['total']) if result is not None else '0'
         log_message = 'on audit_discovery: ' + number_discovered + ' discovered using ' + search_url
 
         self.log_http_status(response.status_code, log_message)
         return result
 
+    def iter_audits(self, template_id=None, modified_after=None, completed=True, archived=False,
+                    page_size=DEFAULT_AUDIT_SEARCH_PAGE_SIZE, modified_before=None):
+        """
+        Generator over the pages of an audit search, in ascending modified_at order. Each page is requested with
+        modified_after set to the last modified_at seen, so discovery is not bound by the size of a single response.
+        The next page is fetched in the background while the caller works through the current one.
+
+        Audits sharing the modified_at at a page boundary are searched for again and de-duplicated, so none are lost
+        when several audits were modified within the same millisecond, as long as there are fewer than page_size of them.
+
+        :param template_id:     Restrict discovery to this template_id
+        :param modified_after:  Restrict discovery to audits modified after this UTC timestamp
+        :param completed:       Restrict discovery to audits marked as completed, default to True
+        :param archived:        Restrict discovery to archived (True), unarchived (False) or 'both'
+        :param page_size:       Number of audits to request per page
+        :param modified_before: Restrict discovery to audits modified before this UTC timestamp. Discovery also stops
+                                at the first audit modified at or after it, as results are in ascending order.
+        :return:                audit search results, each containing 'total', 'count' and 'audits'. Discovery stops
+                                early, after logging the error, if a page cannot be retrieved.
+        """
+        boundary = None
+        boundary_ids = set()
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            search_after = modified_after
+            next_page = executor.submit(self.search_audits_page, template_id, search_after, completed, archived,
+                                        page_size, modified_before)
+            while next_page is not None:
+                page = next_page.result()
+                if page is None:
+                    return
+                full_page = page['count'] >= page_size
+                audits = [audit for audit in page['audits']
+                          if not (audit['modified_at'] == boundary and audit['audit_id'] in boundary_ids)]
+                if modified_before is not None and audits and audits[-1]['modified_at'] >= modified_before:
+                    audits = list(itertools.takewhile(lambda audit: audit['modified_at'] < modified_before, audits))
+                    full_page = False
+                if full_page and not audits:
+                    logging.getLogger('sp_logger').warning(
+                        'More than {0} audits modified at {1}, some may be skipped. Increase page_size to export '
+                        'them all'.format(page_size, boundary))
+                    search_after = boundary
+                elif audits:
+                    last_modified = audits[-1]['modified_at']
+                    if last_modified != boundary:
+                        boundary = last_modified
+                        boundary_ids = set()
+                    boundary_ids.update(audit['audit_id'] for audit in audits
+                                        if audit['modified_at'] == boundary)
+                    search_after = self.shift_timestamp(boundary, -1) if full_page else None
+                next_page = None
+                if full_page and search_after is not None:
+                    next_page = executor.submit(self.search_audits_page, template_id, search_after, completed,
+                                                archived, page_size, modified_before)
+                page['audits'] = audits
+                page['count'] = len(audits)
+                yield page
+
+    def search_audits_page(self, template_id, modified_after, completed, archived, page_size, modified_before=None):
+        """
+        Request a single page of audit search results
+        :return:  audit search results, or None if the request failed
+        """
+        search_url = self.audit_search_url(template_id, modified_after, completed, archived, page_size,
+                                           modified_before)
+        response = self.authenticated_request_get(search_url)
+        result = self.parse_json(response.content) if response.status_code == requests.codes.ok else None
+        number_discovered = str(result['total']) if result is not None else '0'
+        self.log_http_status(response.status_code,
+                             'on audit_discovery: ' + number_discovered + ' discovered using ' + search_url)
+        return result
+
+    @staticmethod
+    def shift_timestamp(timestamp, milliseconds):
+        """
+        :param timestamp:     UTC timestamp in the format 2017-03-03T03:45:58.090Z
+        :param milliseconds:  number of milliseconds to add
+        :return:              shifted timestamp in the same format, or the original timestamp if it cannot be parsed
+        """
+        for timestamp_format in ('%Y-%m-%dT%H:%M:%S.%fZ', '%Y-%m-%dT%H:%M:%SZ'):
+            try:
+                shifted = datetime.strptime(timestamp, timestamp_format) + timedelta(milliseconds=milliseconds)
+            except ValueError:
+                continue
+            return shifted.strftime('%Y-%m-%dT%H:%M:%S.') + '{0:03d}Z'.format(shifted.microsecond // 1000)
+        return timestamp
+
     def discover_templates(self, modified_after=None, modified_before=None):
         """
         Query API for all template IDs if no parameters are passed, otherwise restrict search based on parameters
@@ -224,7 +758,7 @@ class SafetyCulture:
             search_url += '&modified_after=' + modified_after
 
         response = self.authenticated_request_get(search_url)
-        result = response.json() if response.status_code == requests.codes.ok else None
+        result = self.parse_json(response.content) if response.status_code == requests.codes.ok else None
         log_message = 'on template discovery using ' + search_url
 
         self.log_http_status(response.status_code, log_message)
@@ -240,17 +774,17 @@ class SafetyCulture:
         if template_id is not None:
             preference_search_url += '?template_id=' + template_id
         response = self.authenticated_request_get(preference_search_url)
-        result = response.json() if response.status_code == requests.codes.ok else None
+        result = self.parse_json(response.content) if response.status_code == requests.codes.ok else None
         return result
 
-    def get_export_job_id(self, audit_id, preference_id=None, export_format=DEFAULT_EXPORT_FORMAT):
+    def export_job_request(self, audit_id, preference_id=None, export_format=DEFAULT_EXPORT_FORMAT):
         """
-        Request export job ID from API and return it
+        Build the URL and JSON body that request an export job for an audit
 
         :param audit_id:           audit_id to retrieve export_job_id for
         :param preference_id:      preference to apply to exports
         :param export_format:      desired format of exported document
-        :return:                   export job ID obtained from API
+        :return:                   export URL, JSON encoded request body
         """
         export_url = self.audit_url + audit_id + '/report'
         if export_format == 'docx': # convert old command line format
@@ -266,55 +800,79 @@ class SafetyCulture:
                 self.log_critical_error(ValueError,
                                         'preference_id {0} does not match expected pattern'.format(
                                             preference_id))
+        return export_url, json.dumps(export_data)
 
-        response = self.authenticated_request_post(export_url, data=json.dumps(export_data))
-        result = response.json() if response.status_code == requests.codes.ok else None
+    def get_export_job_id(self, audit_id, preference_id=None, export_format=DEFAULT_EXPORT_FORMAT):
+        """
+        Request export job ID from API and return it
+
+        :param audit_id:           audit_id to retrieve export_job_id for
+        :param preference_id:      preference to apply to exports
+        :param export_format:      desired format of exported document
+        :return:                   export job ID obtained from API
+        """
+        export_url, export_data = self.export_job_request(audit_id, preference_id, export_format)
+        response = self.authenticated_request_post(export_url, data=export_data)
+        result = self.parse_json(response.content) if response.status_code == requests.codes.ok else None
         log_message = 'on request to ' + export_url
 
         self.log_http_status(response.status_code, log_message)
         return result
 
-    def poll_for_export(self, audit_id, export_job_id):
+    def get_export_status(self, audit_id, export_job_id):
         """
-        Poll API for given export job until job is complete or excessive failed attempts occur
+        Poll API once for the status of an export job
         :param audit_id:       audit_id of the export to poll for
         :param export_job_id:  export_job_id of the export to poll for
-        :return:               href for export download
+        :return:               status object containing 'status' and, once successful, 'url', or None if the job ID is
+                               invalid or the API did not return a status
         """
         job_id_pattern = '^' + GUID_PATTERN
-        job_id_is_valid = re.match(job_id_pattern, export_job_id)
-
-        if job_id_is_valid:
-            delay_in_seconds = 5
-            poll_url = self.audit_url + audit_id + '/report/' + export_job_id
-            export_attempts = 1
-            poll_status = self.authenticated_request_get(poll_url)
-            status = poll_status.json()
+        if export_job_id is None or not re.match(job_id_pattern, export_job_id):
+            self.log_critical_error(ValueError,
+                                    'export_job_id {0} does not match expected pattern'.format(export_job_id))
+            return None
+        poll_url = self.audit_url + audit_id + '/report/' + export_job_id
+        response = self.authenticated_request_get(poll_url)
+        status = self.parse_json(response.content) if response.status_code == requests.codes.ok else None
+        if status is None or 'status' not in status.keys():
             logger = logging.getLogger('sp_logger')
-            if 'status' in status.keys():
-                if status['status'] == 'IN_PROGRESS':
-                    logger.info(str(status['status']) + ' : ' + audit_id)
-                    time.sleep(delay_in_seconds)
-                    return self.poll_for_export(audit_id, export_job_id)
-
-                elif status['status'] == 'SUCCESS':
-                    logger.info(str(status['status']) + ' : ' + audit_id)
-                    return status['url']
+            logger.critical('Unexpected response from API: {0}'.format(status))
+            return None
+        return status
 
-                else:
-                    if export_attempts < 2:
-                        export_attempts += 1
-                        logger.info('attempt # {0} exporting report for: ' + audit_id.format(str(export_attempts)))
-                        retry_id = self.get_export_job_id(audit_id)
-                        return self.poll_for_export(audit_id, retry_id['messageId'])
-                    else:
-                        logger.error('export for ' + audit_id + ' failed {0} times - skipping'.format(export_attempts))
+    def poll_for_export(self, audit_id, export_job_id, preference_id=None, export_format=DEFAULT_EXPORT_FORMAT):
+        """
+        Poll API for given export job until job is complete or excessive failed attempts occur. A failed job is
+        resubmitted once.
+        :param audit_id:       audit_id of the export to poll for
+        :param export_job_id:  export_job_id of the export to poll for
+        :param preference_id:  preference to apply if the job has to be resubmitted
+        :param export_format:  format to request if the job has to be resubmitted
+        :return:               href for export download
+        """
+        logger = logging.getLogger('sp_logger')
+        delay_in_seconds = 5
+        export_attempts = 1
+        while True:
+            status = self.get_export_status(audit_id, export_job_id)
+            if status is None:
+                return None
+            logger.info(str(status['status']) + ' : ' + audit_id)
+            if status['status'] == 'IN_PROGRESS':
+                time.sleep(delay_in_seconds)
+            elif status['status'] == 'SUCCESS':
+                return status['url']
+            elif export_attempts < MAX_EXPORT_ATTEMPTS:
+                export_attempts += 1
+                logger.info('attempt # {0} exporting report for: {1}'.format(export_attempts, audit_id))
+                retry_id = self.get_export_job_id(audit_id, preference_id, export_format)
+                if retry_id is None:
+                    return None
+                export_job_id = retry_id['messageId']
             else:
-                logger.critical('Unexpected response from API: {0}'.format(status))
-
-        else:
-            self.log_critical_error(ValueError,
-                                    'export_job_id {0} does not match expected pattern'.format(export_job_id))
+                logger.error('export for ' + audit_id + ' failed {0} times - skipping'.format(export_attempts))
+                return None
 
     def download_export(self, export_href):
         """
@@ -343,8 +901,12 @@ class SafetyCulture:
         :param export_format:      desired format of exported document
         :return:                   String representation of exported document
         """
-        export_job_id = self.get_export_job_id(audit_id, preference_id, export_format)['messageId']
-        export_href = self.poll_for_export(audit_id, export_job_id)
+        export_job = self.get_export_job_id(audit_id, preference_id, export_format)
+        if export_job is None:
+            return None
+        export_href = self.poll_for_export(audit_id, export_job['messageId'], preference_id, export_format)
+        if export_href is None:
+            return None
 
         export_content = self.download_export(export_href)
         return export_content
@@ -358,7 +920,7 @@ class SafetyCulture:
                             and the body of the response is the media itself.
         """
         url = self.audit_url + audit_id + '/media/' + media_id
-        response = requests.get(url, headers=self.custom_http_headers, stream=True)
+        response = self.authenticated_request_get(url, stream=True)
         return response
 
     def get_web_report(self, audit_id):
@@ -376,51 +938,130 @@ class SafetyCulture:
         else:
             return None
 
+    @staticmethod
+    def actions_search_data(date_modified, offset=0):
+        """
+        :param date_modified:   ISO formatted date/time string. Only actions modified after this date are returned.
+        :param offset:          The index to start retrieving actions from
+        :return:                JSON encoded body of an actions/search request
+        """
+        return json.dumps({
+            "modified_at": {"from": str(date_modified)},
+            "offset": offset,
+            "status": [0, 10, 50, 60]
+        })
+
+    @staticmethod
+    def is_valid_actions_page(page):
+        """
+        :param page:  decoded actions/search response
+        :return:      True if the page holds every field needed to page through the results
+        """
+        return page is not None and None not in [page.get('count'), page.get('offset'), page.get('total'),
+                                                 page.get('actions')]
+
     def get_audit_actions(self, date_modified, offset=0, page_length=100):
         """
-        Get all actions created after a specified date. If the number of actions found is more than 100, this function will
-        page until it has collected all actions
+        Get all actions modified after a specified date. If the number of actions found is more than one page, this
+        function will page until it has collected all actions. Use iter_audit_actions to process large numbers of
+        actions without holding them all in memory.
 
-        :param date_modified:   ISO formatted date/time string. Only actions created after this date are are returned.
+        :param date_modified:   ISO formatted date/time string. Only actions modified after this date are returned.
         :param offset:          The index to start retrieving actions from
-        :param page_length:     How many actions to fetch for each page of action results
-        :return:                Array of action objects
+        :param page_length:     How many actions the API returns for each page of action results
+        :return:                Array of action objects, or None if any page could not be retrieved
         """
-        logger = logging.getLogger('sp_logger')
-        actions_url = self.api_url + 'actions/search'
-        response = self.authenticated_request_post(
-            actions_url,
-            data=json.dumps({
-                "modified_at": {"from": str(date_modified)},
-                "offset": offset,
-                "status": [0, 10, 50, 60]
-            })
-        )
-        result = self.parse_json(response.content) if response.status_code == requests.codes.ok else None
-        self.log_http_status(response.status_code, 'GET actions')
-        if result is None or None in [result.get('count'), result.get('offset'), result.get('total'), result.get('actions')]:
+        actions = []
+        try:
+            for page in self.iter_audit_actions(date_modified, offset, page_length):
+                actions.extend(page['actions'])
+        except ActionsSearchError:
             return None
-        return self.get_page_of_actions(logger, date_modified, result, offset, page_length)
+        return actions
 
-    def get_page_of_actions(self, logger, date_modified, previous_page, offset=0, page_length=100):
+    def iter_audit_actions(self, date_modified, offset=0, page_length=100, concurrency=1):
+        """
+        Generator over the pages of actions modified after a specified date. Pages are requested as the caller
+        consumes them, so only a few pages of actions are held in memory.
+
+        The total reported by the first page is used to request the remaining pages on up to concurrency threads at
+        once, so the next page is already being fetched while the caller handles the current one. Pages are still
+        yielded in offset order.
+
+        :param date_modified:   ISO formatted date/time string. Only actions modified after this date are returned.
+        :param offset:          The index to start retrieving actions from
+        :param page_length:     How many actions the API returns for each page of action results
+        :param concurrency:     Maximum number of pages requested at the same time
+        :return:                actions/search responses, each containing 'offset', 'count', 'total' and 'actions'
+        :raises ActionsSearchError: if a page could not be retrieved
+        """
+        logger = logging.getLogger('sp_logger')
+        page = self.get_page_of_actions(date_modified, offset)
+        if page is None:
+            raise ActionsSearchError('Unable to retrieve actions at offset {0}'.format(offset))
+        yield page
+        offset = page['offset'] + page['count']
+        total = page['total']
+        if page['count'] == 0 or offset >= total:
+            return
+        logger.info('Paging Actions. Offset: ' + str(offset) + '. Total: ' + str(total))
+        for page in self.fetch_pages_of_actions(date_modified, offset, total, page_length, max(1, concurrency)):
+            yield page
+
+    def fetch_pages_of_actions(self, date_modified, offset, total, page_length, concurrency):
+        """
+        Request the pages of actions between offset and total, keeping up to concurrency requests in flight, and
+        yield them in offset order. A page that comes back shorter than page_length is followed by requests for the
+        actions it left out, so none are skipped.
+
+        :param date_modified:   ISO formatted date/time string. Only actions modified after this date are returned.
+        :param offset:          The index of the first action to retrieve
+        :param total:           total reported by the actions search
+        :param page_length:     How many actions the API returns for each page of action results
+        :param concurrency:     Maximum number of pages requested at the same time
+        :return:                actions/search responses
+        :raises ActionsSearchError: if a page could not be retrieved
+        """
+        offsets = iter(range(offset, total, page_length))
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            window = collections.deque()
+            for page_offset in offsets:
+                window.append((page_offset, executor.submit(self.get_page_of_actions, date_modified, page_offset)))
+                if len(window) >= concurrency:
+                    break
+            while window:
+                page_offset, future = window.popleft()
+                next_offset = next(offsets, None)
+                if next_offset is not None:
+                    window.append((next_offset, executor.submit(self.get_page_of_actions, date_modified,
+                                                                next_offset)))
+                page = future.result()
+                page_end = min(page_offset + page_length, total)
+                while True:
+                    if page is None:
+                        raise ActionsSearchError('Unable to retrieve actions at offset {0}'.format(page_offset))
+                    yield page
+                    page_offset = page['offset'] + page['count']
+                    if page['count'] == 0 or page_offset >= page_end:
+                        break
+                    page = self.get_page_of_actions(date_modified, page_offset)
+                    if page is not None:
+                        page['actions'] = page['actions'][:page_end - page_offset]
+                        page['count'] = len(page['actions'])
+
+    def get_page_of_actions(self, date_modified, offset=0):
         """
         Returns a page of action search results
 
-        :param logger: the logger
-        :param date_modified: fetch from that date onwards
-        :param previous_page: a page of action search results
-        :param offset: the index to start retrieving actions from
-        :param page_length: the number of actions to return on the search page (max 100)
-        :return: Array of action objects
-        """
-        if previous_page['count'] + previous_page['offset'] < previous_page['total']:
-            logger.info('Paging Actions. Offset: ' + str(offset + page_length) + '. Total: ' + str(previous_page['total']))
-            next_page = self.get_audit_actions(date_modified, offset + page_length)
-            if next_page is None:
-                return None
-            return next_page + previous_page['actions']
-        elif previous_page['count'] + previous_page['offset'] == previous_page['total']:
-            return previous_page['actions']
+        :param date_modified:   fetch actions modified after this ISO formatted date/time
+        :param offset:          the index to start retrieving actions from
+        :return:                actions/search response, or None if the request failed or the response is incomplete
+        """
+        actions_url = self.api_url + 'actions/search'
+        response = self.authenticated_request_post(actions_url, data=self.actions_search_data(date_modified, offset))
+        result = self.parse_json(response.content) if response.status_code == requests.codes.ok else None
+        self.log_http_status(response.status_code, 'GET actions')
+        return result if self.is_valid_actions_page(result) else None
 
     def get_audit(self, audit_id):
         """
@@ -436,6 +1077,26 @@ class SafetyCulture:
         self.log_http_status(response.status_code, log_message)
         return result
 
+    def download_audit(self, audit_id, destination, chunk_size=DOWNLOAD_CHUNK_SIZE):
+        """
+        Stream the JSON representation of a single specified audit into a file, without holding it in memory
+
+        :param audit_id:     audit_id of document to fetch
+        :param destination:  binary file object to write the audit JSON to
+        :param chunk_size:   number of bytes read from the response at a time
+        :return:             True if the audit was downloaded, else False
+        """
+        response = self.authenticated_request_get(self.audit_url + audit_id, stream=True)
+        try:
+            self.log_http_status(response.status_code, 'on GET for ' + audit_id)
+            if response.status_code != requests.codes.ok:
+                return False
+            for chunk in response.iter_content(chunk_size):
+                destination.write(chunk)
+            return True
+        finally:
+            response.close()
+
     def create_response_set(self, name, responses):
         """
         Create new response_set
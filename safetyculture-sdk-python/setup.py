@@ -1,7 +1,7 @@
 from setuptools import setup
 
 setup(name = 'safetyculture-sdk-python-beta',
-      version = '2.0',
+      version = '2.1',
       description = 'iAuditor Python SDK and integration tools',
       url = 'https://github.com/SafetyCulture/iauditor-exporter',
       author = 'SafetyCulture',
@@ -29,4 +29,8 @@ setup(name = 'safetyculture-sdk-python-beta',
             'xlrd>=1.1.0',
             'pyOpenSSL>=17.5.0',
       ],
+      extras_require = {
+            'async': ['aiohttp>=3.6.0'],
+            'fast': ['orjson>=3.0.0'],
+      },
       )